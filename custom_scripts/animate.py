@@ -2,12 +2,12 @@
 animates the trained policies in eureka_artifacts for both eureka and human baseline experiments
 """
 
-import os
-import glob
-from typing import Optional
+import argparse
+from typing import List, Optional
 
 from custom_utils import prepare_gen
-from custom_utils.video_generator import VideoGenerator
+from custom_utils.artifact_index import ArtifactIndex
+from custom_utils.video_generator import VideoGenerator, VideoJob
 from custom_utils.eureka_task_processor import EurekaTaskProcessor
 
 # Define results directory structure
@@ -16,52 +16,49 @@ from custom_utils.eureka_task_processor import EurekaTaskProcessor
 CHECKPOINTS_DIR = "eureka_artifacts"
 
 
-def generate_policy_video(processor: EurekaTaskProcessor, video_prefix: str, video_generator: VideoGenerator, iter_num: Optional[int] = None) -> None:
-    """Generate video for a specific policy iteration or eval run
-    
-    Args:
-        processor: The task processor instance
-        video_prefix: Base name for the video
-        video_generator: Video generator instance to use
-        iter_num: If provided, generates video for that iteration. If None, generates eval video.
-    """
-    video_generator.process_policy(processor, video_prefix, iter_num)
+def collect_jobs(processor: EurekaTaskProcessor, video_prefix: str, video_generator: VideoGenerator) -> List[VideoJob]:
+    """Render jobs of the best policy of every training iteration and of the best eval run"""
+    # Iterations only exist for Eureka runs, human baselines only have eval runs
+    iter_nums = list(range(processor.iteration)) if processor.suffix else []
+    jobs = [video_generator.make_job(processor, video_prefix, iter_num) for iter_num in iter_nums + [None]]
+    return [job for job in jobs if job is not None]
 
-def generate_iteration_videos(processor: EurekaTaskProcessor, video_prefix: str, video_generator: VideoGenerator) -> None:
-    """Generate videos for all training iterations"""
-    for iter_num in range(processor.iteration):
-        generate_policy_video(processor, video_prefix, video_generator, iter_num)
-
-def generate_eval_video(processor: EurekaTaskProcessor, video_prefix: str, video_generator: VideoGenerator) -> None:
-    """Generate video for best evaluation run"""
-    generate_policy_video(processor, video_prefix, video_generator, None)
-
-def generate_videos(task_folder: str):
-    """Generate videos for best policies of each iteration"""
+def collect_task_jobs(task_folder: str, video_generator: VideoGenerator, index: Optional[ArtifactIndex] = None) -> List[VideoJob]:
     try:
-        print(f"Generating videos for task folder: {task_folder}")
-        processor, video_prefix = prepare_gen(task_folder)
-        
-        # Create a single video generator instance to be used throughout
-        video_generator = VideoGenerator()
-        
-        if processor.suffix:
-            # Generate videos for training iterations
-            generate_iteration_videos(processor, video_prefix, video_generator)
-        
-        # Generate video for best eval run
-        generate_eval_video(processor, video_prefix, video_generator)
-                    
+        print(f"Collecting policies to animate in task folder: {task_folder}")
+        processor, video_prefix = prepare_gen(task_folder, index)
+        return collect_jobs(processor, video_prefix, video_generator)
     except Exception as e:
-        print(f"Error generating videos for {task_folder}: {e}")
+        print(f"Error collecting policies of {task_folder}: {e}")
+        return []
+
+def generate_videos(task_folder: str, video_generator: Optional[VideoGenerator] = None, index: Optional[ArtifactIndex] = None):
+    """Generate videos for best policies of each iteration"""
+    video_generator = video_generator or VideoGenerator()
+    video_generator.render_batch(collect_task_jobs(task_folder, video_generator, index))
 
 
 def main():
-    # Process both eureka and human baseline folders
-    for exp_type in ['eureka', 'human_baseline']:
-        task_folders = glob.glob(os.path.join(CHECKPOINTS_DIR, exp_type, "*/"))
-        for task_folder in task_folders:
-            generate_videos(task_folder)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--gpus', default='0', help='comma separated GPUs to render on')
+    parser.add_argument('--jobs-per-gpu', type=int, default=1, help='concurrent render jobs per GPU')
+    parser.add_argument('--in-process', action='store_true',
+                        help='roll out the checkpoints in this process instead of one train.py per checkpoint')
+    args = parser.parse_args()
+
+    video_generator = VideoGenerator(gpus=[int(gpu) for gpu in args.gpus.split(',')],
+                                     jobs_per_gpu=args.jobs_per_gpu, in_process=args.in_process)
+    # Parse the policies of all folders once (in parallel, cached across runs) to pick the best ones
+    index = ArtifactIndex(CHECKPOINTS_DIR)
+    task_folders = index.task_folders('eureka') + index.task_folders('human_baseline')
+    index.scan(task_folders)
+    # Jobs of both eureka and human baseline folders, rendered as one batch
+    jobs = [job for task_folder in task_folders for job in collect_task_jobs(task_folder, video_generator, index)]
+    print(f"Rendering {len(jobs)} videos")
+    results = video_generator.render_batch(jobs)
+    failed = [dest for dest, video in results.items() if video is None]
+    if failed:
+        print(f"Warning: No video produced for {failed}")
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,8 @@
 import os
-import glob
 import matplotlib.pyplot as plt
 
-from .eureka_task_processor import EurekaTaskProcessor
+from custom_utils.artifact_index import ArtifactIndex
+from custom_utils.eureka_task_processor import EurekaTaskProcessor
 
 # Define results directory structure
 # CHECKPOINTS_DIR = "custom_checkpoints"
@@ -18,14 +18,14 @@ def ensure_results_dirs():
         os.makedirs(d, exist_ok=True)
 
 
-def generate_train_eval_plots(task_folder: str):
+def generate_train_eval_plots(task_folder: str, index: ArtifactIndex = None):
     """
     Generate plots for each task.
     Shows max consecutive success over iterations in left panel.
     Shows consecutive successes vs step for best evaluation run in right panel.
     """
     try:
-        processor = EurekaTaskProcessor(task_folder)
+        processor = EurekaTaskProcessor(task_folder, index)
         print(f"Generating plots for task folder: {task_folder}")
         
         # Plot training progress (max consecutive successes per iteration)
@@ -79,7 +79,7 @@ def generate_train_eval_plots(task_folder: str):
         print(f"Error generating plots for {task_folder}: {e}")
 
 
-def generate_comparison_plots():
+def generate_comparison_plots(index: ArtifactIndex):
     """
     Generate comparison plots between Eureka runs (default and 3000 epochs) and human baselines.
     For each task, creates two side-by-side plots:
@@ -87,14 +87,16 @@ def generate_comparison_plots():
     2. Training progress plot with iteration data
     """
     # Get all task folders
-    eureka_folders = glob.glob(os.path.join(CHECKPOINTS_DIR, "eureka/*/"))
-    human_folders = glob.glob(os.path.join(CHECKPOINTS_DIR, "human_baseline/*/"))
+    eureka_folders = index.task_folders("eureka")
+    human_folders = index.task_folders("human_baseline")
+    # Policies are parsed once here (in parallel, cached across runs), the plots below are served from the index
+    index.scan(eureka_folders + human_folders)
     
     # Group folders by task name
     task_runs = {}
     for folder in eureka_folders + human_folders:
         try:
-            processor = EurekaTaskProcessor(folder)
+            processor = EurekaTaskProcessor(folder, index)
             task_name = processor.task_name
             if task_name not in task_runs:
                 task_runs[task_name] = {
@@ -197,16 +199,15 @@ def generate_comparison_plots():
 def main():
     """Main function to generate all plots"""
     ensure_results_dirs()
+    index = ArtifactIndex(CHECKPOINTS_DIR)
 
-
-    
     # Generate individual training plots
-    # task_folders = glob.glob(os.path.join(CHECKPOINTS_DIR, "eureka/*/"))
+    # task_folders = index.task_folders("eureka")
     # for task_folder in task_folders:
-    #     generate_train_eval_plots(task_folder)
+    #     generate_train_eval_plots(task_folder, index)
     
     # Generate comparison plots
-    generate_comparison_plots()
+    generate_comparison_plots(index)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,14 @@
+import argparse
 import os
 import numpy as np
 import re
 from pathlib import Path
 
+from eureka.utils.results_db import ResultsDB
+from custom_utils.artifact_index import ArtifactIndex
+
 artifacts_dir = Path("eureka_artifacts")
+default_db = Path("eureka/results.db")
 
 def extract_max_training_success(log_file):
     try:
@@ -17,6 +22,9 @@ def extract_max_training_success(log_file):
         print(f"Warning: Could not read log file {log_file}: {e}")
     return None
 
+def result_files(folder_path):
+    return [os.path.join(folder_path, 'final_eval.npz'), os.path.join(folder_path, 'eureka.log')]
+
 def analyze_folder(folder_path):
     results = {}
     
@@ -44,10 +52,35 @@ def analyze_folder(folder_path):
     
     return results
 
+def print_db_results(db_path, task=None):
+    # Runs recorded by eureka.py (see `results_db` in eureka/cfg/config.yaml), no log parsing needed
+    db = ResultsDB(str(db_path))
+    for row in db.run_summaries(task):
+        print(f"\nRun {row['run']}: {row['task']}{row['suffix']} ({row['workspace']})")
+        if row['max_training_success'] is not None:
+            print(f"Max Training Success: {row['max_training_success']:.2f}")
+        if row['num_eval']:
+            print(f"Final Success: {row['final_success_mean']:.2f} ± {row['final_success_std']:.2f} ({row['num_eval']} seeds)")
+        if row['final_correlation_mean'] is not None:
+            print(f"Final Correlation Mean: {row['final_correlation_mean']:.2f}")
+    db.close()
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', type=Path, default=default_db, help='results database written by eureka.py')
+    parser.add_argument('--task', default=None, help='only show runs of this task (database only)')
+    parser.add_argument('--files', action='store_true', help=f'scan the run folders in {artifacts_dir} instead of the database')
+    args = parser.parse_args()
+
+    if not args.files and args.db.exists():
+        print_db_results(args.db, args.task)
+        return
+
     if not artifacts_dir.exists():
         print(f"Error: {artifacts_dir} does not exist")
         return
+    # Folders are analyzed in parallel and cached until their final_eval.npz or eureka.log change
+    index = ArtifactIndex(str(artifacts_dir))
 
     # Process both eureka and human_baseline folders
     for exp_type in ['eureka', 'human_baseline']:
@@ -58,11 +91,10 @@ def main():
         print(f"\n=== {exp_type.upper()} RESULTS ===")
         
         # Process each timestamp folder
-        for timestamp_dir in sorted(exp_dir.iterdir()):
-            if not timestamp_dir.is_dir():
-                continue
-                
-            results = analyze_folder(timestamp_dir)
+        timestamp_dirs = [d for d in sorted(exp_dir.iterdir()) if d.is_dir()]
+        folder_results = index.map('folder_results', [str(d) for d in timestamp_dirs], analyze_folder, result_files)
+        for timestamp_dir in timestamp_dirs:
+            results = folder_results[str(timestamp_dir)]
             
             if not results:  # Skip if no results found
                 continue
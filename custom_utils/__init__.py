@@ -1,10 +1,11 @@
-from typing import Tuple
+from typing import Optional, Tuple
 
+from custom_utils.artifact_index import ArtifactIndex
 from custom_utils.eureka_task_processor import EurekaTaskProcessor
 
 
-def prepare_gen(task_folder: str) -> Tuple[EurekaTaskProcessor, str]:
-    processor = EurekaTaskProcessor(task_folder)
+def prepare_gen(task_folder: str, index: Optional[ArtifactIndex] = None) -> Tuple[EurekaTaskProcessor, str]:
+    processor = EurekaTaskProcessor(task_folder, index)
     video_prefix = f"{processor.task_name}{processor.suffix}"
     # suffix implies GPT/Eureka, no suffix is human baseline
     if processor.suffix:
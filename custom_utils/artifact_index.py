@@ -0,0 +1,171 @@
+"""
+Shared, cached scan of the run folders in eureka_artifacts for the analysis scripts
+"""
+
+import glob
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+ARTIFACTS_DIR = "eureka_artifacts"
+# Next to the artifact folders rather than inside them, eureka_artifacts is a git submodule
+CACHE_DIR = ".analysis_cache"
+CACHE_VERSION = 1
+
+
+def file_fingerprint(paths: Iterable[str]) -> tuple:
+    """(path, mtime, size) of the files that exist, changes whenever one of them is rewritten"""
+    fingerprint = []
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+def policy_files(policy_folder: str) -> List[str]:
+    """Files a policy record is parsed from: its tensorboard event files and checkpoints"""
+    runs = os.path.join(policy_folder, "runs", "*")
+    return glob.glob(os.path.join(runs, "summaries", "events.out.tfevents*")) + glob.glob(os.path.join(runs, "nn", "*.pth"))
+
+
+def load_policy(policy_folder: str) -> Optional[Dict]:
+    """
+    Parse one policy folder, runs in the worker processes of `ArtifactIndex.map`
+
+    Returns:
+        dict with the run identifier, max consecutive successes (None without that tag) and the
+        logs as {tag: {"values": [...], "steps": [...]}}, or None if the folder has no run
+    """
+    # Imported here, eureka_task_processor imports this module
+    from .eureka_task_processor import load_tensorboard_logs_with_steps
+
+    summary_path = os.path.join(policy_folder, "runs")
+    try:
+        # Get first subfolder in runs (the identifier)
+        identifier = next(os.walk(summary_path))[1][0]
+    except (StopIteration, IndexError):
+        print(f"Warning: No run identifier found in {summary_path}")
+        return None
+    summary_path = os.path.join(summary_path, identifier, "summaries")
+    try:
+        logs, steps = load_tensorboard_logs_with_steps(summary_path)
+    except Exception as e:
+        print(f"Warning: Error loading tensorboard logs from {summary_path}: {e}")
+        return None
+    successes = logs.get("consecutive_successes")
+    return {
+        "identifier": identifier,
+        "max_success": max(successes) if successes else None,
+        "logs": {key: {"values": list(values), "steps": list(steps[key])} for key, values in logs.items()},
+    }
+
+
+def default_cache_path(root: str) -> str:
+    root = os.path.abspath(root)
+    cache_dir = os.path.join(os.path.dirname(root), CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, f"{os.path.basename(root)}.pkl")
+
+
+class ArtifactIndex:
+    """
+    Parses the artifact folders once and serves the results to all the analysis scripts.
+
+    Every parsed result is cached in `cache_path`, keyed by what was parsed and the mtime and size
+    of the files it was parsed from, so a later scan only re-parses folders whose files changed.
+    Stale entries are parsed in parallel by a process pool.
+
+    Args:
+        root: Artifacts folder, holding the eureka/ and human_baseline/ run folders
+        cache_path: Pickle file of the cache (defaults to .analysis_cache/<root name>.pkl next to root)
+        workers: Processes parsing stale entries (defaults to the number of CPUs, 1 parses in-process)
+    """
+    def __init__(self, root: str = ARTIFACTS_DIR, cache_path: Optional[str] = None, workers: Optional[int] = None):
+        self.root = root
+        self.cache_path = cache_path or default_cache_path(root)
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = {}  # (kind, key) -> (fingerprint, value)
+        self.hits = 0
+        self.misses = 0
+        self._policy_folders = {}  # task folder -> sorted policy folders
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.cache = data["entries"]
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError):
+            # Corrupt or outdated cache, rebuild from scratch
+            self.cache = {}
+
+    def save(self):
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({"version": CACHE_VERSION, "entries": self.cache}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Warning: Could not save analysis cache {self.cache_path}: {e}")
+
+    def task_folders(self, exp_type: str) -> List[str]:
+        """Run folders of an experiment type, e.g. "eureka" or "human_baseline" """
+        return sorted(glob.glob(os.path.join(self.root, exp_type, "*/")))
+
+    def map(self, kind: str, keys: Iterable[str], fn: Callable, files_of: Callable[[str], Iterable[str]]) -> Dict:
+        """
+        `fn(key)` for every key, reusing cached results whose files did not change
+
+        Args:
+            kind: Namespace of the cached results, e.g. "policy"
+            keys: Arguments of `fn`, typically folders
+            fn: Picklable (module-level) function parsing a key
+            files_of: Files the result of a key depends on
+
+        Returns:
+            dict: key -> result
+        """
+        results, stale = {}, {}
+        for key in keys:
+            fingerprint = file_fingerprint(files_of(key))
+            cached = self.cache.get((kind, key))
+            if cached is not None and cached[0] == fingerprint:
+                results[key] = cached[1]
+                self.hits += 1
+            else:
+                stale[key] = fingerprint
+        if not stale:
+            return results
+        self.misses += len(stale)
+        if self.workers > 1 and len(stale) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(stale))) as pool:
+                values = list(pool.map(fn, stale, chunksize=max(len(stale) // (4 * self.workers), 1)))
+        else:
+            values = [fn(key) for key in stale]
+        for (key, fingerprint), value in zip(stale.items(), values):
+            self.cache[(kind, key)] = (fingerprint, value)
+            results[key] = value
+        self.save()
+        return results
+
+    def policy_folders(self, task_folder: str) -> List[str]:
+        """Policy folders of a run folder, sorted chronologically"""
+        if task_folder not in self._policy_folders:
+            self._policy_folders[task_folder] = sorted(glob.glob(os.path.join(task_folder, "policy-*/")))
+        return self._policy_folders[task_folder]
+
+    def scan(self, task_folders: Iterable[str]):
+        """Parse the policies of several run folders at once, so that they share the process pool"""
+        self.map("policy", [folder for task_folder in task_folders for folder in self.policy_folders(task_folder)],
+                 load_policy, policy_files)
+
+    def policies(self, policy_folders: List[str]) -> Dict[str, Optional[Dict]]:
+        """policy folder -> record of `load_policy`"""
+        return self.map("policy", policy_folders, load_policy, policy_files)
@@ -5,7 +5,8 @@ import glob
 from typing import Dict, List, Tuple, Optional
 from collections import defaultdict
 
-from tensorboard.backend.event_processing.event_accumulator import EventAccumulator
+from eureka.utils.tb_reader import ScalarIndex
+from .artifact_index import ArtifactIndex, load_policy
 
 
 def get_task_name_from_path(task_folder: str) -> str:
@@ -14,24 +15,17 @@ def get_task_name_from_path(task_folder: str) -> str:
 
 
 def load_tensorboard_logs_with_steps(path):
-    """Load tensorboard logs with both values and step numbers"""
-    data = defaultdict(list)
-    steps = defaultdict(list)
-    event_acc = EventAccumulator(path)
-    event_acc.Reload()  # Load all data written so far
-
-    for tag in event_acc.Tags()["scalars"]:
-        events = event_acc.Scalars(tag)
-        for event in events:
-            data[tag].append(event.value)
-            steps[tag].append(event.step)
-    
-    return data, steps
+    """Load tensorboard logs with both values and step numbers (see ScalarIndex)"""
+    # Not persisted: the logs live in the eureka_artifacts submodule, ArtifactIndex caches the results instead
+    index = ScalarIndex(path, persist=False)
+    index.update()
+    return defaultdict(list, index.values_dict()), defaultdict(list, index.steps_dict())
 
 
 class EurekaTaskProcessor:
-    def __init__(self, task_folder: str):
+    def __init__(self, task_folder: str, index: Optional[ArtifactIndex] = None):
         self.task_folder = task_folder
+        self.index = index
         try:
             self.config = self._load_config()
             self.iteration = self.config['iteration']
@@ -79,7 +73,10 @@ class EurekaTaskProcessor:
 
         try:
             # Get all policy folders and sort them chronologically
-            policy_folders = sorted(glob.glob(os.path.join(self.task_folder, f"policy-*/")))
+            if self.index is not None:
+                policy_folders = self.index.policy_folders(self.task_folder)
+            else:
+                policy_folders = sorted(glob.glob(os.path.join(self.task_folder, f"policy-*/")))
             
             if not policy_folders:
                 print(f"Warning: No policy folders found in {self.task_folder}")
@@ -103,41 +100,22 @@ class EurekaTaskProcessor:
                 if not relevant_folders:
                     print("Warning: No evaluation policy folders found")
                 
+            # Parsed once per policy folder and cached when an ArtifactIndex is shared between processors
+            if self.index is not None:
+                records = self.index.policies(relevant_folders)
+            else:
+                records = {policy_folder: load_policy(policy_folder) for policy_folder in relevant_folders}
+
             iter_policies = []
             for policy_folder in relevant_folders:
-                try:
-                    summary_path = os.path.join(policy_folder, "runs")
-
-                    try:
-                        # Get first subfolder in runs (the identifier)
-                        identifier = next(os.walk(summary_path))[1][0]
-                    except (StopIteration, IndexError):
-                        print(f"Warning: No run identifier found in {summary_path}")
-                        continue
-                        
-                    summary_path = os.path.join(summary_path, identifier, "summaries")
-                    
-                    # Load tensorboard logs
-                    try:
-                        logs, steps = load_tensorboard_logs_with_steps(summary_path)
-                        if "consecutive_successes" not in logs:
-                            print(f"Warning: No consecutive_successes found in {summary_path}")
-                            continue
-                            
-                        max_consecutive_successes = max(logs["consecutive_successes"])
-                        # Include both values and steps in the logs dictionary
-                        combined_logs = {
-                            key: {"values": values, "steps": steps[key]} 
-                            for key, values in logs.items()
-                        }
-                        iter_policies.append((max_consecutive_successes, policy_folder, combined_logs))
-                    except Exception as e:
-                        print(f"Warning: Error loading tensorboard logs from {summary_path}: {e}")
-                        continue
-                        
-                except Exception as e:
-                    print(f"Warning: Error processing policy folder {policy_folder}: {e}")
+                record = records[policy_folder]
+                if record is None:
+                    continue
+                if record["max_success"] is None:
+                    print(f"Warning: No consecutive_successes found in {policy_folder}")
                     continue
+                # Logs hold both values and steps per tag
+                iter_policies.append((record["max_success"], policy_folder, record["logs"]))
             
             if not iter_policies:
                 phase = "evaluation" if iter_num is None else f"iteration {iter_num}"
@@ -4,7 +4,11 @@ import shutil
 import subprocess
 import time
 
-from typing import Optional, Tuple
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from eureka.utils.gpu_monitor import device_env
 
 from .eureka_task_processor import EurekaTaskProcessor
 from .artifact_manager import ArtifactManager
@@ -13,11 +17,34 @@ from .policy_processor import PolicyProcessor
 VIDEOS_DIR = os.path.join("eureka_artifacts", "videos")
 
 
+@dataclass
+class VideoJob:
+    """One checkpoint to render, `video_dest` is known before rendering starts"""
+    task_name: str
+    checkpoint: str
+    results_name: str
+    iter_num: Optional[int]
+    video_dest: str
+    run_dir: str
+
+
 class VideoGenerator(ArtifactManager):
+    """
+    Renders policy checkpoints to videos.
+
+    Every render job runs `train.py test=True capture_video=True` with its own Hydra run directory
+    (`<output_dir>/renders/<video name>`), so the video of a job is found in that directory instead of
+    guessing the newest folder under outputs/train. `render_batch` runs several jobs at once, at most
+    `jobs_per_gpu` per GPU of `gpus`. Frames are captured from a virtual display, no screen is needed.
+
+    With `in_process=True` the checkpoints are instead rolled out in the calling process
+    (`isaacgymenvs.utils.policy_render`), creating the environment of each task once.
+    """
     def __init__(self, output_dir: Optional[str] = None, num_envs: Optional[int] = None,
                  virtual_screen_capture: bool = True, force_render: bool = False,
                  capture_video_freq: Optional[int] = None, capture_video_len: Optional[int] = None,
-                 save_task_folder: bool = False):
+                 save_task_folder: bool = False, gpus: Sequence[int] = (0,), jobs_per_gpu: int = 1,
+                 in_process: bool = False, poll_interval: float = 1.0):
         super().__init__(output_dir or VIDEOS_DIR, save_metadata=save_task_folder)
         self.num_envs = num_envs
         self.virtual_screen_capture = virtual_screen_capture
@@ -25,32 +52,43 @@ class VideoGenerator(ArtifactManager):
         self.capture_video_freq = capture_video_freq
         self.capture_video_len = capture_video_len
         self.save_task_folder = save_task_folder
+        self.gpus = list(gpus)
+        self.jobs_per_gpu = jobs_per_gpu
+        self.in_process = in_process
+        self.poll_interval = poll_interval
 
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def get_latest_video_folder(self) -> Optional[str]:
-        """Get the most recent video output folder from isaacgym"""
-        output_dir = "outputs/train"
-        folders = glob.glob(f"{output_dir}/*/")
-        if not folders:
-            print("Warning: No output folders found in outputs/train/")
-            return None
-        latest = max(folders, key=os.path.getctime)
-        print(f"Found latest output folder: {latest}")
-        return latest
-
     def get_video_path(self, results_name: str, iter_num: Optional[int] = None) -> str:
         """Get the path where a video should be saved"""
         return self.get_artifact_path(results_name, iter_num, '.mp4')
 
-    def animate_policy(self, task_name: str, checkpoint_path: str):
-        """Animate a policy using isaacgym"""
+    def get_run_dir(self, video_dest: str) -> str:
+        """Hydra run directory of the job rendering `video_dest`"""
+        name = os.path.splitext(os.path.basename(video_dest))[0]
+        return os.path.join(self.output_dir, "renders", name)
+
+    def make_job(self, processor: EurekaTaskProcessor, video_prefix: str,
+                 iter_num: Optional[int] = None) -> Optional[VideoJob]:
+        """Render job of the best policy of an iteration (or of the eval runs), None if there is nothing to render"""
+        video_dest = self.get_video_path(video_prefix, iter_num)
+        checkpoint, stage, should_skip = PolicyProcessor.get_best_policy_checkpoint(
+            processor, video_prefix, iter_num, video_dest)
+        if should_skip or not checkpoint:
+            return None
+        return VideoJob(f"{processor.task_name}{processor.suffix}", checkpoint, video_prefix, iter_num,
+                        video_dest, self.get_run_dir(video_dest))
+
+    def get_command(self, job: VideoJob, graphics_device_id: int = 0) -> List[str]:
         cmd = [
             "python", "isaacgymenvs/isaacgymenvs/train.py",
             "test=True", "headless=False",
-            f"task={task_name}",
-            f"checkpoint={checkpoint_path}",
-            "capture_video=True"
+            f"task={job.task_name}",
+            f"checkpoint={os.path.abspath(job.checkpoint)}",
+            "capture_video=True",
+            f"hydra.run.dir={os.path.abspath(job.run_dir)}",
+            # The job only sees its own GPU as cuda:0, rendering goes through Vulkan which sees all of them
+            "sim_device=cuda:0", "rl_device=cuda:0", f"graphics_device_id={graphics_device_id}",
         ]
         if self.num_envs:
             cmd.append(f"num_envs={self.num_envs}")
@@ -62,61 +100,99 @@ class VideoGenerator(ArtifactManager):
             cmd.append(f"capture_video_freq={self.capture_video_freq}")
         if self.capture_video_len:
             cmd.append(f"capture_video_len={self.capture_video_len}")
-
-        process = subprocess.Popen(cmd)
-        process.wait()
-
-    def save_video(self, results_name: str, iter_num: Optional[int] = None):
-        """Save generated video to results folder"""
-        latest_folder = self.get_latest_video_folder()
-        if not latest_folder:
-            return
-
-        # Videos are in outputs/train/DATETIME/videos/TASKNAME_DATETIME2/rl-video-step-0.mp4
-        videos_base = os.path.join(latest_folder, "videos")
-        print(f"Looking for videos in: {videos_base}")
-
-        if not os.path.exists(videos_base):
-            print(f"Warning: Videos directory not found at {videos_base}")
-            return
-
-        # Get the most recent task video folder
-        task_video_folders = glob.glob(os.path.join(videos_base, "*/"))
-        if not task_video_folders:
-            print(f"Warning: No task video folders found in {videos_base}")
-            return
-
-        latest_task_folder = max(task_video_folders, key=os.path.getctime)
-        print(f"Found task video folder: {latest_task_folder}")
-
-        # Look for mp4 files in this folder
-        video_files = glob.glob(os.path.join(latest_task_folder, "*.mp4"))
-        if not video_files:
-            print(f"Warning: No mp4 files found in {latest_task_folder}")
-            return
-
-        video_dest = self.get_video_path(results_name, iter_num)
-        print(f"Copying video from {video_files[0]} to {video_dest}")
-        shutil.copy(video_files[0], video_dest)
+        return cmd
+
+    def start_job(self, job: VideoJob, gpu: int) -> subprocess.Popen:
+        # A leftover video of an earlier attempt must not be mistaken for this job's
+        shutil.rmtree(job.run_dir, ignore_errors=True)
+        os.makedirs(job.run_dir)
+        with open(os.path.join(job.run_dir, "render.log"), 'w') as log:
+            return subprocess.Popen(self.get_command(job, gpu), stdout=log, stderr=subprocess.STDOUT,
+                                    env=device_env(gpu))
+
+    def find_video(self, run_dir: str) -> Optional[str]:
+        """Video written by the job of `run_dir`: videos/<run name>/rl-video-step-0.mp4"""
+        video_files = sorted(glob.glob(os.path.join(run_dir, "videos", "*", "*.mp4")))
+        return video_files[0] if video_files else None
+
+    def save_video(self, job: VideoJob) -> Optional[str]:
+        """Copy the video of a finished job to its destination"""
+        video_file = self.find_video(job.run_dir)
+        if video_file is None:
+            print(f"Warning: No mp4 files found in {job.run_dir}, see {os.path.join(job.run_dir, 'render.log')}")
+            return None
+        print(f"Copying video from {video_file} to {job.video_dest}")
+        shutil.copy(video_file, job.video_dest)
 
         # Save metadata about source
         source_info = {
-            "Task video folder": latest_task_folder,
-            "Original video": video_files[0]
+            "Task video folder": os.path.dirname(video_file),
+            "Original video": video_file,
+            "Checkpoint": job.checkpoint,
         }
-        self.save_source_metadata(video_dest, source_info)
+        self.save_source_metadata(job.video_dest, source_info)
+        return job.video_dest
+
+    def render_batch(self, jobs: List[VideoJob]) -> Dict[str, Optional[str]]:
+        """
+        Render jobs concurrently, at most `jobs_per_gpu` at a time on each GPU
+
+        Returns:
+            dict: video_dest of each job -> saved video, None if the job produced none
+        """
+        if self.in_process:
+            return self.render_in_process(jobs)
+        results = {}
+        queued = deque(jobs)
+        free_slots = [gpu for gpu in self.gpus for _ in range(self.jobs_per_gpu)]
+        running: List[Tuple[subprocess.Popen, VideoJob, int]] = []
+        while queued or running:
+            while queued and free_slots:
+                job, gpu = queued.popleft(), free_slots.pop(0)
+                stage = f"iteration {job.iter_num}" if job.iter_num is not None else "evaluation"
+                print(f"Animating {job.results_name} {stage} on GPU {gpu}")
+                running.append((self.start_job(job, gpu), job, gpu))
+            for entry in list(running):
+                process, job, gpu = entry
+                if process.poll() is None:
+                    continue
+                running.remove(entry)
+                free_slots.append(gpu)
+                if process.returncode != 0:
+                    print(f"Warning: Rendering {job.video_dest} exited with {process.returncode}")
+                results[job.video_dest] = self.save_video(job)
+            if running:
+                time.sleep(self.poll_interval)
+        return results
+
+    def render_in_process(self, jobs: List[VideoJob]) -> Dict[str, Optional[str]]:
+        """Render jobs in this process, one environment per task, on the first GPU of `gpus`"""
+        # Isaac Gym must be imported before torch, so only when this mode is used
+        from isaacgymenvs.utils.policy_render import PolicyRenderer
+
+        overrides = [f"num_envs={self.num_envs}"] if self.num_envs else []
+        gpu = self.gpus[0]
+        results = {}
+        for task_name in dict.fromkeys(job.task_name for job in jobs):
+            renderer = PolicyRenderer(task_name, overrides, graphics_device_id=gpu,
+                                      sim_device=f"cuda:{gpu}", rl_device=f"cuda:{gpu}")
+            try:
+                for job in jobs:
+                    if job.task_name != task_name:
+                        continue
+                    print(f"Animating {job.results_name} in process from {job.checkpoint}")
+                    rendered = renderer.render(job.checkpoint, job.video_dest, self.capture_video_len)
+                    results[job.video_dest] = job.video_dest if rendered else None
+                    if rendered:
+                        self.save_source_metadata(job.video_dest, {"Checkpoint": job.checkpoint})
+                    else:
+                        print(f"Warning: No frames captured for {job.video_dest}")
+            finally:
+                renderer.close()
+        return results
 
     def process_policy(self, processor: EurekaTaskProcessor, video_prefix: str, iter_num: Optional[int] = None) -> None:
         """Process a policy by generating and saving its video"""
-        video_dest = self.get_video_path(video_prefix, iter_num)
-        checkpoint, stage, should_skip = PolicyProcessor.get_best_policy_checkpoint(
-            processor, video_prefix, iter_num, video_dest)
-
-        if should_skip or not checkpoint:
-            return
-
-        print(f"Animating {stage}")
-        self.animate_policy(processor.task_name, checkpoint)
-        self.save_video(video_prefix, iter_num)
-        if iter_num is not None:
-            time.sleep(1)  # Small delay between animations for iterations only
+        job = self.make_job(processor, video_prefix, iter_num)
+        if job is not None:
+            self.render_batch([job])
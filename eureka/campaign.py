@@ -0,0 +1,79 @@
+import hydra
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from utils.campaign import AUTHKEY_ENV, SlotBroker, summarize_task, write_results_table
+from utils.gpu_monitor import GPUMonitor, make_backend
+
+EUREKA_ROOT_DIR = os.getcwd()
+
+
+@hydra.main(config_path="cfg", config_name="campaign", version_base="1.1")
+def main(cfg):
+    """
+    Run Eureka on several tasks at once, sharing the GPUs between them.
+
+    Every task gets its own eureka.py process and workspace (`<campaign dir>/<task>`), all of them
+    place their training jobs through one `SlotBroker`, which grants GPU slots by fair share.
+    """
+    workspace_dir = Path.cwd()
+    logging.info(f"Campaign workspace: {workspace_dir}")
+    tasks = list(cfg.tasks)
+    logging.info(f"Campaign tasks: {tasks}")
+
+    # Short path, unix socket addresses are limited to ~100 characters
+    socket_dir = tempfile.mkdtemp(prefix='eureka_campaign_')
+    address = os.path.join(socket_dir, 'broker.sock')
+    authkey = os.urandom(16)
+    gpus = [int(gpu) for gpu in str(cfg.gpus).split(',')] if cfg.gpus != '' else None
+    broker = SlotBroker(address, authkey, gpus=gpus, runs_per_gpu=cfg.runs_per_gpu, min_vram=cfg.min_vram,
+                        priorities=dict(cfg.priorities), gpu_monitor=GPUMonitor(make_backend(cfg.fake_gpus)))
+    broker.start()
+
+    env = dict(os.environ, **{AUTHKEY_ENV: authkey.hex()})
+    queued = list(tasks)
+    running = {}  # task -> (process, start time)
+    returncodes = {}
+    wall_times = {}
+    max_concurrent = cfg.max_concurrent_tasks or len(tasks)
+    try:
+        while queued or running:
+            while queued and len(running) < max_concurrent:
+                task = queued.pop(0)
+                cmd = ['python', '-u', f'{EUREKA_ROOT_DIR}/eureka.py', f'env={task}',
+                       f'hydra.run.dir={workspace_dir / task}', f'campaign_address={address}', f'campaign_task={task}',
+                       f'min_vram={cfg.min_vram}', f'fake_gpus={cfg.fake_gpus}'] + list(cfg.eureka_overrides)
+                with open(f"{task}.log", 'w') as f:
+                    # eureka.py resolves its prompts and task files from the directory it is started in
+                    running[task] = (subprocess.Popen(cmd, stdout=f, stderr=f, env=env, cwd=EUREKA_ROOT_DIR), time.time())
+                logging.info(f"Campaign: started {task} ({len(queued)} tasks queued)")
+            for task, (process, start) in list(running.items()):
+                if process.poll() is not None:
+                    del running[task]
+                    returncodes[task] = process.returncode
+                    wall_times[task] = time.time() - start
+                    logging.info(f"Campaign: {task} finished with exit code {process.returncode} after {wall_times[task] / 60:.1f} min")
+            time.sleep(cfg.poll_interval)
+    finally:
+        for process, _ in running.values():
+            process.terminate()
+        broker.close()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+    rows = []
+    for task in tasks:
+        row = summarize_task(task, str(workspace_dir / task), returncodes.get(task))
+        row['wall_time_min'] = wall_times.get(task, float('nan')) / 60
+        row['gpu_hours'] = broker.gpu_seconds.get(task, 0.) / 3600
+        rows.append(row)
+    table = write_results_table(rows, 'campaign_results.csv', 'campaign_results.md')
+    logging.info(f"Campaign results:\n{table}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,23 @@
-import subprocess
-import time
+from utils.gpu_monitor import default_monitor
+
+def get_free_vram():
+    """
+    Query the free VRAM of every visible GPU (see `utils/gpu_monitor.py`).
+
+    Returns:
+        dict: GPU index -> free VRAM in GB, minus the VRAM reserved for runs that are still starting
+    """
+    return default_monitor().free_vram()
 
 def wait_for_free_vram(required_gb=8, check_interval=60):
     """
     Block until there's at least required_gb of VRAM free on any GPU.
-    
+
     Args:
         required_gb (float): Required free VRAM in GB
         check_interval (int): How often to check in seconds
-        
+
     Returns:
         int: GPU index with sufficient free memory
     """
-    while True:
-        try:
-            # Query nvidia-smi for memory info
-            result = subprocess.check_output(
-                ['nvidia-smi', '--query-gpu=index,memory.free', '--format=csv,nounits,noheader'],
-                encoding='utf-8'
-            )
-            
-            # Parse the output
-            for line in result.strip().split('\n'):
-                gpu_id, free_memory = map(int, line.split(','))
-                free_gb = free_memory / 1024.0  # Convert MB to GB
-                
-                if free_gb >= required_gb:
-                    return gpu_id
-                    
-        except subprocess.CalledProcessError:
-            print("Error querying nvidia-smi, will retry...")
-            
-        time.sleep(check_interval)
+    return default_monitor().wait_for_free_vram(required_gb, check_interval)
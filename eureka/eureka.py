@@ -1,3 +1,4 @@
+import glob
 import hydra
 import numpy as np 
 import json
@@ -5,35 +6,82 @@ import logging
 import matplotlib.pyplot as plt
 import os
 import openai
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
 import re
-import subprocess
 from pathlib import Path
 import shutil
-import time 
 
 from utils.misc import * 
-from utils.file_utils import find_files_with_substring, load_tensorboard_logs
+from utils.file_utils import find_files_with_substring
 from utils.create_task import create_task
 from utils.extract_task_code import *
-
-from custom_utils import wait_for_free_vram
+from utils.scheduler import TrainingJob, TrainingScheduler
+from utils.log_tailer import TRAINING, ERROR, FINISHED
+from utils.llm_sampler import AsyncSampler, MockChatClient
+from utils.result_cache import RewardResultCache, reward_cache_key
+from utils.early_stopping import MedianStoppingMonitor, get_expected_epochs
+from utils.preflight import infer_attribute_shapes, preflight_reward
+from utils.train_pool import TrainServerPool
+from utils.reward_batch import BatchMember, RewardBatcher
+from utils.run_journal import RunJournal, recover_job
+from utils.evaluation import SeedEvaluator
+from utils.gpu_monitor import GPUMonitor, make_backend
+from utils.campaign import SlotClient
+from utils.dedup import RewardDeduplicator
+from utils.screening import ScreeningStage
+from utils.feedback import FeedbackMonitor, MetricsSummary
+from utils.results_db import CandidateStatus, ResultsDB
+from omegaconf import OmegaConf
 
 EUREKA_ROOT_DIR = os.getcwd()
 ISAAC_ROOT_DIR = f"{EUREKA_ROOT_DIR}/../isaacgymenvs/isaacgymenvs"
 
+def log_run_event(job, event):
+    # Lifecycle events of the training runs, emitted by the scheduler's log tailers
+    if event.kind == TRAINING:
+        logging.info(f"{job.name} successfully training!")
+    elif event.kind == ERROR:
+        logging.info(f"{job.name} execution error!")
+    elif event.kind == FINISHED:
+        logging.info(f"{job.name} finished with exit code {job.returncode}")
+
+def move_log_file(workspace_dir):
+    # Append to the eureka.log of the resumed workspace instead of the one Hydra opened in the new output directory
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.FileHandler):
+            moved = logging.FileHandler(os.path.join(workspace_dir, os.path.basename(handler.baseFilename)), mode='a')
+            moved.setFormatter(handler.formatter)
+            moved.setLevel(handler.level)
+            root.removeHandler(handler)
+            handler.close()
+            root.addHandler(moved)
+
 @hydra.main(config_path="cfg", config_name="config", version_base="1.1")
 def main(cfg):
+    if cfg.resume:
+        # Continue the run journaled in an earlier workspace (see utils/run_journal.py). Hydra has
+        # already changed into a fresh output directory, relative paths are given from the launch directory
+        resume_dir = hydra.utils.to_absolute_path(cfg.resume)
+        logging.info(f"Resume: continuing {resume_dir}, the config of this launch stays in {os.getcwd()}")
+        os.chdir(resume_dir)
+        move_log_file(resume_dir)
     workspace_dir = Path.cwd()
     logging.info(f"Workspace: {workspace_dir}")
     logging.info(f"Project Root: {EUREKA_ROOT_DIR}")
 
-    # Initialize Azure OpenAI client
-    client = AzureOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version="2024-02-01",
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
+    if cfg.llm_mock_responses:
+        # Offline testing: replay canned responses instead of querying the LLM
+        mock_files = sorted(glob.glob(cfg.llm_mock_responses))
+        logging.info(f"Using mock LLM client with {len(mock_files)} canned responses")
+        client = MockChatClient([file_to_string(f) for f in mock_files])
+    else:
+        # Initialize Azure OpenAI client
+        client = AsyncAzureOpenAI(
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            api_version="2024-02-01",
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+        )
 
     task = cfg.env.task
     task_description = cfg.env.description
@@ -61,6 +109,8 @@ def main(cfg):
     reward_signature = file_to_string(f'{prompt_dir}/reward_signature.txt')
     policy_feedback = file_to_string(f'{prompt_dir}/policy_feedback.txt')
     execution_error_feedback = file_to_string(f'{prompt_dir}/execution_error_feedback.txt')
+    early_stop_feedback = file_to_string(f'{prompt_dir}/early_stop_feedback.txt')
+    screening_feedback = file_to_string(f'{prompt_dir}/screening_feedback.txt')
 
     system_role_name = "system"
     if 'o1-mini' in model:
@@ -84,64 +134,167 @@ def main(cfg):
     max_success_overall = DUMMY_FAILURE
     max_success_reward_correlation_overall = DUMMY_FAILURE
     max_reward_code_path = None 
+    llm_cost = 0.
+
+    # Durable record of the run, replayed to continue from the point of failure
+    replayed = RunJournal.replay()
+    if replayed['state'] is not None:
+        state = replayed['state']
+        max_successes = state['max_successes']
+        max_successes_reward_correlation = state['max_successes_reward_correlation']
+        execute_rates = state['execute_rates']
+        best_code_paths = state['best_code_paths']
+        max_success_overall = state['max_success_overall']
+        max_success_reward_correlation_overall = state['max_success_reward_correlation_overall']
+        max_reward_code_path = state['max_reward_code_path']
+        messages = state['messages']
+        # Journals written before the cost was recorded
+        llm_cost = state.get('llm_cost', 0.)
+    if cfg.resume:
+        logging.info(f"Resume: continuing at iteration {replayed['next_iter']} with {len(replayed['samples'])} samples already received")
+    journal = RunJournal()
+
+    def journal_iteration(iter):
+        journal.record('iteration', iter=iter, state={
+            'max_successes': max_successes,
+            'max_successes_reward_correlation': max_successes_reward_correlation,
+            'execute_rates': execute_rates,
+            'best_code_paths': best_code_paths,
+            'max_success_overall': max_success_overall,
+            'max_success_reward_correlation_overall': max_success_reward_correlation_overall,
+            'max_reward_code_path': max_reward_code_path,
+            'messages': messages,
+            'llm_cost': llm_cost,
+        })
+
+    # Structured record of the run for the analysis scripts, shared by all runs (see utils/results_db.py)
+    results_db = ResultsDB(cfg.results_db_path or f"{EUREKA_ROOT_DIR}/results.db") if cfg.results_db else None
+    run_id = results_db.start_run(workspace_dir, task, suffix, model, OmegaConf.to_container(cfg, resolve=True)) \
+        if results_db is not None else None
+
+    def record_candidate(iter, response_id, status, code=None, rl_run=None, tensorboard_logs=None, feedback=None):
+        if results_db is None:
+            return
+        success = correlation = metrics = None
+        if tensorboard_logs is not None:
+            if 'consecutive_successes' in tensorboard_logs:
+                success = tensorboard_logs['consecutive_successes'].max
+            correlation = tensorboard_logs.correlation.value
+            metrics = tensorboard_logs.points()
+        results_db.add_candidate(
+            run_id, iter, response_id, status, code=code, success=success, correlation=correlation,
+            log_path=str(workspace_dir / f"env_iter{iter}_response{response_id}.txt"),
+            tensorboard_dir=rl_run.tailer.tensorboard_dir if rl_run is not None else None,
+            stop_reason=rl_run.stop_reason if rl_run is not None else None, feedback=feedback, metrics=metrics)
+
+    def on_run_event(job, event):
+        log_run_event(job, event)
+        journal.on_event(job, event)
+
+    # Shared by all iterations so that GPU slots are tracked across the whole run
+    gpus = [int(gpu) for gpu in str(cfg.gpus).split(',')] if cfg.gpus != '' else None
+    expected_epochs = get_expected_epochs(f"{ISAAC_ROOT_DIR}/cfg/train/{task}{suffix}PPO.yaml", cfg.max_iterations)
+    # Summarizes the scalars of the runs while they train, for their feedback
+    feedback_monitor = FeedbackMonitor(expected_epochs=expected_epochs)
+    monitors = [feedback_monitor]
+    if cfg.screen:
+        # Absolute epochs, or a fraction of the full training budget
+        screen_epochs = cfg.screen_epochs if cfg.screen_epochs >= 1 else max(int(cfg.screen_epochs * expected_epochs), 1)
+        logging.info(f"Screening every candidate for {screen_epochs} epochs, promoting the top {cfg.screen_top_k}")
+    if cfg.early_stop and cfg.multi_reward > 1:
+        # A batch process trains several candidates, stopping it on one curve would end all of them
+        logging.info("Early stopping is disabled: with multi_reward every candidate trains in a batch process, "
+                     "which is never stopped early")
+    if cfg.early_stop:
+        monitors.append(MedianStoppingMonitor(expected_epochs=expected_epochs, grace=cfg.early_stop_grace,
+                                              min_peers=cfg.early_stop_min_peers, interval=cfg.early_stop_interval))
+    # Warm training daemons that swap in each reward function instead of starting train.py per sample
+    train_pool = TrainServerPool(f"{ISAAC_ROOT_DIR}/train_server.py", max_runs=cfg.train_server_max_runs) \
+        if cfg.train_server else None
+    scheduler = TrainingScheduler(gpus=gpus, runs_per_gpu=cfg.runs_per_gpu, min_vram=cfg.min_vram,
+                                  on_event=on_run_event, monitors=monitors,
+                                  warm_slots=train_pool.idle_servers if train_pool is not None else None,
+                                  gpu_monitor=GPUMonitor(make_backend(cfg.fake_gpus)),
+                                  slots=SlotClient(cfg.campaign_address, cfg.campaign_task or cfg.env.env_name)
+                                  if cfg.campaign_address else None)
+    attribute_shapes = infer_attribute_shapes(task_obs_code_string)
+    reward_cache = RewardResultCache(cfg.reward_cache_dir or f"{EUREKA_ROOT_DIR}/reward_cache", enabled=cfg.reward_cache)
+    # Everything besides the reward code that determines the outcome of a training run
+    cache_train_config = {
+        'max_iterations': cfg.max_iterations,
+        'num_envs': cfg.num_envs,
+        'env_code': task_code_string,
+        'task_cfg': file_to_string(f"{ISAAC_ROOT_DIR}/cfg/task/{task}{suffix}.yaml"),
+        'train_cfg': file_to_string(f"{ISAAC_ROOT_DIR}/cfg/train/{task}{suffix}PPO.yaml"),
+    }
+    if cfg.multi_reward > 1:
+        cache_train_config['multi_reward'] = cfg.multi_reward
+    # Initial number of completions per request, adapted to the observed latency and rate limits from there
+    chunk_size = 4
+    if "gpt-3.5" in model:
+        chunk_size = cfg.sample
+    elif "o1-mini" in model:
+        chunk_size = 1
+    max_chunk_size = 1 if "o1-mini" in model else (cfg.llm_max_chunk_size or cfg.sample)
+    llm_prices = None
+    if cfg.llm_price_input or cfg.llm_price_output:
+        llm_prices = {'input': cfg.llm_price_input, 'output': cfg.llm_price_output}
+        if cfg.llm_price_cached_input:
+            llm_prices['cached_input'] = cfg.llm_price_cached_input
+    # The system prompt and the task prompt with the observation code (messages[:2]) are the same in
+    # every request of the run, only the reward feedback turns after them change between iterations
+    sampler = AsyncSampler(client, model, temperature=cfg.temperature, chunk_size=min(chunk_size, max_chunk_size),
+                           concurrency=cfg.llm_concurrency, requests_per_minute=cfg.llm_requests_per_minute,
+                           max_chunk_size=max_chunk_size, target_latency=cfg.llm_target_latency,
+                           prices=llm_prices, prompt_cache_key=cfg.llm_prompt_cache_key, stable_messages=2)
     
     # Eureka generation loop
-    for iter in range(cfg.iteration):
+    for iter in range(replayed['next_iter'], cfg.iteration):
         # Get Eureka response
         responses = []
-        response_cur = None
-        total_samples = 0
-        total_token = 0
-        total_completion_token = 0
-
-        chunk_size = 4
-        if "gpt-3.5" in model:
-            chunk_size = cfg.sample
-        elif "o1-mini" in model:
-            chunk_size = 1
+        sampler.reset_usage()
 
         logging.info(f"Iteration {iter}: Generating {cfg.sample} samples with {cfg.model}")
 
-        while True:
-            if total_samples >= cfg.sample:
-                break
-            for attempt in range(1000):
-                try:
-                    azure_response = client.chat.completions.create(
-                        model=model,  # model should be your Azure deployment name
-                        messages=messages,
-                        temperature=cfg.temperature,
-                        n=chunk_size
-                    )
-                    # Convert Azure response to dictionary format using model_dump_json
-                    response_cur = json.loads(azure_response.model_dump_json())
-                    total_samples += chunk_size
-                    break
-                except Exception as e:
-                    if attempt >= 10:
-                        chunk_size = max(int(chunk_size / 2), 1)
-                        print("Current Chunk Size", chunk_size)
-                    logging.info(f"Attempt {attempt+1} failed with error: {e}")
-                time.sleep(1)
-            if response_cur is None:
-                logging.info("Code terminated due to too many failed attempts!")
-                exit()
-
-            responses.extend(response_cur["choices"])
-            prompt_tokens = response_cur["usage"]["prompt_tokens"]
-            total_completion_token += response_cur["usage"]["completion_tokens"]
-            total_token += response_cur["usage"]["total_tokens"]
-
-        if cfg.sample == 1:
-            logging.info(f"Iteration {iter}: GPT Output:\n " + responses[0]["message"]["content"] + "\n")
-
-        # Logging Token Information
-        logging.info(f"Iteration {iter}: Prompt Tokens: {prompt_tokens}, Completion Tokens: {total_completion_token}, Total Tokens: {total_token}")
-        
+        # Responses are processed as they arrive so that training overlaps the remaining LLM requests
         code_runs = [] 
         rl_runs = []
-        for response_id in range(cfg.sample):
-            response_cur = responses[response_id]["message"]["content"]
+        response_ids = []
+        cache_keys = []
+        precomputed = {}  # response_id -> (traceback_msg, tensorboard_logs) of candidates that are not trained
+        # Candidates trained side by side in one simulation, `multi_reward` per train.py process
+        batcher = RewardBatcher(scheduler, cfg.multi_reward, f"Iteration {iter}", f"env_iter{iter}",
+                                prepare=lambda src: shutil.copy(src, output_file),
+                                stage_key=output_file) if cfg.multi_reward > 1 else None
+        cache_hits, cache_lookups = reward_cache.hits, reward_cache.lookups
+        # Candidates are screened with a short run, only the most promising ones are trained in full
+        screening = ScreeningStage(f"Iteration {iter}", cfg.screen_top_k) if cfg.screen else None
+        # Near-duplicate candidates are not trained, only the first of each cluster is
+        deduplicator = RewardDeduplicator(cfg.dedup_threshold) if cfg.dedup else None
+        # Samples received before a restart are replayed from the journal, only the rest is requested
+        replayed_samples = [replayed['samples'][i] for i in sorted(replayed['samples'])] \
+            if iter == replayed['next_iter'] else []
+
+        def iteration_samples():
+            yield from replayed_samples
+            yield from sampler.iter_samples(messages, max(cfg.sample - len(replayed_samples), 0), on_idle=scheduler.step)
+            # Replacements for dropped duplicates, which may themselves turn out to be duplicates
+            requested = max(len(replayed_samples) - cfg.sample, 0)
+            while deduplicator is not None and requested < cfg.dedup_replacements:
+                missing = min(deduplicator.num_duplicates - requested, cfg.dedup_replacements - requested)
+                if missing <= 0:
+                    break
+                logging.info(f"Iteration {iter}: Requesting {missing} replacement samples for duplicates")
+                requested += missing
+                yield from sampler.iter_samples(messages, missing, on_idle=scheduler.step)
+
+        samples = iteration_samples()
+        for response_id, choice in enumerate(samples):
+            resuming = response_id < len(replayed_samples)
+            if not resuming:
+                journal.record('sample', iter=iter, response_id=response_id, choice=choice)
+            responses.append(choice)
+            response_cur = choice["message"]["content"]
             logging.info(f"Iteration {iter}: Processing Code Run {response_id}")
 
             # Regex patterns to extract python code enclosed in GPT response
@@ -170,8 +323,17 @@ def main(cfg):
                 gpt_reward_signature, input_lst = get_function_signature(code_string)
             except Exception as e:
                 logging.info(f"Iteration {iter}: Code Run {response_id} cannot parse function signature!")
+                record_candidate(iter, response_id, CandidateStatus.UNPARSABLE, code=code_string)
                 continue
 
+            if deduplicator is not None:
+                duplicate_of = deduplicator.check(response_id, code_string)
+                if duplicate_of is not None:
+                    logging.info(f"Iteration {iter}: Code Run {response_id} duplicates Code Run {duplicate_of}, not training it")
+                    record_candidate(iter, response_id, CandidateStatus.DUPLICATE, code=code_string,
+                                     feedback=f"Duplicate of Code Run {duplicate_of}")
+                    continue
+
             code_runs.append(code_string)
             reward_signature = [
                 f"self.rew_buf[:], self.rew_dict = {gpt_reward_signature}",
@@ -188,45 +350,128 @@ def main(cfg):
                 raise NotImplementedError
 
             # Save the new environment code when the output contains valid code string!
-            with open(output_file, 'w') as file:
+            if "@torch.jit.script" not in code_string:
+                code_string = "@torch.jit.script\n" + code_string
+            # Keep the generated environment code in the hydra output directory for bookkeeping,
+            # the scheduler copies it over the shared task file right before launching the run
+            env_filepath = f"env_iter{iter}_response{response_id}.py"
+            with open(env_filepath, 'w') as file:
                 file.writelines(task_code_string_iter + '\n')
                 file.writelines("from typing import Tuple, Dict" + '\n')
                 file.writelines("import math" + '\n')
                 file.writelines("import torch" + '\n')
                 file.writelines("from torch import Tensor" + '\n')
-                if "@torch.jit.script" not in code_string:
-                    code_string = "@torch.jit.script\n" + code_string
                 file.writelines(code_string + '\n')
 
             with open(f"env_iter{iter}_response{response_id}_rewardonly.py", 'w') as file:
                 file.writelines(code_string + '\n')
 
-            # Copy the generated environment code to hydra output directory for bookkeeping
-            shutil.copy(output_file, f"env_iter{iter}_response{response_id}.py")
-
-            # Find the freest GPU to run GPU-accelerated RL
-            set_freest_gpu()
-            
-            wait_for_free_vram(cfg.min_vram)
-
             # Execute the python file with flags
             rl_filepath = f"env_iter{iter}_response{response_id}.txt"
-            with open(rl_filepath, 'w') as f:
-                cmd = ['python', '-u', f'{ISAAC_ROOT_DIR}/train.py',  
-                        'hydra/output=subprocess',
-                        f'task={task}{suffix}', f'wandb_activate={cfg.use_wandb}',
-                        f'wandb_entity={cfg.wandb_username}', f'wandb_project={cfg.wandb_project}',
-                        f'headless={not cfg.capture_video}', f'capture_video={cfg.capture_video}', 
-                        'force_render=False', f'max_iterations={cfg.max_iterations}',
-                        # f'pipeline={cfg.pipeline}', f'sim_device={cfg.sim_device}',
-                    ]
-                if cfg.num_envs:  # Only add if not empty string
-                    cmd.append(f'num_envs={cfg.num_envs}')
-                process = subprocess.Popen(cmd, stdout=f, stderr=f)
-            time.sleep(1)
-            block_until_training(rl_filepath, log_status=True, iter_num=iter, response_id=response_id)
-            rl_runs.append(process)
-        
+            cmd = ['python', '-u', f'{ISAAC_ROOT_DIR}/train.py',  
+                    'hydra/output=subprocess',
+                    f'task={task}{suffix}', f'wandb_activate={cfg.use_wandb}',
+                    f'wandb_entity={cfg.wandb_username}', f'wandb_project={cfg.wandb_project}',
+                    f'headless={not cfg.capture_video}', f'capture_video={cfg.capture_video}', 
+                    'force_render=False', f'max_iterations={cfg.max_iterations}',
+                    # f'pipeline={cfg.pipeline}', f'sim_device={cfg.sim_device}',
+                ]
+            if cfg.num_envs:  # Only add if not empty string
+                cmd.append(f'num_envs={cfg.num_envs}')
+
+            # Identical reward functions trained before reuse the stored results instead of retraining
+            cache_key = reward_cache_key(code_string, f"{task}{suffix}", train_config=cache_train_config)
+
+            # Reattach to (or skip) the training this candidate already had before the restart
+            recovered = recover_job(f"Iteration {iter}: Code Run {response_id}", rl_filepath, replayed, scheduler,
+                                    group=iter) if resuming else None
+            if recovered is not None:
+                rl_runs.append(recovered)
+                response_ids.append(response_id)
+                cache_keys.append(cache_key)
+                continue
+
+            cached = reward_cache.get(cache_key)
+            if cached is not None:
+                logging.info(f"Iteration {iter}: Code Run {response_id} reuses cached results {cache_key[:12]}")
+                with open(rl_filepath, 'w') as f:
+                    f.write(f"Reusing cached training results {cache_key}\n")
+                    f.write(f"Tensorboard Directory: {cached.get('tensorboard_dir', '')}\n")
+                precomputed[response_id] = ('', MetricsSummary.from_dict(cached['summary']) if 'summary' in cached
+                                            else cached['tensorboard_logs'])
+                rl_runs.append(None)
+                response_ids.append(response_id)
+                cache_keys.append(cache_key)
+                continue
+
+            # Reject code that cannot compile or run on synthetic inputs before paying for an Isaac Gym launch
+            if cfg.preflight:
+                preflight_ok, preflight_msg = preflight_reward(code_string, attribute_shapes, timeout=cfg.preflight_timeout)
+                if not preflight_ok:
+                    logging.info(f"Iteration {iter}: Code Run {response_id} failed preflight check!")
+                    with open(rl_filepath, 'w') as f:
+                        f.write(preflight_msg)
+                    # Timeouts explain themselves without a traceback, an empty message would count as a successful run
+                    precomputed[response_id] = (filter_traceback(preflight_msg) or preflight_msg, None)
+                    rl_runs.append(None)
+                    response_ids.append(response_id)
+                    cache_keys.append(cache_key)
+                    continue
+                if preflight_msg:
+                    logging.info(f"Iteration {iter}: Code Run {response_id} preflight inconclusive, "
+                                 f"training anyway:\n{preflight_msg}")
+
+            def launch_full(response_id=response_id, cmd=cmd, env_filepath=env_filepath, rl_filepath=rl_filepath):
+                if batcher is not None:
+                    return batcher.add(f"Iteration {iter}: Code Run {response_id}", cmd, env_filepath, rl_filepath)
+                job = TrainingJob(
+                    f"Iteration {iter}: Code Run {response_id}", cmd, rl_filepath,
+                    prepare=lambda src=env_filepath: shutil.copy(src, output_file),
+                    stage_key=output_file, group=iter,
+                    launcher=(lambda job, gpu, env, src=env_filepath: train_pool.launch(job, gpu, env, src))
+                    if train_pool is not None else None,
+                )
+                return scheduler.submit(job)
+
+            if screening is not None:
+                # Short run first, the full run is only launched if the candidate is promoted
+                screen_cmd = [arg for arg in cmd if not arg.startswith(('max_iterations=', 'num_envs='))]
+                screen_cmd.append(f'max_iterations={screen_epochs}')
+                if cfg.screen_num_envs:
+                    screen_cmd.append(f'num_envs={cfg.screen_num_envs}')
+                screen_job = TrainingJob(
+                    f"Iteration {iter}: Code Run {response_id} (screening)", screen_cmd,
+                    f"env_iter{iter}_response{response_id}_screen.txt",
+                    prepare=lambda src=env_filepath: shutil.copy(src, output_file), stage_key=output_file,
+                )
+                screening.add(response_id, scheduler.submit(screen_job), launch_full)
+                rl_runs.append(None)
+            else:
+                rl_runs.append(launch_full())
+            response_ids.append(response_id)
+            cache_keys.append(cache_key)
+            scheduler.step()
+        if batcher is not None:
+            batcher.flush()
+
+        screened_out = {}  # response_id -> screening epochs of candidates that were not promoted
+        if screening is not None and screening.candidates:
+            promoted = screening.run(scheduler)
+            if batcher is not None:
+                batcher.flush()
+            for idx, response_id in enumerate(response_ids):
+                if response_id in promoted:
+                    rl_runs[idx] = promoted[response_id]
+                elif response_id in screening.candidates:
+                    precomputed[response_id] = screening.results[response_id]
+                    screened_out[response_id] = screen_epochs
+
+        if cfg.sample == 1:
+            logging.info(f"Iteration {iter}: GPT Output:\n " + responses[0]["message"]["content"] + "\n")
+
+        # Logging Token Information
+        logging.info(f"Iteration {iter}: Prompt Tokens: {sampler.usage.prompt_tokens}, Completion Tokens: {sampler.usage.completion_tokens}, Total Tokens: {sampler.usage.total_tokens}")
+
         # Gather RL training results and construct reward reflection
         code_feedbacks = []
         contents = []
@@ -235,54 +480,64 @@ def main(cfg):
         code_paths = []
         
         exec_success = False 
-        for response_id, (code_run, rl_run) in enumerate(zip(code_runs, rl_runs)):
-            rl_run.communicate()
-            rl_filepath = f"env_iter{iter}_response{response_id}.txt"
+        for response_id, code_run, rl_run, cache_key in zip(response_ids, code_runs, rl_runs, cache_keys):
             code_paths.append(f"env_iter{iter}_response{response_id}.py")
-            try:
-                with open(rl_filepath, 'r') as f:
-                    stdout_str = f.read() 
-            except: 
-                content = execution_error_feedback.format(traceback_msg="Code Run cannot be executed due to function signature error! Please re-write an entirely new reward function!")
-                content += code_output_tip
-                contents.append(content) 
-                successes.append(DUMMY_FAILURE)
-                reward_correlations.append(DUMMY_FAILURE)
-                continue
+            if rl_run is None:
+                traceback_msg, tensorboard_logs = precomputed[response_id]
+            else:
+                if isinstance(rl_run, BatchMember):
+                    rl_run.wait(scheduler)
+                else:
+                    scheduler.wait(rl_run)
+                rl_filepath = rl_run.log_path
+                try:
+                    with open(rl_filepath, 'r') as f:
+                        stdout_str = f.read() 
+                except: 
+                    content = execution_error_feedback.format(traceback_msg="Code Run cannot be executed due to function signature error! Please re-write an entirely new reward function!")
+                    content += code_output_tip
+                    contents.append(content) 
+                    successes.append(DUMMY_FAILURE)
+                    reward_correlations.append(DUMMY_FAILURE)
+                    record_candidate(iter, response_id, CandidateStatus.ERROR, code=code_run, rl_run=rl_run, feedback=content)
+                    continue
+
+                traceback_msg = filter_traceback(stdout_str)
+                if traceback_msg == '':
+                    tensorboard_logdir = rl_run.tailer.tensorboard_dir
+                    # Built while the run trained, only the last scalars are read now
+                    tensorboard_logs = feedback_monitor.summary(rl_run) or MetricsSummary()
+                # Truncated runs are not representative of the reward function, keep them out of the cache
+                if traceback_msg == '' and rl_run.stop_reason is None:
+                    reward_cache.put(cache_key, summary=tensorboard_logs.to_dict(), tensorboard_dir=tensorboard_logdir,
+                                     code_path=os.path.abspath(code_paths[-1]))
 
             content = ''
-            traceback_msg = filter_traceback(stdout_str)
-
             if traceback_msg == '':
                 # If RL execution has no error, provide policy statistics feedback
                 exec_success = True
-                lines = stdout_str.split('\n')
-                for i, line in enumerate(lines):
-                    if line.startswith('Tensorboard Directory:'):
-                        break 
-                tensorboard_logdir = line.split(':')[-1].strip() 
-                tensorboard_logs = load_tensorboard_logs(tensorboard_logdir)
-                max_iterations = np.array(tensorboard_logs['gt_reward']).shape[0]
+                if not isinstance(tensorboard_logs, MetricsSummary):
+                    tensorboard_logs = MetricsSummary.from_logs(tensorboard_logs)
+                max_iterations = tensorboard_logs['gt_reward'].count
                 epoch_freq = max(int(max_iterations // 10), 1)
                 
                 content += policy_feedback.format(epoch_freq=epoch_freq)
                 
                 # Compute Correlation between Human-Engineered and GPT Rewards
                 if "gt_reward" in tensorboard_logs and "gpt_reward" in tensorboard_logs:
-                    gt_reward = np.array(tensorboard_logs["gt_reward"])
-                    gpt_reward = np.array(tensorboard_logs["gpt_reward"])
-                    reward_correlation = np.corrcoef(gt_reward, gpt_reward)[0, 1]
+                    reward_correlation = tensorboard_logs.correlation.value
                     reward_correlations.append(reward_correlation)
 
                 # Add reward components log to the feedback
                 for metric in tensorboard_logs:
                     if "/" not in metric:
-                        metric_cur = ['{:.2f}'.format(x) for x in tensorboard_logs[metric][::epoch_freq]]
-                        metric_cur_max = max(tensorboard_logs[metric])
-                        metric_cur_mean = sum(tensorboard_logs[metric]) / len(tensorboard_logs[metric])
+                        series = tensorboard_logs[metric]
+                        metric_cur = ['{:.2f}'.format(x) for x in series.every(epoch_freq)]
+                        metric_cur_max = series.max
+                        metric_cur_mean = series.mean
                         if "consecutive_successes" == metric:
                             successes.append(metric_cur_max)
-                        metric_cur_min = min(tensorboard_logs[metric])
+                        metric_cur_min = series.min
                         if metric != "gt_reward" and metric != "gpt_reward":
                             if metric != "consecutive_successes":
                                 metric_name = metric 
@@ -293,6 +548,10 @@ def main(cfg):
                             # Provide ground-truth score when success rate not applicable
                             if "consecutive_successes" not in tensorboard_logs:
                                 content += f"ground-truth score: {metric_cur}, Max: {metric_cur_max:.2f}, Mean: {metric_cur_mean:.2f}, Min: {metric_cur_min:.2f} \n"                    
+                if rl_run is not None and rl_run.stop_reason is not None:
+                    content += early_stop_feedback.format(**rl_run.stop_reason)
+                if response_id in screened_out:
+                    content += screening_feedback.format(epochs=screened_out[response_id])
                 code_feedbacks.append(code_feedback)
                 content += code_feedback  
             else:
@@ -301,9 +560,36 @@ def main(cfg):
                 reward_correlations.append(DUMMY_FAILURE)
                 content += execution_error_feedback.format(traceback_msg=traceback_msg)
 
+            if traceback_msg != '':
+                status = CandidateStatus.ERROR
+            elif response_id in screened_out:
+                status = CandidateStatus.SCREENED
+            elif rl_run is None:
+                status = CandidateStatus.CACHED
+            elif rl_run.stop_reason is not None:
+                status = CandidateStatus.STOPPED
+            else:
+                status = CandidateStatus.TRAINED
+            record_candidate(iter, response_id, status, code=code_run, rl_run=rl_run, feedback=content,
+                             tensorboard_logs=tensorboard_logs if traceback_msg == '' else None)
+
             content += code_output_tip
             contents.append(content) 
         
+        # Candidates whose reward function trained without errors
+        num_accepted = sum(1 for success in successes if success != DUMMY_FAILURE)
+        llm_cost += sampler.usage.cost
+        logging.info(f"Iteration {iter}: LLM {sampler.usage.summary(num_accepted)}, Chunk Size: {sampler.chunk_size}")
+
+        if deduplicator is not None and deduplicator.num_duplicates:
+            clusters = {rep_id: members for rep_id, members in deduplicator.clusters.items() if members}
+            logging.info(f"Iteration {iter}: Dropped {deduplicator.num_duplicates} duplicate candidates, clusters: {clusters}")
+
+        iter_lookups = reward_cache.lookups - cache_lookups
+        if iter_lookups:
+            logging.info(f"Iteration {iter}: Reward cache hits: {reward_cache.hits - cache_hits}/{iter_lookups}, "
+                         f"Overall hit rate: {reward_cache.hit_rate:.2f}")
+
         # Repeat the iteration if all code generation failed
         if not exec_success and cfg.sample != 1:
             execute_rates.append(0.)
@@ -311,15 +597,24 @@ def main(cfg):
             max_successes_reward_correlation.append(DUMMY_FAILURE)
             best_code_paths.append(None)
             logging.info("All code generation failed! Repeat this iteration from the current message checkpoint!")
+            if results_db is not None:
+                results_db.add_iteration(run_id, iter, execute_rate=0., prompt_tokens=sampler.usage.prompt_tokens,
+                                         completion_tokens=sampler.usage.completion_tokens, llm_cost=sampler.usage.cost)
+            journal_iteration(iter)
             continue
 
-        # Select the best code sample based on the success rate
-        best_sample_idx = np.argmax(np.array(successes))
+        # Select the best code sample based on the success rate. Screened out candidates only trained for the
+        # screening budget, their scores are not comparable to full runs and only serve their feedback
+        selection_successes = [DUMMY_FAILURE if response_id in screened_out else success
+                               for response_id, success in zip(response_ids, successes)]
+        best_sample_idx = int(np.argmax(np.array(selection_successes)))
         best_content = contents[best_sample_idx]
+        best_response_id = response_ids[best_sample_idx]
             
-        max_success = successes[best_sample_idx]
-        max_success_reward_correlation = reward_correlations[best_sample_idx]
-        execute_rate = np.sum(np.array(successes) >= 0.) / cfg.sample
+        max_success = selection_successes[best_sample_idx]
+        max_success_reward_correlation = reward_correlations[best_sample_idx] if max_success != DUMMY_FAILURE else DUMMY_FAILURE
+        # Over the candidates actually evaluated: dropped duplicates are not failures, replacements may exceed cfg.sample
+        execute_rate = np.sum(np.array(successes) >= 0.) / len(successes)
 
         # Update the best Eureka Output
         if max_success > max_success_overall:
@@ -333,8 +628,14 @@ def main(cfg):
         best_code_paths.append(code_paths[best_sample_idx])
 
         logging.info(f"Iteration {iter}: Max Success: {max_success}, Execute Rate: {execute_rate}, Max Success Reward Correlation: {max_success_reward_correlation}")
-        logging.info(f"Iteration {iter}: Best Generation ID: {best_sample_idx}")
-        logging.info(f"Iteration {iter}: GPT Output Content:\n" +  responses[best_sample_idx]["message"]["content"] + "\n")
+        logging.info(f"Iteration {iter}: Best Generation ID: {best_response_id}")
+        if results_db is not None:
+            results_db.add_iteration(run_id, iter, max_success=max_success, execute_rate=execute_rate,
+                                     correlation=max_success_reward_correlation, best_response_id=best_response_id,
+                                     best_code_path=str(workspace_dir / code_paths[best_sample_idx]),
+                                     prompt_tokens=sampler.usage.prompt_tokens,
+                                     completion_tokens=sampler.usage.completion_tokens, llm_cost=sampler.usage.cost)
+        logging.info(f"Iteration {iter}: GPT Output Content:\n" +  responses[best_response_id]["message"]["content"] + "\n")
         logging.info(f"Iteration {iter}: User Content:\n" + best_content + "\n")
             
         # Plot the success rate
@@ -356,76 +657,68 @@ def main(cfg):
         np.savez('summary.npz', max_successes=max_successes, execute_rates=execute_rates, best_code_paths=best_code_paths, max_successes_reward_correlation=max_successes_reward_correlation)
 
         if len(messages) == 2:
-            messages += [{"role": "assistant", "content": responses[best_sample_idx]["message"]["content"]}]
+            messages += [{"role": "assistant", "content": responses[best_response_id]["message"]["content"]}]
             messages += [{"role": "user", "content": best_content}]
         else:
             assert len(messages) == 4
-            messages[-2] = {"role": "assistant", "content": responses[best_sample_idx]["message"]["content"]}
+            messages[-2] = {"role": "assistant", "content": responses[best_response_id]["message"]["content"]}
             messages[-1] = {"role": "user", "content": best_content}
 
         # Save dictionary as JSON file
         with open('messages.json', 'w') as file:
             json.dump(messages, file, indent=4)
+        journal_iteration(iter)
     
+    if train_pool is not None:
+        # Release the daemons' GPU memory for the evaluation runs
+        train_pool.close()
+
     # Evaluate the best reward code many times
     if max_reward_code_path is None: 
         logging.info("All iterations of code generation failed, aborting...")
         logging.info("Please double check the output env_iter*_response*.txt files for repeating errors!")
         exit()
     logging.info(f"Task: {task}, Max Training Success {max_success_overall}, Correlation {max_success_reward_correlation_overall}, Best Reward Code Path: {max_reward_code_path}")
+    if llm_prices is not None:
+        logging.info(f"LLM cost of the run: ${llm_cost:.4f}")
     logging.info(f"Evaluating best reward code {cfg.num_eval} times")
     shutil.copy(max_reward_code_path, output_file)
     
-    eval_runs = []
+    # The seeds train concurrently on the scheduler's GPUs, results are summarized as runs finish
+    def record_eval(seed, job, logs):
+        if results_db is not None:
+            results_db.add_eval(run_id, seed, success=evaluator.successes.get(seed),
+                                correlation=evaluator.correlations.get(seed), log_path=str(workspace_dir / job.log_path),
+                                metrics=MetricsSummary.from_logs(logs).points())
+
+    evaluator = SeedEvaluator(scheduler, level=cfg.eval_confidence, on_result=record_eval)
     for i in range(cfg.num_eval):
-        set_freest_gpu()
-        
-        wait_for_free_vram(cfg.min_vram)
-
-        # Execute the python file with flags
         rl_filepath = f"reward_code_eval{i}.txt"
-        with open(rl_filepath, 'w') as f:
-            cmd = ['python', '-u', f'{ISAAC_ROOT_DIR}/train.py',  
-                    'hydra/output=subprocess',
-                    f'task={task}{suffix}', f'wandb_activate={cfg.use_wandb}',
-                    f'wandb_entity={cfg.wandb_username}', f'wandb_project={cfg.wandb_project}',
-                    f'headless={not cfg.capture_video}', f'capture_video={cfg.capture_video}', 
-                    'force_render=False', f'seed={i}', 
-                    # f'pipeline={cfg.pipeline}', f'sim_device={cfg.sim_device}',
-                ]
-            # if cfg.num_envs:  # Only add if not empty string
-            #     cmd.append(f'num_envs={cfg.num_envs}')
-            process = subprocess.Popen(cmd, stdout=f, stderr=f)
-        time.sleep(1)
-        block_until_training(rl_filepath)
-        eval_runs.append(process)
-
-    reward_code_final_successes = []
-    reward_code_correlations_final = []
-    for i, rl_run in enumerate(eval_runs):
-        rl_run.communicate()
-        rl_filepath = f"reward_code_eval{i}.txt"
-        with open(rl_filepath, 'r') as f:
-            stdout_str = f.read() 
-        lines = stdout_str.split('\n')
-        for i, line in enumerate(lines):
-            if line.startswith('Tensorboard Directory:'):
-                break 
-        tensorboard_logdir = line.split(':')[-1].strip() 
-        tensorboard_logs = load_tensorboard_logs(tensorboard_logdir)
-        max_success = max(tensorboard_logs['consecutive_successes'])
-        reward_code_final_successes.append(max_success)
-
-        if "gt_reward" in tensorboard_logs and "gpt_reward" in tensorboard_logs:
-            gt_reward = np.array(tensorboard_logs["gt_reward"])
-            gpt_reward = np.array(tensorboard_logs["gpt_reward"])
-            reward_correlation = np.corrcoef(gt_reward, gpt_reward)[0, 1]
-            reward_code_correlations_final.append(reward_correlation)
-
-    logging.info(f"Final Success Mean: {np.mean(reward_code_final_successes)}, Std: {np.std(reward_code_final_successes)}, Raw: {reward_code_final_successes}")
-    logging.info(f"Final Correlation Mean: {np.mean(reward_code_correlations_final)}, Std: {np.std(reward_code_correlations_final)}, Raw: {reward_code_correlations_final}")
-    np.savez('final_eval.npz', reward_code_final_successes=reward_code_final_successes, reward_code_correlations_final=reward_code_correlations_final)
-
+        cmd = ['python', '-u', f'{ISAAC_ROOT_DIR}/train.py',  
+                'hydra/output=subprocess',
+                f'task={task}{suffix}', f'wandb_activate={cfg.use_wandb}',
+                f'wandb_entity={cfg.wandb_username}', f'wandb_project={cfg.wandb_project}',
+                f'headless={not cfg.capture_video}', f'capture_video={cfg.capture_video}', 
+                'force_render=False', f'seed={i}', 
+                # f'pipeline={cfg.pipeline}', f'sim_device={cfg.sim_device}',
+            ]
+        # if cfg.num_envs:  # Only add if not empty string
+        #     cmd.append(f'num_envs={cfg.num_envs}')
+        job = recover_job(f"Final eval seed {i}", rl_filepath, replayed, scheduler) if cfg.resume else None
+        if job is None:
+            job = TrainingJob(f"Final eval seed {i}", cmd, rl_filepath)
+        evaluator.add(i, job)
+    reward_code_final_successes, reward_code_correlations_final = evaluator.run()
+
+    success_ci = evaluator.success_stats.confidence_interval(cfg.eval_confidence)
+    logging.info(f"Final Success Mean: {evaluator.success_stats.mean}, Std: {evaluator.success_stats.std}, {int(cfg.eval_confidence * 100)}% CI: {success_ci}, Raw: {reward_code_final_successes}")
+    logging.info(f"Final Correlation Mean: {evaluator.correlation_stats.mean}, Std: {evaluator.correlation_stats.std}, Raw: {reward_code_correlations_final}")
+    if evaluator.failed:
+        logging.info(f"Final eval: seeds {evaluator.failed} failed and are left out of the statistics")
+    evaluator.save()
+    journal.close()
+    if results_db is not None:
+        results_db.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -12,7 +12,7 @@ from utils.file_utils import load_tensorboard_logs
 # from utils.create_task import create_task
 from utils.extract_task_code import *
 
-from custom_utils import wait_for_free_vram
+from utils.gpu_monitor import default_monitor, device_env
 
 EUREKA_ROOT_DIR = os.getcwd()
 ISAAC_ROOT_DIR = f"{EUREKA_ROOT_DIR}/../isaacgymenvs/isaacgymenvs"
@@ -32,11 +32,10 @@ def main(cfg):
 
     logging.info(f"Evaluating best reward code {cfg.num_eval} times")
     
+    gpu_monitor = default_monitor()
     eval_runs = []
     for i in range(cfg.num_eval):
-        set_freest_gpu()
-
-        wait_for_free_vram(cfg.min_vram)
+        gpu = gpu_monitor.wait_for_free_vram(cfg.min_vram)
         
         # Execute the python file with flags
         rl_filepath = f"reward_code_eval{i}.txt"
@@ -48,7 +47,9 @@ def main(cfg):
                     f'headless={not cfg.capture_video}', f'capture_video={cfg.capture_video}', 'force_render=False', f'seed={i}']
             # if cfg.num_envs:  # Only add if not empty string
             #     cmd.append(f'num_envs={cfg.num_envs}')
-            process = subprocess.Popen(cmd, stdout=f, stderr=f)
+            process = subprocess.Popen(cmd, stdout=f, stderr=f, env=device_env(gpu))
+        # Not counted as free while the run is still starting up
+        gpu_monitor.reserve(gpu, cfg.min_vram, process.pid)
         time.sleep(1)
         block_until_training(rl_filepath)
         eval_runs.append(process)
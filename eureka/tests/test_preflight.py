@@ -0,0 +1,41 @@
+import os
+import sys
+
+# The eureka modules import each other as `utils.*`, relative to the eureka folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.misc import filter_traceback
+from utils.preflight import preflight_reward
+
+SHAPES = {'pos': [3]}
+
+REWARD = '''def compute_reward(pos: torch.Tensor) -> Tuple[torch.Tensor, Dict[str, torch.Tensor]]:
+    reward = -torch.norm(pos, dim=-1)
+    return reward, {"distance": reward}
+'''
+
+LOOPING_REWARD = '''def compute_reward(pos: torch.Tensor) -> Tuple[torch.Tensor, Dict[str, torch.Tensor]]:
+    i = 0
+    while i >= 0:
+        i = i + 1
+    reward = -torch.norm(pos, dim=-1)
+    return reward, {"distance": reward}
+'''
+
+
+def test_valid_reward_passes():
+    ok, message = preflight_reward(REWARD, SHAPES)
+    assert ok and message == ''
+
+
+def test_scalar_reward_is_rejected():
+    ok, message = preflight_reward(REWARD.replace('return reward,', 'return reward.mean(),'), SHAPES)
+    assert not ok
+    assert 'expected one reward per environment' in message
+
+
+def test_timeout_is_rejected_with_feedback():
+    ok, message = preflight_reward(LOOPING_REWARD, SHAPES, timeout=5)
+    assert not ok
+    # eureka.py falls back to the message itself, so the candidate gets error feedback instead of counting as trained
+    assert 'timed out' in (filter_traceback(message) or message)
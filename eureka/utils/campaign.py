@@ -0,0 +1,246 @@
+import csv
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from utils.gpu_monitor import GPUMonitor
+from utils.run_journal import JOURNAL_NAME
+
+AUTHKEY_ENV = 'EUREKA_CAMPAIGN_AUTHKEY'
+
+
+class SlotBroker:
+    """
+    Hands out GPU slots to the Eureka runs of a campaign, one run per task (see `campaign.py`).
+
+    Every run asks for a slot before it launches a training job and gives it back once the job has
+    finished. A GPU takes at most `runs_per_gpu` jobs of the whole campaign, and only gets a new one
+    while it has `min_vram` GB free (VRAM of granted jobs that have not allocated it yet is reserved,
+    see `utils.gpu_monitor`). When several tasks wait for a slot, the task holding the fewest slots
+    relative to its priority gets it first (fair share), ties go to the task that has used the least
+    GPU time relative to its priority, then to the oldest request.
+
+    Protocol (multiprocessing.connection, one connection per Eureka run):
+        client -> broker: {'task'} once, then {'acquire': job_id, 'name'}, {'started': job_id, 'pid'}, {'release': job_id}
+        broker -> client: {'grant': job_id, 'gpu'}
+
+    Args:
+        address (str): Unix socket path to listen on
+        authkey (bytes): Shared secret of the connections
+        gpus (list): GPU indices the campaign may use (None: all)
+        runs_per_gpu (int): Max concurrent jobs per GPU
+        min_vram (float): GB a GPU needs free to receive a job
+        priorities (dict): Task -> weight of its fair share (default 1)
+        gpu_monitor (GPUMonitor): Source of free VRAM readings
+        dispatch_interval (float): Seconds between retries while requests wait for free VRAM
+    """
+    def __init__(self, address, authkey, gpus=None, runs_per_gpu=1, min_vram=8, priorities=None,
+                 gpu_monitor=None, dispatch_interval=5.0):
+        self.address = address
+        self.authkey = authkey
+        self.gpus = list(gpus) if gpus else None
+        self.runs_per_gpu = runs_per_gpu
+        self.min_vram = min_vram
+        self.priorities = dict(priorities or {})
+        self.gpu_monitor = gpu_monitor if gpu_monitor is not None else GPUMonitor()
+        self.dispatch_interval = dispatch_interval
+
+        self.pending = []  # (request time, task, conn, job_id, name)
+        self.leases = {}  # (conn, job_id) -> {'task', 'gpu', 'name', 'start', 'reservation'}
+        self.gpu_seconds = {}  # task -> GPU time of finished jobs
+        self.granted = {}  # task -> number of slots granted so far
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
+        self._listener = Listener(address, authkey=authkey)
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._dispatch_loop, daemon=True).start()
+
+    def close(self):
+        self._closed.set()
+        self._listener.close()
+
+    def _accept_loop(self):
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError):
+                # Closed, or a client that failed authentication
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        task = None
+        try:
+            while True:
+                message = conn.recv()
+                with self._lock:
+                    if 'task' in message:
+                        task = message['task']
+                    elif 'acquire' in message:
+                        self.pending.append((time.time(), task, conn, message['acquire'], message.get('name')))
+                        self._dispatch()
+                    elif 'started' in message:
+                        lease = self.leases.get((conn, message['started']))
+                        if lease is not None:
+                            lease['reservation'].pid = message['pid']
+                    elif 'release' in message:
+                        self._release(conn, message['release'])
+                        self._dispatch()
+        except (EOFError, OSError):
+            pass
+        # The Eureka run exited (or crashed), its slots are free again
+        with self._lock:
+            self.pending = [request for request in self.pending if request[2] is not conn]
+            for lease_conn, job_id in list(self.leases):
+                if lease_conn is conn:
+                    self._release(conn, job_id)
+            self._dispatch()
+        conn.close()
+
+    def _release(self, conn, job_id):
+        lease = self.leases.pop((conn, job_id), None)
+        if lease is not None:
+            self.gpu_monitor.release(lease['reservation'])
+            self.gpu_seconds[lease['task']] = self.gpu_seconds.get(lease['task'], 0.) + time.time() - lease['start']
+
+    def _held(self, task):
+        return sum(1 for lease in self.leases.values() if lease['task'] == task)
+
+    def _pick_gpu(self):
+        free_vram = self.gpu_monitor.free_vram()
+        candidates = []
+        for gpu, free_gb in free_vram.items():
+            runs = sum(1 for lease in self.leases.values() if lease['gpu'] == gpu)
+            if (self.gpus is None or gpu in self.gpus) and free_gb >= self.min_vram and runs < self.runs_per_gpu:
+                candidates.append((free_gb, -runs, gpu))
+        return max(candidates)[2] if candidates else None
+
+    def _fair_share_key(self, request):
+        request_time, task = request[0], request[1]
+        weight = float(self.priorities.get(task, 1))
+        return self._held(task) / weight, self.gpu_seconds.get(task, 0.) / weight, request_time
+
+    def _dispatch(self):
+        while self.pending:
+            gpu = self._pick_gpu()
+            if gpu is None:
+                return
+            request = min(self.pending, key=self._fair_share_key)
+            self.pending.remove(request)
+            _, task, conn, job_id, name = request
+            try:
+                conn.send({'grant': job_id, 'gpu': gpu})
+            except OSError:
+                continue
+            self.leases[(conn, job_id)] = {
+                'task': task, 'gpu': gpu, 'name': name, 'start': time.time(),
+                'reservation': self.gpu_monitor.reserve(gpu, self.min_vram),
+            }
+            self.granted[task] = self.granted.get(task, 0) + 1
+            logging.info(f"Campaign: GPU {gpu} -> {task}: {name} ({self._held(task)} running, {len(self.pending)} waiting)")
+
+    def _dispatch_loop(self):
+        # Requests left waiting for VRAM are retried as the readings change
+        while not self._closed.wait(self.dispatch_interval):
+            with self._lock:
+                self._dispatch()
+
+
+class SlotClient:
+    """
+    Client side of a `SlotBroker`, used by `TrainingScheduler` (`slots`) instead of picking GPUs itself.
+
+    Args:
+        address (str): Socket of the broker
+        authkey (bytes): Shared secret, by default read from $EUREKA_CAMPAIGN_AUTHKEY (hex)
+        task (str): Name the broker accounts this run's slots to
+    """
+    def __init__(self, address, task, authkey=None):
+        authkey = authkey if authkey is not None else bytes.fromhex(os.environ[AUTHKEY_ENV])
+        self.conn = Client(address, authkey=authkey)
+        self.conn.send({'task': task})
+        self._ids = {}  # job -> id
+        self._next_id = itertools.count()
+        self._grants = {}  # id -> gpu
+
+    def acquire(self, job):
+        """GPU granted to `job`, None while the request is still waiting"""
+        if job not in self._ids:
+            self._ids[job] = next(self._next_id)
+            self.conn.send({'acquire': self._ids[job], 'name': job.name})
+        while self.conn.poll():
+            message = self.conn.recv()
+            self._grants[message['grant']] = message['gpu']
+        return self._grants.pop(self._ids[job], None)
+
+    def started(self, job):
+        pid = getattr(job.process, 'pid', None)
+        if job in self._ids and pid is not None:
+            self.conn.send({'started': self._ids[job], 'pid': pid})
+
+    def release(self, job):
+        if job in self._ids:
+            self.conn.send({'release': self._ids.pop(job)})
+
+
+def summarize_task(task, workspace, returncode=None):
+    """
+    Row of the campaign results table, read from the workspace of the task's Eureka run.
+
+    Returns:
+        dict: best training success and the final evaluation statistics (NaN where the run did not get there)
+    """
+    row = {'task': task, 'workspace': workspace, 'returncode': returncode, 'iterations': 0,
+           'best_train_success': float('nan'), 'final_success_mean': float('nan'), 'final_success_std': float('nan'),
+           'final_success_ci_low': float('nan'), 'final_success_ci_high': float('nan'), 'num_eval': 0}
+    journal_path = os.path.join(workspace, JOURNAL_NAME)
+    if os.path.exists(journal_path):
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record['type'] == 'iteration':
+                    row['iterations'] = record['iter'] + 1
+                    row['best_train_success'] = record['state']['max_success_overall']
+    eval_path = os.path.join(workspace, 'final_eval.npz')
+    if os.path.exists(eval_path):
+        final_eval = np.load(eval_path)
+        row['num_eval'] = len(final_eval['reward_code_final_successes'])
+        if 'success_mean' in final_eval:
+            row['final_success_mean'] = float(final_eval['success_mean'])
+            row['final_success_std'] = float(final_eval['success_std'])
+            row['final_success_ci_low'], row['final_success_ci_high'] = map(float, final_eval['success_ci'])
+        elif row['num_eval']:
+            row['final_success_mean'] = float(np.mean(final_eval['reward_code_final_successes']))
+            row['final_success_std'] = float(np.std(final_eval['reward_code_final_successes']))
+    return row
+
+
+def write_results_table(rows, csv_path, markdown_path):
+    """Write the campaign results as CSV and as a markdown table, returns the markdown"""
+    columns = list(rows[0].keys()) if rows else []
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    def fmt(value):
+        return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+    shown = [column for column in columns if column != 'workspace']
+    lines = ['| ' + ' | '.join(shown) + ' |', '|' + '---|' * len(shown)]
+    lines += ['| ' + ' | '.join(fmt(row[column]) for column in shown) + ' |' for row in rows]
+    table = '\n'.join(lines) + '\n'
+    with open(markdown_path, 'w') as f:
+        f.write(table)
+    return table
@@ -0,0 +1,134 @@
+import ast
+import math
+from collections import Counter
+
+
+def constant_bucket(value):
+    """Order of magnitude (and sign) of a number, constants in the same bucket count as equal"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    if value == 0 or not math.isfinite(value):
+        return value
+    return ('-' if value < 0 else '+', math.floor(math.log10(abs(value))))
+
+
+class _Canonicalizer(ast.NodeTransformer):
+    """
+    Renames what the reward function binds (arguments, locals) to positional placeholders, buckets
+    numeric constants and blanks strings (e.g. reward component names). Module-level names such as
+    `torch` and attribute names are kept, they carry the meaning of the code.
+    """
+    def __init__(self, bound):
+        self.bound = bound
+        self.names = {}
+
+    def _rename(self, name):
+        if name not in self.bound:
+            return name
+        if name not in self.names:
+            self.names[name] = f"v{len(self.names)}"
+        return self.names[name]
+
+    def visit_FunctionDef(self, node):
+        node.name = 'f'
+        node.decorator_list = []
+        node.returns = None
+        body = node.body
+        if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                and isinstance(body[0].value.value, str):
+            node.body = body[1:] or [ast.Pass()]
+        self.generic_visit(node)
+        return node
+
+    def visit_arg(self, node):
+        node.arg = self._rename(node.arg)
+        node.annotation = None
+        return node
+
+    def visit_Name(self, node):
+        node.id = self._rename(node.id)
+        return node
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, str):
+            return ast.Constant(value='')
+        return ast.Constant(value=repr(constant_bucket(node.value)))
+
+    def visit_AnnAssign(self, node):
+        # Type annotations of locals do not change what is computed
+        if node.value is None:
+            return None
+        return ast.copy_location(ast.Assign(targets=[node.target], value=node.value), node)
+
+
+def _bound_names(module):
+    bound = set()
+    for node in ast.walk(module):
+        if isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            bound.add(node.id)
+    return bound
+
+
+def canonicalize_reward(code_string):
+    """
+    Canonical form of a reward function, the same for functions that only differ in naming,
+    formatting, comments, type annotations or constants of the same order of magnitude.
+
+    Returns:
+        tuple: (canonical dump of the whole function, Counter of the canonical dumps of its statements)
+    """
+    module = ast.parse(code_string)
+    module = _Canonicalizer(_bound_names(module)).visit(module)
+    ast.fix_missing_locations(module)
+    statements = Counter(
+        ast.dump(node, annotate_fields=False, include_attributes=False)
+        for node in ast.walk(module) if isinstance(node, ast.stmt) and not isinstance(node, ast.FunctionDef)
+    )
+    return ast.dump(module, annotate_fields=False, include_attributes=False), statements
+
+
+def similarity(statements_a, statements_b):
+    """Jaccard similarity of two statement multisets, 1.0 for the same canonical statements"""
+    union = sum((statements_a | statements_b).values())
+    return sum((statements_a & statements_b).values()) / union if union else 1.0
+
+
+class RewardDeduplicator:
+    """
+    Clusters the reward candidates of an iteration as they arrive.
+
+    The first candidate of a cluster is its representative and gets trained. A later candidate joins
+    the cluster of the first representative it matches, i.e. has the same canonical form or, below
+    a `threshold` of 1, canonical statements at least that similar (see `similarity`).
+
+    Args:
+        threshold (float): Similarity from which a candidate is a duplicate of a representative
+    """
+    def __init__(self, threshold=1.0):
+        self.threshold = threshold
+        self.representatives = []  # (response_id, canonical, statements)
+        self.clusters = {}  # representative response_id -> response_ids of its duplicates
+
+    def check(self, response_id, code_string):
+        """
+        Returns:
+            int: response_id of the representative `code_string` duplicates, None if it starts a new cluster
+        """
+        try:
+            canonical, statements = canonicalize_reward(code_string)
+        except SyntaxError:
+            # Left for the training run to report
+            return None
+        for rep_id, rep_canonical, rep_statements in self.representatives:
+            if canonical == rep_canonical or (self.threshold < 1. and similarity(statements, rep_statements) >= self.threshold):
+                self.clusters[rep_id].append(response_id)
+                return rep_id
+        self.representatives.append((response_id, canonical, statements))
+        self.clusters[response_id] = []
+        return None
+
+    @property
+    def num_duplicates(self):
+        return sum(len(members) for members in self.clusters.values())
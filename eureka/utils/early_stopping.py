@@ -0,0 +1,94 @@
+import logging
+import re
+import time
+
+import numpy as np
+import yaml
+
+from utils.tb_reader import ScalarIndex
+
+
+def get_expected_epochs(train_cfg_path, max_iterations=''):
+    """Number of epochs a run trains for: `max_iterations` if set, else the default of the train config"""
+    if max_iterations != '' and max_iterations is not None:
+        return int(max_iterations)
+    with open(train_cfg_path, 'r') as f:
+        max_epochs = yaml.safe_load(f)['params']['config']['max_epochs']
+    if isinstance(max_epochs, int):
+        return max_epochs
+    # e.g. ${resolve_default:20000,${....max_iterations}}
+    match = re.search(r'resolve_default:\s*(\d+)', str(max_epochs))
+    return int(match.group(1)) if match else None
+
+
+class MedianStoppingMonitor:
+    """
+    Stops training runs that are clearly dominated by the other runs of their group.
+
+    Every `interval` seconds the monitor reads the scalars of the running jobs. Once a run has trained
+    for `grace` (fraction of `expected_epochs`, or absolute epochs if no total is known), its best
+    `metric` so far is compared with the best values that at least `min_peers` other runs of the same
+    group reached within the same number of epochs. A run whose best value is below the median of
+    its peers (by more than `margin`) is terminated, the truncated curve is kept for its feedback.
+
+    Jobs without a `group` (e.g. final evaluation runs) are never stopped.
+    """
+    def __init__(self, metric='consecutive_successes', expected_epochs=None, grace=0.2, min_peers=3,
+                 interval=60.0, margin=0.0):
+        self.metric = metric
+        self.expected_epochs = expected_epochs
+        self.min_epochs = int(grace * expected_epochs) if expected_epochs and grace < 1 else int(grace)
+        self.min_peers = min_peers
+        self.interval = interval
+        self.margin = margin
+
+        self.curves = {}  # job -> values of `metric` read so far
+        self.readers = {}  # job -> incremental reader of its summaries
+        self._last_check = 0.
+
+    def _read_curve(self, job):
+        if job.tailer is None or job.tailer.tensorboard_dir is None:
+            return
+        if job not in self.readers:
+            self.readers[job] = ScalarIndex(job.tailer.tensorboard_dir, persist=False)
+        try:
+            self.readers[job].update()
+        except Exception as e:
+            logging.info(f"Early stopping: could not read scalars of {job.name}: {e}")
+            return
+        _, values = self.readers[job].scalars(self.metric)
+        if len(values):
+            self.curves[job] = values.astype(np.float64)
+
+    def check(self, job):
+        """Return (stop, best, median) for a job with a known curve"""
+        curve = self.curves.get(job)
+        if curve is None or len(curve) < max(self.min_epochs, 1):
+            return False, None, None
+        epochs = len(curve)
+        peer_bests = [
+            other_curve[:epochs].max() for other, other_curve in self.curves.items()
+            if other is not job and other.group == job.group and len(other_curve) >= epochs
+        ]
+        if len(peer_bests) < self.min_peers:
+            return False, None, None
+        best = curve.max()
+        median = float(np.median(peer_bests))
+        return bool(best < median - self.margin), float(best), median
+
+    def poll(self, jobs):
+        """Read fresh scalars of the running jobs and terminate the dominated ones"""
+        if time.time() - self._last_check < self.interval:
+            return
+        self._last_check = time.time()
+
+        running = [job for job in jobs if job.group is not None and job.state == 'running']
+        for job in running:
+            self._read_curve(job)
+        for job in running:
+            stop, best, median = self.check(job)
+            if stop and job.process.poll() is None:
+                job.stop_reason = {'epochs': len(self.curves[job]), 'best': best, 'median': median}
+                logging.info(f"Early stopping: {job.name} after {len(self.curves[job])} epochs, "
+                             f"best {self.metric} {best:.2f} < peer median {median:.2f}")
+                job.process.terminate()
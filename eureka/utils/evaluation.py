@@ -0,0 +1,146 @@
+import logging
+import math
+
+import numpy as np
+
+try:
+    from scipy import stats as scipy_stats
+except ImportError:
+    scipy_stats = None
+
+from utils.file_utils import load_tensorboard_logs
+from utils.misc import filter_traceback
+
+# Two-sided 95% quantiles of Student's t distribution by degrees of freedom, used without scipy
+_T95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def t_quantile(level, df):
+    """Two-sided critical value of Student's t distribution"""
+    if scipy_stats is not None:
+        return float(scipy_stats.t.ppf(0.5 + level / 2, df))
+    if level != 0.95:
+        raise ValueError("Confidence levels other than 0.95 require scipy")
+    return _T95[df - 1] if df <= len(_T95) else 1.96
+
+
+class RunningStats:
+    """Mean and variance updated one value at a time (Welford's algorithm)"""
+    def __init__(self):
+        self.n = 0
+        self._mean = 0.
+        self._m2 = 0.
+
+    def add(self, value):
+        self.n += 1
+        delta = value - self._mean
+        self._mean += delta / self.n
+        self._m2 += delta * (value - self._mean)
+
+    @property
+    def mean(self):
+        """NaN until a value was added, e.g. when every seed failed"""
+        return self._mean if self.n else float('nan')
+
+    @property
+    def std(self):
+        """Population standard deviation, as `np.std`"""
+        return math.sqrt(self._m2 / self.n) if self.n else float('nan')
+
+    @property
+    def sample_std(self):
+        return math.sqrt(self._m2 / (self.n - 1)) if self.n > 1 else float('nan')
+
+    def confidence_interval(self, level=0.95):
+        """(low, high) interval for the mean, NaN until two values were added"""
+        if self.n < 2:
+            return float('nan'), float('nan')
+        half_width = t_quantile(level, self.n - 1) * self.sample_std / math.sqrt(self.n)
+        return self._mean - half_width, self._mean + half_width
+
+
+class SeedEvaluator:
+    """
+    Trains the final reward function with several seeds at once and summarizes results as they finish.
+
+    The seed runs are `TrainingJob`s submitted to a `TrainingScheduler`, which spreads them over the
+    GPUs. Each finished run is read right away and folded into running statistics of the max task
+    score (and of the correlation between the ground-truth and the generated reward), which are
+    written to `output_path` after every run.
+
+    Args:
+        scheduler (TrainingScheduler): Runs the seed jobs
+        metric (str): Scalar whose maximum is the task score of a run
+        output_path (str): .npz file receiving the results so far
+        level (float): Confidence level of the interval of the mean
+        on_result (callable): Called with (seed, job, tensorboard logs) as each seed is collected, logs are
+            empty for failed seeds
+    """
+    def __init__(self, scheduler, metric='consecutive_successes', output_path='final_eval.npz', level=0.95,
+                 on_result=None):
+        self.scheduler = scheduler
+        self.metric = metric
+        self.output_path = output_path
+        self.level = level
+        self.on_result = on_result
+        self.jobs = {}  # seed -> job
+        self.successes = {}  # seed -> max metric
+        self.correlations = {}  # seed -> reward correlation
+        self.failed = []
+        self.success_stats = RunningStats()
+        self.correlation_stats = RunningStats()
+
+    def add(self, seed, job):
+        """Evaluate `seed` with `job`, which may also be already running or finished (see `utils.run_journal`)"""
+        self.jobs[seed] = job
+        if job.state == 'queued':
+            self.scheduler.submit(job)
+
+    def _collect(self, seed, job):
+        with open(job.log_path, 'r', errors='replace') as f:
+            traceback_msg = filter_traceback(f.read())
+        logs = load_tensorboard_logs(job.tailer.tensorboard_dir) \
+            if traceback_msg == '' and job.tailer.tensorboard_dir else {}
+        if self.metric not in logs:
+            self.failed.append(seed)
+            logging.info(f"Final eval: seed {seed} failed, see {job.log_path}")
+            if self.on_result is not None:
+                self.on_result(seed, job, {})
+            return
+        self.successes[seed] = max(logs[self.metric])
+        self.success_stats.add(self.successes[seed])
+        if "gt_reward" in logs and "gpt_reward" in logs:
+            self.correlations[seed] = np.corrcoef(np.array(logs["gt_reward"]), np.array(logs["gpt_reward"]))[0, 1]
+            self.correlation_stats.add(self.correlations[seed])
+        low, high = self.success_stats.confidence_interval(self.level)
+        logging.info(f"Final eval: seed {seed} success {self.successes[seed]:.2f}, "
+                     f"{self.success_stats.n}/{len(self.jobs)} done, mean {self.success_stats.mean:.2f}, "
+                     f"{int(self.level * 100)}% CI [{low:.2f}, {high:.2f}]")
+        self.save()
+        if self.on_result is not None:
+            self.on_result(seed, job, logs)
+
+    def save(self):
+        seeds = sorted(self.successes)
+        np.savez(self.output_path,
+                 reward_code_final_successes=[self.successes[seed] for seed in seeds],
+                 reward_code_correlations_final=[self.correlations[seed] for seed in sorted(self.correlations)],
+                 seeds=seeds,
+                 success_mean=self.success_stats.mean, success_std=self.success_stats.std,
+                 success_ci=self.success_stats.confidence_interval(self.level))
+
+    def run(self):
+        """Pump the scheduler until every seed has finished, collecting results in order of completion"""
+        pending = dict(self.jobs)
+        while pending:
+            self.scheduler.step()
+            for seed, job in list(pending.items()):
+                if job.done:
+                    del pending[seed]
+                    self._collect(seed, job)
+            if pending:
+                self.scheduler.watcher.wait(self.scheduler.poll_interval)
+        return [self.successes[seed] for seed in sorted(self.successes)], \
+            [self.correlations[seed] for seed in sorted(self.correlations)]
@@ -104,3 +104,16 @@ def get_function_signature(code_string):
         input_lst.append(arg.arg)
     return signature, input_lst
 
+
+def normalize_reward_code(code_string):
+    # Canonical dump of the code's AST, independent of formatting, comments, docstrings and decorators
+    module = ast.parse(code_string)
+    for node in ast.walk(module):
+        if isinstance(node, (ast.Module, ast.FunctionDef, ast.ClassDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                node.body = body[1:] or [ast.Pass()]
+        if isinstance(node, ast.FunctionDef):
+            node.decorator_list = []
+    return ast.dump(module, annotate_fields=False, include_attributes=False)
@@ -0,0 +1,203 @@
+import logging
+import math
+import time
+
+from utils.tb_reader import ScalarIndex
+
+
+class DownsampledSeries:
+    """
+    Bounded summary of a scalar curve of unknown length: count, min, max, sum and downsampled points.
+
+    Points are kept at the multiples of a stride that doubles whenever more than `capacity` are
+    kept, so `every(freq)` returns the values at the multiples of `freq` exactly when `freq` is a
+    multiple of the stride and the closest earlier kept point otherwise. With `expected_length`, the
+    points at the multiples of `expected_length // num_points` are kept as well, which are the ones
+    the feedback shows for a run that trains for its full length.
+    """
+    def __init__(self, capacity=128, expected_length=None, num_points=10):
+        self.capacity = capacity
+        self.count = 0
+        self.total = 0.
+        self.min = math.inf
+        self.max = -math.inf
+        self.stride = 1
+        self.kept = {}  # index -> value, at the multiples of `stride`
+        self.exact_freq = max(expected_length // num_points, 1) if expected_length else None
+        self.exact = {}  # index -> value, at the multiples of `exact_freq`
+
+    def add(self, value):
+        index = self.count
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if self.exact_freq is not None and index % self.exact_freq == 0:
+            self.exact[index] = value
+        if index % self.stride == 0:
+            self.kept[index] = value
+            if len(self.kept) > self.capacity:
+                self.stride *= 2
+                self.kept = {i: v for i, v in self.kept.items() if i % self.stride == 0}
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else math.nan
+
+    def every(self, freq):
+        """Values at every `freq`-th point, as `values[::freq]` of the full curve"""
+        if freq == self.exact_freq:
+            return [self.exact[i] for i in range(0, self.count, freq)]
+        return [self.kept[i - i % self.stride] for i in range(0, self.count, freq)]
+
+    def points(self):
+        """Kept (index, value) points in order"""
+        return sorted({**self.kept, **self.exact}.items())
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'count': self.count, 'total': self.total, 'min': self.min,
+                'max': self.max, 'stride': self.stride, 'kept': list(self.kept.items()),
+                'exact_freq': self.exact_freq, 'exact': list(self.exact.items())}
+
+    @classmethod
+    def from_dict(cls, data):
+        series = cls(data['capacity'])
+        for name in ('count', 'total', 'min', 'max', 'stride', 'exact_freq'):
+            setattr(series, name, data[name])
+        series.kept = {int(i): v for i, v in data['kept']}
+        series.exact = {int(i): v for i, v in data['exact']}
+        return series
+
+
+class StreamingCorrelation:
+    """Pearson correlation of two curves written at the same steps, from running sums"""
+    def __init__(self):
+        self.n = 0
+        self.sums = [0.] * 5  # x, y, xx, yy, xy
+        self._pending = ({}, {})  # step -> value of x and y points whose partner was not read yet
+
+    def add(self, which, step, value):
+        own, other = self._pending[which], self._pending[1 - which]
+        if step not in other:
+            own[step] = value
+            return
+        x, y = (value, other.pop(step)) if which == 0 else (other.pop(step), value)
+        self.n += 1
+        for i, term in enumerate((x, y, x * x, y * y, x * y)):
+            self.sums[i] += term
+
+    @property
+    def value(self):
+        sx, sy, sxx, syy, sxy = self.sums
+        var_x, var_y = self.n * sxx - sx * sx, self.n * syy - sy * sy
+        if self.n < 2 or var_x <= 0 or var_y <= 0:
+            return math.nan
+        return (self.n * sxy - sx * sy) / math.sqrt(var_x * var_y)
+
+
+class MetricsSummary:
+    """
+    Everything the policy feedback needs from a run's scalars, in memory independent of its length.
+
+    Holds a `DownsampledSeries` per tag and the correlation between `gt_reward` and `gpt_reward`.
+
+    Args:
+        expected_epochs (int): Epochs of a full run, makes the feedback points of full runs exact
+        capacity (int): Max number of downsampled points kept per tag
+    """
+    def __init__(self, expected_epochs=None, capacity=128):
+        self.expected_epochs = expected_epochs
+        self.capacity = capacity
+        self.series = {}
+        self.correlation = StreamingCorrelation()
+
+    def add(self, tag, points, expected_length=None):
+        """Fold `points` ((step, value) pairs) into the tag's series, `expected_length` overrides `expected_epochs`"""
+        if tag not in self.series:
+            self.series[tag] = DownsampledSeries(self.capacity, expected_length or self.expected_epochs)
+        series = self.series[tag]
+        for step, value in points:
+            series.add(value)
+            if tag in ('gt_reward', 'gpt_reward'):
+                self.correlation.add(0 if tag == 'gt_reward' else 1, step, value)
+
+    def update(self, reader):
+        """Add the points written since the last update, `reader` is a `ScalarIndex`"""
+        for tag, points in reader.read_new().items():
+            self.add(tag, points)
+
+    def __contains__(self, tag):
+        return tag in self.series
+
+    def __getitem__(self, tag):
+        return self.series[tag]
+
+    def __iter__(self):
+        return iter(self.series)
+
+    def points(self):
+        """Tag -> kept (epoch, value) points, e.g. for `utils.results_db`"""
+        return {tag: series.points() for tag, series in self.series.items()}
+
+    @classmethod
+    def from_logs(cls, tensorboard_logs):
+        """Summary of complete curves, tag -> list of values as returned by `load_tensorboard_logs`"""
+        summary = cls()
+        for tag, values in tensorboard_logs.items():
+            # The curves are complete, their own lengths make the feedback points exact
+            summary.add(tag, enumerate(values), expected_length=len(values))
+        return summary
+
+    def to_dict(self):
+        return {'correlation': self.correlation.sums + [self.correlation.n],
+                'series': {tag: series.to_dict() for tag, series in self.series.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls()
+        summary.series = {tag: DownsampledSeries.from_dict(series) for tag, series in data['series'].items()}
+        summary.correlation.sums, summary.correlation.n = data['correlation'][:5], data['correlation'][5]
+        return summary
+
+
+class FeedbackMonitor:
+    """
+    Scheduler monitor that folds the scalars of running jobs into their `MetricsSummary` while they
+    train, so that the feedback of a run is ready as soon as it finishes (see `summary`).
+
+    Args:
+        expected_epochs (int): See `MetricsSummary`
+        interval (float): Seconds between reads of the running jobs' event files
+    """
+    def __init__(self, expected_epochs=None, interval=30.0):
+        self.expected_epochs = expected_epochs
+        self.interval = interval
+        self.readers = {}  # job -> (ScalarIndex, MetricsSummary)
+        self._last_check = 0.
+
+    def _read(self, job):
+        if job.tailer is None or job.tailer.tensorboard_dir is None:
+            return None
+        if job not in self.readers:
+            self.readers[job] = (ScalarIndex(job.tailer.tensorboard_dir, persist=False),
+                                 MetricsSummary(self.expected_epochs))
+        reader, summary = self.readers[job]
+        try:
+            summary.update(reader)
+        except Exception as e:
+            logging.info(f"Feedback: could not read scalars of {job.name}: {e}")
+        return summary
+
+    def poll(self, jobs):
+        if time.time() - self._last_check < self.interval:
+            return
+        self._last_check = time.time()
+        for job in jobs:
+            if job.state == 'running':
+                self._read(job)
+
+    def summary(self, job):
+        """Summary of a finished job, reading what it wrote since the last poll"""
+        summary = self._read(job)
+        self.readers.pop(job, None)
+        return summary
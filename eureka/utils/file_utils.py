@@ -1,7 +1,8 @@
 import os
-from tensorboard.backend.event_processing.event_accumulator import EventAccumulator
 from collections import defaultdict
 
+from .tb_reader import ScalarIndex  # relative: also imported as eureka.utils.file_utils
+
 def find_files_with_substring(directory, substring):
     matches = []
     for root, dirs, files in os.walk(directory):
@@ -11,16 +12,10 @@ def find_files_with_substring(directory, substring):
     return matches
 
 def load_tensorboard_logs(path):
-    data = defaultdict(list)
-    event_acc = EventAccumulator(path)
-    event_acc.Reload()  # Load all data written so far
-
-    for tag in event_acc.Tags()["scalars"]:
-        events = event_acc.Scalars(tag)
-        for event in events:
-            data[tag].append(event.value)
-    
-    return data
+    # Only parses what was written since the index stored next to the event files was last updated
+    index = ScalarIndex(path)
+    index.update()
+    return defaultdict(list, index.values_dict())
 
 import importlib.util
 
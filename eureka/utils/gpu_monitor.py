@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import namedtuple
+
+GB = 1024 ** 3
+FAKE_GPUS_ENV = 'EUREKA_FAKE_GPUS'
+
+# Memory in GB, utilization in percent, processes: pid -> GB used on the GPU
+GPUStatus = namedtuple('GPUStatus', ['index', 'total_gb', 'free_gb', 'utilization', 'processes'])
+
+
+class NVMLBackend:
+    """Reads the GPUs through NVML in-process (`pip install nvidia-ml-py`)"""
+    def __init__(self):
+        import pynvml
+        pynvml.nvmlInit()
+        self.nvml = pynvml
+        # Raised by the readings, e.g. on a transient driver failure
+        self.errors = (pynvml.NVMLError,)
+        self.handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+
+    def read(self):
+        statuses = {}
+        for index, handle in enumerate(self.handles):
+            memory = self.nvml.nvmlDeviceGetMemoryInfo(handle)
+            try:
+                utilization = self.nvml.nvmlDeviceGetUtilizationRates(handle).gpu
+            except self.nvml.NVMLError:
+                utilization = None
+            processes = {}
+            try:
+                for process in self.nvml.nvmlDeviceGetComputeRunningProcesses(handle):
+                    # usedGpuMemory is None where the driver does not report it (e.g. WSL)
+                    processes[process.pid] = (process.usedGpuMemory or 0) / GB
+            except self.nvml.NVMLError:
+                pass
+            statuses[index] = GPUStatus(index, memory.total / GB, memory.free / GB, utilization, processes)
+        return statuses
+
+
+class SMIBackend:
+    """Falls back to two nvidia-smi calls per reading (GPUs, then their processes) when NVML bindings are not installed"""
+    def read(self):
+        result = subprocess.check_output(
+            ['nvidia-smi', '--query-gpu=index,uuid,memory.total,memory.free,utilization.gpu',
+             '--format=csv,nounits,noheader'],
+            encoding='utf-8'
+        )
+        statuses = {}
+        indices = {}  # uuid -> index
+        for line in result.strip().split('\n'):
+            index, uuid, total, free, utilization = [field.strip() for field in line.split(',')]
+            indices[uuid] = int(index)
+            statuses[int(index)] = GPUStatus(int(index), int(total) / 1024.0, int(free) / 1024.0,
+                                             int(utilization) if utilization.isdigit() else None, {})
+        # Per-process usage, so that reservations end once their run has allocated its memory
+        result = subprocess.check_output(
+            ['nvidia-smi', '--query-compute-apps=gpu_uuid,pid,used_memory', '--format=csv,nounits,noheader'],
+            encoding='utf-8'
+        )
+        for line in result.strip().split('\n'):
+            if not line.strip():
+                continue
+            uuid, pid, used = [field.strip() for field in line.split(',')]
+            if uuid in indices:
+                # used_memory is "[N/A]" where the driver does not report it (e.g. WSL)
+                statuses[indices[uuid]].processes[int(pid)] = int(used) / 1024.0 if used.isdigit() else 0.
+        return statuses
+
+
+class FileBackend:
+    """
+    Reads fake GPUs from a JSON file, re-read on every reading so tests can edit it while Eureka runs.
+
+    Format: {"gpus": [{"index": 0, "total_gb": 24, "free_gb": 20, "utilization": 5, "processes": {"1234": 2.5}}]}
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        with open(self.path, 'r') as f:
+            gpus = json.load(f)['gpus']
+        return {gpu['index']: GPUStatus(gpu['index'], gpu.get('total_gb', gpu['free_gb']), gpu['free_gb'],
+                                        gpu.get('utilization'),
+                                        {int(pid): gb for pid, gb in gpu.get('processes', {}).items()})
+                for gpu in gpus}
+
+
+def make_backend(fake_path=''):
+    """File backend if `fake_path` (or $EUREKA_FAKE_GPUS) is set, else NVML, else nvidia-smi"""
+    fake_path = fake_path or os.environ.get(FAKE_GPUS_ENV, '')
+    if fake_path:
+        return FileBackend(fake_path)
+    try:
+        return NVMLBackend()
+    except Exception as e:
+        logging.info(f"GPU monitor: NVML unavailable ({e}), falling back to nvidia-smi")
+        return SMIBackend()
+
+
+class Reservation:
+    def __init__(self, gpu, gb, pid, timeout):
+        self.gpu = gpu
+        self.gb = gb
+        self.pid = pid
+        self.deadline = time.time() + timeout
+
+
+class GPUMonitor:
+    """
+    Memory and utilization of the GPUs, read in-process and shared by every launch of an Eureka run.
+
+    A run that was just launched takes a while to allocate its memory, readings taken in the meantime
+    overstate the free memory. Launchers therefore `reserve` the VRAM a run is expected to use, and
+    `free_vram` subtracts the part of each reservation the run's process does not hold yet. A reservation
+    ends when it is released, once its process holds the reserved amount or after `reservation_timeout`.
+
+    Args:
+        backend: Object with `read()` returning {gpu: GPUStatus}, see `make_backend`
+        interval (float): Readings younger than this many seconds are reused
+        reservation_timeout (float): Seconds after which a reservation expires
+    """
+    def __init__(self, backend=None, interval=2.0, reservation_timeout=300.0):
+        self.backend = backend if backend is not None else make_backend()
+        self.interval = interval
+        self.reservation_timeout = reservation_timeout
+        self.reservations = []
+        self._statuses = {}
+        self._time = 0.
+        self._lock = threading.Lock()
+
+    def sample(self, max_age=None):
+        """
+        Current readings, reusing the previous ones if younger than `max_age` (default: `interval`).
+
+        Keeps the previous readings if the backend fails.
+        """
+        max_age = self.interval if max_age is None else max_age
+        errors = (OSError, ValueError, KeyError, subprocess.CalledProcessError) + getattr(self.backend, 'errors', ())
+        with self._lock:
+            if time.time() - self._time >= max_age:
+                try:
+                    self._statuses = self.backend.read()
+                    self._time = time.time()
+                except errors as e:
+                    logging.info(f"GPU monitor: could not read the GPUs ({e}), keeping previous readings")
+            return self._statuses
+
+    def reserve(self, gpu, gb, pid=None):
+        """Set `gb` of VRAM on `gpu` aside for the run of process `pid`"""
+        reservation = Reservation(gpu, gb, pid, self.reservation_timeout)
+        with self._lock:
+            self.reservations.append(reservation)
+        return reservation
+
+    def release(self, reservation):
+        with self._lock:
+            if reservation in self.reservations:
+                self.reservations.remove(reservation)
+
+    def _outstanding(self, reservation, status):
+        # The part of the reservation the process has not allocated yet
+        used = status.processes.get(reservation.pid, 0.) if reservation.pid is not None else 0.
+        return max(0., reservation.gb - used)
+
+    def free_vram(self, max_age=None):
+        """
+        Returns:
+            dict: GPU index -> free VRAM in GB, minus the VRAM reserved for runs that have not allocated it yet
+        """
+        statuses = self.sample(max_age)
+        now = time.time()
+        with self._lock:
+            free_vram = {gpu: status.free_gb for gpu, status in statuses.items()}
+            for reservation in list(self.reservations):
+                status = statuses.get(reservation.gpu)
+                outstanding = self._outstanding(reservation, status) if status is not None else 0.
+                if now > reservation.deadline or (status is not None and outstanding == 0.):
+                    self.reservations.remove(reservation)
+                elif reservation.gpu in free_vram:
+                    free_vram[reservation.gpu] -= outstanding
+        return free_vram
+
+    def freest_gpu(self):
+        free_vram = self.free_vram()
+        return max(free_vram, key=free_vram.get) if free_vram else None
+
+    def wait_for_free_vram(self, required_gb=8, check_interval=60):
+        """Block until a GPU has `required_gb` free and return its index"""
+        while True:
+            for gpu, free_gb in self.free_vram(max_age=0.).items():
+                if free_gb >= required_gb:
+                    return gpu
+            time.sleep(check_interval)
+
+
+def device_env(gpu, base=None):
+    """
+    Environment of a process that should run on `gpu` only, leaving `os.environ` untouched.
+
+    GPU indices follow NVML / nvidia-smi, which enumerate in PCI bus order, CUDA is told to do the same.
+    """
+    env = dict(os.environ if base is None else base)
+    env['CUDA_DEVICE_ORDER'] = 'PCI_BUS_ID'
+    env['CUDA_VISIBLE_DEVICES'] = str(gpu)
+    return env
+
+
+_default_monitor = None
+
+
+def default_monitor():
+    """Monitor shared by the helpers of `custom_utils` and `utils.misc`"""
+    global _default_monitor
+    if _default_monitor is None:
+        _default_monitor = GPUMonitor()
+    return _default_monitor
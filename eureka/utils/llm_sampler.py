@@ -0,0 +1,325 @@
+import asyncio
+import hashlib
+import json
+import logging
+import queue
+import random
+import threading
+import time
+
+SAMPLING_DONE = object()
+
+
+class SamplingError(RuntimeError):
+    pass
+
+
+def is_rate_limit(error):
+    return getattr(error, 'status_code', None) == 429 or 'RateLimit' in type(error).__name__
+
+
+def retry_after(error):
+    """Seconds the provider asked to wait before the next request, None if it did not say"""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def prompt_prefix_key(messages, num_stable):
+    """Fingerprint of the first `num_stable` messages, the part of the prompt that is the same in every request"""
+    return hashlib.sha256(json.dumps(messages[:num_stable], sort_keys=True).encode()).hexdigest()[:32]
+
+
+class LLMUsage:
+    """
+    Token usage and timing of the requests of one iteration.
+
+    Prices are in dollars per million tokens, `cached_input` applies to prompt tokens the provider
+    served from its prompt cache (reported as `usage.prompt_tokens_details.cached_tokens`).
+    """
+    def __init__(self, prices=None):
+        self.prices = dict(prices or {})
+        self.num_requests = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self.num_choices = 0
+        self.request_seconds = 0.
+        self.start = None
+        self.end = None
+
+    def add(self, usage, latency, num_choices, start):
+        """Account a response, `usage` may be None or partial where the provider does not report it"""
+        usage = usage or {}
+        self.num_requests += 1
+        self.num_choices += num_choices
+        self.prompt_tokens += usage.get("prompt_tokens") or 0
+        self.cached_prompt_tokens += (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        self.completion_tokens += usage.get("completion_tokens") or 0
+        self.request_seconds += latency
+        self.start = start if self.start is None else min(self.start, start)
+        self.end = time.monotonic()
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def tokens_per_second(self):
+        """Completion tokens per second of wall-clock time from the first request to the last response"""
+        return self.completion_tokens / (self.end - self.start) if self.end is not None and self.end > self.start else 0.
+
+    @property
+    def cost(self):
+        uncached = self.prompt_tokens - self.cached_prompt_tokens
+        return (uncached * self.prices.get('input', 0.) + self.cached_prompt_tokens * self.prices.get('cached_input', self.prices.get('input', 0.))
+                + self.completion_tokens * self.prices.get('output', 0.)) / 1e6
+
+    def summary(self, num_accepted=None):
+        text = (f"Requests: {self.num_requests} ({self.rate_limited} rate limited), Prompt Tokens: {self.prompt_tokens} "
+                f"({self.cached_prompt_tokens} cached), Completion Tokens: {self.completion_tokens}, "
+                f"Tokens/s: {self.tokens_per_second:.1f}")
+        if self.prices:
+            text += f", Cost: ${self.cost:.4f}"
+            if num_accepted:
+                text += f", Cost per accepted candidate: ${self.cost / num_accepted:.4f}"
+        return text
+
+
+class MockChatClient:
+    """
+    Local stand-in for `AsyncAzureOpenAI`, answers every request with canned responses.
+
+    Args:
+        responses (list): Response contents, cycled through across requests
+        latency (float): Seconds each request takes
+        failure_rate (float): Probability that a request raises, to exercise the retry path
+    """
+    def __init__(self, responses, latency=0.0, failure_rate=0.0):
+        self.responses = list(responses)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.num_requests = 0
+        self._next = 0
+        self.chat = _MockChat(self)
+
+    async def _create(self, model, messages, temperature=1.0, n=1, **kwargs):
+        self.num_requests += 1
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("Mock request failed")
+        choices = []
+        for i in range(n):
+            content = self.responses[self._next % len(self.responses)]
+            self._next += 1
+            choices.append({"index": i, "finish_reason": "stop", "message": {"role": "assistant", "content": content}})
+        prompt_tokens = sum(len(message["content"].split()) for message in messages)
+        completion_tokens = sum(len(choice["message"]["content"].split()) for choice in choices)
+        return _MockCompletion({
+            "model": model,
+            "choices": choices,
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+
+class _MockChat:
+    def __init__(self, client):
+        self.completions = _MockCompletions(client)
+
+
+class _MockCompletions:
+    def __init__(self, client):
+        self._client = client
+
+    async def create(self, **kwargs):
+        return await self._client._create(**kwargs)
+
+
+class _MockCompletion:
+    def __init__(self, data):
+        self._data = data
+
+    def model_dump_json(self):
+        return json.dumps(self._data)
+
+
+class AsyncSampler:
+    """
+    Issues chat completion requests concurrently and yields the choices as soon as they arrive.
+
+    Requests of `chunk_size` completions are kept in flight up to `concurrency` at a time and
+    started at most `requests_per_minute` times per minute (0 disables the limit). Failed requests
+    are retried with exponential backoff, a request that keeps failing has its `n` halved.
+
+    `chunk_size` adapts between 1 and `max_chunk_size`: a rate-limited request halves it (and waits
+    as long as the provider asks), a response slower than `target_latency` seconds shrinks it in
+    proportion, a faster one grows it by one. Usage is accounted in `usage` (see `LLMUsage`).
+
+    With `prompt_cache_key`, every request of a prompt carries a fingerprint of its first
+    `stable_messages` messages (`prompt_cache_key` of the OpenAI API), which routes requests sharing
+    that prefix to the same prompt cache.
+
+    The event loop runs in a background thread, `iter_samples()` exposes the samples to
+    synchronous code so that the caller can keep working (e.g. launching training runs) while
+    the remaining requests are still pending.
+    """
+    def __init__(self, client, model, temperature=1.0, chunk_size=4, concurrency=4, requests_per_minute=0,
+                 max_attempts=1000, base_delay=1.0, max_delay=60.0, max_chunk_size=None, target_latency=0.,
+                 prices=None, prompt_cache_key=False, stable_messages=2):
+        self.client = client
+        self.model = model
+        self.temperature = temperature
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size or chunk_size
+        self.target_latency = target_latency
+        self.prices = prices
+        self.prompt_cache_key = prompt_cache_key
+        self.stable_messages = stable_messages
+        self.concurrency = max(int(concurrency), 1)
+        self.requests_per_minute = requests_per_minute
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._loop = None
+        self._thread = None
+        self._rate_lock = None
+        self._last_request = 0.
+        self.reset_usage()
+
+    def reset_usage(self):
+        self.usage = LLMUsage(self.prices)
+
+    def _adapt(self, latency=None, rate_limited=False):
+        if rate_limited:
+            self.chunk_size = max(self.chunk_size // 2, 1)
+        elif self.target_latency and latency > self.target_latency:
+            self.chunk_size = max(min(int(self.chunk_size * self.target_latency / latency), self.chunk_size - 1), 1)
+        elif self.target_latency:
+            self.chunk_size = min(self.chunk_size + 1, self.max_chunk_size)
+
+    async def _throttle(self):
+        if not self.requests_per_minute:
+            return
+        async with self._rate_lock:
+            wait = self._last_request + 60. / self.requests_per_minute - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_request = time.monotonic()
+
+    async def _request(self, messages, n):
+        kwargs = {}
+        if self.prompt_cache_key:
+            kwargs['extra_body'] = {'prompt_cache_key': prompt_prefix_key(messages, self.stable_messages)}
+        for attempt in range(self.max_attempts):
+            await self._throttle()
+            wait = None
+            start = time.monotonic()
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.model,  # model should be your Azure deployment name
+                    messages=messages,
+                    temperature=self.temperature,
+                    n=n,
+                    **kwargs
+                )
+                # Convert Azure response to dictionary format using model_dump_json
+                response = json.loads(response.model_dump_json())
+            except Exception as e:
+                if is_rate_limit(e):
+                    self.usage.rate_limited += 1
+                    self._adapt(rate_limited=True)
+                    n = min(n, self.chunk_size)
+                    wait = retry_after(e)
+                elif attempt >= 10 and n > 1:
+                    n = max(int(n / 2), 1)
+                    logging.info(f"Current Chunk Size {n}")
+                logging.info(f"Attempt {attempt+1} failed with error: {e}")
+            else:
+                # Accounted once the response is in, a missing usage must not discard a paid completion
+                latency = time.monotonic() - start
+                self.usage.add(response.get("usage"), latency, len(response["choices"]), start)
+                self._adapt(latency)
+                return response
+            delay = min(self.base_delay * 2 ** min(attempt, 16), self.max_delay)
+            await asyncio.sleep(wait if wait is not None else delay * random.uniform(0.5, 1.0))
+        raise SamplingError("Code terminated due to too many failed attempts!")
+
+    async def _request_chunk(self, messages, n):
+        return n, await self._request(messages, n)
+
+    async def stream(self, messages, num_samples):
+        """Async generator over the first `num_samples` choices, in order of arrival"""
+        if self._rate_lock is None:
+            self._rate_lock = asyncio.Lock()
+        pending = set()
+        requested = 0
+        received = 0
+        try:
+            while received < num_samples:
+                while requested < num_samples and len(pending) < self.concurrency:
+                    n = min(self.chunk_size, num_samples - requested)
+                    requested += n
+                    pending.add(asyncio.ensure_future(self._request_chunk(messages, n)))
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    n, response = task.result()
+                    choices = response["choices"][:num_samples - received]
+                    # Chunks shrunk after repeated failures are made up for by later requests
+                    requested -= n - len(choices)
+                    received += len(choices)
+                    for choice in choices:
+                        yield choice
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _ensure_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+            self._thread.start()
+
+    def start(self, messages, num_samples):
+        """Start sampling in the background, choices are put on the returned queue as they arrive"""
+        self._ensure_loop()
+        samples = queue.Queue()
+
+        async def consume():
+            try:
+                async for choice in self.stream(messages, num_samples):
+                    samples.put(choice)
+                samples.put(SAMPLING_DONE)
+            except Exception as e:
+                samples.put(e)
+
+        asyncio.run_coroutine_threadsafe(consume(), self._loop)
+        return samples
+
+    def iter_samples(self, messages, num_samples, on_idle=None, poll_interval=1.0):
+        """
+        Yield choices as they arrive, calling `on_idle()` every `poll_interval` seconds while waiting.
+        """
+        samples = self.start(messages, num_samples)
+        while True:
+            try:
+                item = samples.get(timeout=poll_interval)
+            except queue.Empty:
+                if on_idle is not None:
+                    on_idle()
+                continue
+            if item is SAMPLING_DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
@@ -0,0 +1,118 @@
+import os
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+# Lifecycle events of a training run, derived from its stdout log
+LAUNCHED = 'launched'  # the process was started (emitted by the scheduler, not read from the log)
+STARTED = 'started'  # the run wrote its first output
+TRAINING = 'training'  # RL iterations are running ("fps step:" lines)
+ERROR = 'error'  # a traceback was printed
+FINISHED = 'finished'  # the process exited and its log was fully consumed
+
+
+class RunEvent:
+    def __init__(self, kind, name, line=''):
+        self.kind = kind
+        self.name = name
+        self.line = line
+
+    def __repr__(self):
+        return f"RunEvent({self.kind!r}, {self.name!r})"
+
+
+class LogTailer:
+    """
+    Incrementally reads a training log from the last consumed byte offset.
+
+    Each call to `poll()` only reads what was appended since the previous call and turns it into
+    lifecycle events, every event kind is emitted at most once per run.
+    """
+    def __init__(self, path, name=None):
+        self.path = path
+        self.name = name or path
+        self.offset = 0
+        self.tensorboard_dir = None
+        self._partial = ''
+        self._emitted = set()
+
+    def _emit(self, events, kind, line=''):
+        if kind not in self._emitted:
+            self._emitted.add(kind)
+            events.append(RunEvent(kind, self.name, line))
+
+    def read_new(self):
+        """Return the complete lines appended to the log since the last read"""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r', errors='replace') as f:
+            f.seek(self.offset)
+            chunk = f.read()
+            self.offset = f.tell()
+        if not chunk:
+            return []
+        lines = (self._partial + chunk).split('\n')
+        self._partial = lines.pop()
+        return lines
+
+    def poll(self, returncode=None):
+        """
+        Consume new output and return the lifecycle events it triggered.
+
+        Args:
+            returncode: Exit code of the process if it has terminated, None while it is running
+        """
+        events = []
+        lines = self.read_new()
+        if returncode is not None and self._partial:
+            lines.append(self._partial)
+            self._partial = ''
+        if lines or self.offset > 0:
+            self._emit(events, STARTED)
+        for line in lines:
+            if line.startswith('Tensorboard Directory:'):
+                self.tensorboard_dir = line.split(':')[-1].strip()
+            if "fps step:" in line:
+                self._emit(events, TRAINING, line)
+            if line.startswith('Traceback'):
+                self._emit(events, ERROR, line)
+        if returncode is not None:
+            self._emit(events, FINISHED, str(returncode))
+        return events
+
+
+class LogWatcher:
+    """
+    Sleeps until one of the watched logs is written to, or until the timeout expires.
+
+    Uses inotify when `inotify_simple` is installed and falls back to a plain sleep otherwise.
+    """
+    def __init__(self):
+        self._inotify = INotify() if INotify is not None else None
+        self._watches = {}
+
+    def add(self, path):
+        if self._inotify is None or path in self._watches:
+            return
+        try:
+            self._watches[path] = self._inotify.add_watch(path, flags.MODIFY | flags.CLOSE_WRITE)
+        except OSError:
+            # File not created yet, the timeout of the next wait covers it
+            pass
+
+    def remove(self, path):
+        wd = self._watches.pop(path, None)
+        if wd is not None:
+            try:
+                self._inotify.rm_watch(wd)
+            except OSError:
+                pass
+
+    def wait(self, timeout):
+        if self._inotify is None or not self._watches:
+            time.sleep(timeout)
+            return
+        self._inotify.read(timeout=int(timeout * 1000))
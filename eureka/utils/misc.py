@@ -1,22 +1,18 @@
-import subprocess
 import os
-import json
 import logging
+import time
 
-from utils.extract_task_code import file_to_string
+from utils.log_tailer import LogTailer, TRAINING, ERROR
+from utils.gpu_monitor import default_monitor
 
 def set_freest_gpu():
+    # Changes the device of every process launched afterwards, new launches pass `device_env(get_freest_gpu())` instead
     freest_gpu = get_freest_gpu()
     os.environ['CUDA_VISIBLE_DEVICES'] = str(freest_gpu)
 
 def get_freest_gpu():
-    sp = subprocess.Popen(['gpustat', '--json'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out_str, _ = sp.communicate()
-    gpustats = json.loads(out_str.decode('utf-8'))
-    # Find GPU with most free memory
-    freest_gpu = min(gpustats['gpus'], key=lambda x: x['memory.used'])
-
-    return freest_gpu['index']
+    # GPU with the most free memory, not counting memory reserved for runs that are still starting
+    return default_monitor().freest_gpu()
 
 def filter_traceback(s):
     lines = s.split('\n')
@@ -30,16 +26,18 @@ def filter_traceback(s):
             return '\n'.join(filtered_lines)
     return ''  # Return an empty string if no Traceback is found
 
-def block_until_training(rl_filepath, log_status=False, iter_num=-1, response_id=-1):
+def block_until_training(rl_filepath, log_status=False, iter_num=-1, response_id=-1, poll_interval=0.5):
     # Ensure that the RL training has started before moving on
+    tailer = LogTailer(rl_filepath)
     while True:
-        rl_log = file_to_string(rl_filepath)
-        if "fps step:" in rl_log or "Traceback" in rl_log:
-            if log_status and "fps step:" in rl_log:
+        kinds = [event.kind for event in tailer.poll()]
+        if TRAINING in kinds or ERROR in kinds:
+            if log_status and TRAINING in kinds:
                 logging.info(f"Iteration {iter_num}: Code Run {response_id} successfully training!")
-            if log_status and "Traceback" in rl_log:
+            if log_status and ERROR in kinds:
                 logging.info(f"Iteration {iter_num}: Code Run {response_id} execution error!")
             break
+        time.sleep(poll_interval)
 
 if __name__ == "__main__":
     print(get_freest_gpu())
\ No newline at end of file
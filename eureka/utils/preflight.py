@@ -0,0 +1,211 @@
+import ast
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import traceback
+
+import torch
+
+# Same imports the generated task file provides to the reward function
+PREFLIGHT_HEADER = "from typing import Tuple, Dict\nimport math\nimport torch\nfrom torch import Tensor\n"
+
+
+def _constant(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, int):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _constant(node.operand)
+        return -value if value is not None else None
+    return None
+
+
+def _index_shape(index):
+    """Shape of `tensor[index]` per batch env, None for dimensions that cannot be read off the code"""
+    if hasattr(ast, 'Index') and isinstance(index, ast.Index):  # python < 3.9
+        index = index.value
+    elements = index.elts if isinstance(index, ast.Tuple) else [index]
+    if len(elements) < 2:
+        # Only the env dimension is indexed, the remaining dimensions are unknown
+        return None
+    shape = [None] * (len(elements) - 2)
+    last = elements[-1]
+    if isinstance(last, ast.Slice):
+        lower = _constant(last.lower) if last.lower is not None else 0
+        upper = _constant(last.upper) if last.upper is not None else None
+        width = upper - lower if lower is not None and upper is not None and upper >= 0 else None
+        shape.append(width)
+    elif _constant(last) is None:
+        # Fancy indexing with a tensor of indices, e.g. self.rigid_body_states[:, self.fingertip_handles]
+        shape.append(None)
+    return shape
+
+
+def infer_attribute_shapes(obs_code_string):
+    """
+    Read the per-env shape of the attributes the observation code assigns by slicing, e.g.
+    `self.object_rot = self.root_state_tensor[self.object_indices, 3:7]` gives `object_rot: [4]`.
+    Dimensions that cannot be read off the code are None.
+    """
+    shapes = {}
+    for node in ast.walk(ast.parse(obs_code_string)):
+        if not isinstance(node, ast.Assign) or not isinstance(node.value, ast.Subscript):
+            continue
+        for target in node.targets:
+            if isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and target.value.id == 'self':
+                shape = _index_shape(node.value.slice)
+                if shape is not None:
+                    shapes[target.attr] = shape
+    return shapes
+
+
+def _reward_arguments(code_string):
+    function_def = next(node for node in ast.parse(code_string).body if isinstance(node, ast.FunctionDef))
+    arguments = []
+    for arg in function_def.args.args:
+        annotation = ast.unparse(arg.annotation) if arg.annotation is not None and hasattr(ast, 'unparse') \
+            else getattr(arg.annotation, 'id', None)
+        arguments.append((arg.arg, annotation))
+    return function_def.name, arguments
+
+
+def make_synthetic_inputs(arguments, attribute_shapes, num_envs=17, guess=None):
+    """
+    Build random CPU inputs for the reward arguments.
+
+    Dimensions missing from `attribute_shapes` are guessed: `guess()` returns the width of the next
+    guessed dimension (3 by default), a width of 0 drops the feature dimension of an argument whose
+    rank is unknown.
+
+    Returns the inputs and whether every tensor shape was known.
+    """
+    guess = guess if guess is not None else (lambda: 3)
+    inputs = []
+    confident = True
+    for name, annotation in arguments:
+        if annotation in ('float',):
+            inputs.append(1.0)
+        elif annotation in ('int',):
+            inputs.append(1)
+        elif annotation in ('bool',):
+            inputs.append(False)
+        else:
+            shape = attribute_shapes.get(name)
+            if shape is None:
+                confident = False
+                width = guess()
+                shape = [width] if width > 0 else []
+            elif None in shape:
+                confident = False
+                shape = [dim if dim is not None else max(guess(), 1) for dim in shape]
+            inputs.append(torch.randn(num_envs, *shape))
+    return inputs, confident
+
+
+def _smoke_error(function, function_name, inputs, num_envs):
+    """Traceback of running the reward function on `inputs`, None if it returned a valid reward"""
+    try:
+        with torch.no_grad():
+            output = function(*inputs)
+        reward, components = output
+        if not isinstance(reward, torch.Tensor) or not isinstance(components, dict):
+            raise TypeError(f"{function_name} must return Tuple[torch.Tensor, Dict[str, torch.Tensor]], "
+                            f"got ({type(reward).__name__}, {type(components).__name__})")
+        if tuple(reward.shape) != (num_envs,):
+            raise RuntimeError(f"The reward returned by {function_name} has shape {tuple(reward.shape)}, "
+                               f"expected one reward per environment, i.e. shape (num_envs,)")
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+# Feature widths tried for the dimensions that cannot be read off the observation code
+GUESSED_WIDTHS = (1, 2, 3, 4, 6, 7, 12, 13)
+
+
+def _guesses(seed, tries=8):
+    """Alternative guesses of the unknown dimensions: each width for all of them, then random mixes"""
+    for width in (0,) + GUESSED_WIDTHS:
+        yield lambda width=width: width
+    rng = random.Random(seed)
+    for _ in range(tries):
+        yield lambda: rng.choice(GUESSED_WIDTHS)
+
+
+def smoke_run(module_path, attribute_shapes, num_envs):
+    """
+    Import the reward module at `module_path` and run its reward function on synthetic inputs.
+
+    A failure on guessed input shapes only counts as inconclusive if the failure involves the guess,
+    i.e. the reward runs for some other guess of the unknown dimensions.
+
+    Returns:
+        (bool, str): as `preflight_reward`
+    """
+    try:
+        spec = importlib.util.spec_from_file_location('preflight_reward', module_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    except Exception:
+        return False, traceback.format_exc()
+
+    with open(module_path, 'r') as f:
+        function_name, arguments = _reward_arguments(f.read())
+    function = getattr(module, function_name)
+    inputs, confident = make_synthetic_inputs(arguments, attribute_shapes, num_envs)
+    error = _smoke_error(function, function_name, inputs, num_envs)
+    if error is None or confident:
+        return error is None, error or ''
+    for guess in _guesses(seed=num_envs):
+        inputs, _ = make_synthetic_inputs(arguments, attribute_shapes, num_envs, guess)
+        if _smoke_error(function, function_name, inputs, num_envs) is None:
+            return True, error
+    return False, error
+
+
+def preflight_reward(code_string, attribute_shapes, num_envs=17, timeout=60):
+    """
+    TorchScript-compile the reward function and run it on synthetic CPU tensors.
+
+    The odd default `num_envs` keeps the env dimension distinguishable from typical feature widths
+    (3, 4, 7, 13), so reductions over the wrong dimension change the reward shape.
+
+    The generated code runs in a subprocess that is killed after `timeout` seconds, so that an
+    infinite loop rejects the candidate instead of hanging the orchestrator.
+
+    Returns:
+        (bool, str): whether the code may be trained, and the traceback explaining the rejection
+            (or a warning if the smoke execution was inconclusive)
+    """
+    if "@torch.jit.script" not in code_string:
+        code_string = "@torch.jit.script\n" + code_string
+    # TorchScript reads the source back from disk, so the code is imported from a real file
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        module_path = os.path.join(tmp_dir, 'preflight_reward.py')
+        result_path = os.path.join(tmp_dir, 'result.json')
+        with open(module_path, 'w') as f:
+            f.write(PREFLIGHT_HEADER + code_string + '\n')
+        cmd = [sys.executable, os.path.abspath(__file__), module_path, json.dumps(attribute_shapes),
+               str(num_envs), result_path]
+        try:
+            process = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                                     timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return False, (f"Preflight timed out: the reward function did not return within {timeout}s on "
+                           f"{num_envs} synthetic environments, it may contain an infinite loop")
+        if not os.path.exists(result_path):
+            # The check itself died (e.g. killed or out of memory), that says nothing about the code
+            return True, f"Preflight exited with code {process.returncode}:\n{process.stderr}"
+        with open(result_path, 'r') as f:
+            result = json.load(f)
+    return result['ok'], result['message']
+
+
+if __name__ == "__main__":
+    # Subprocess of preflight_reward: <module path> <attribute shapes JSON> <num envs> <result path>
+    ok, message = smoke_run(sys.argv[1], json.loads(sys.argv[2]), int(sys.argv[3]))
+    with open(sys.argv[4], 'w') as f:
+        json.dump({'ok': ok, 'message': message}, f)
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+from utils.extract_task_code import normalize_reward_code
+
+
+def reward_cache_key(code_string, task, seed=None, train_config=None):
+    """
+    Content address of a training run: normalized reward AST plus everything else that shapes the run.
+
+    Args:
+        code_string (str): Generated reward function
+        task (str): Task name (including the suffix)
+        seed: Training seed, None when train.py picks its default
+        train_config (dict): Training settings and config file contents that influence the result
+    """
+    payload = json.dumps({
+        'reward': normalize_reward_code(code_string),
+        'task': task,
+        'seed': seed,
+        'train_config': train_config or {},
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class RewardResultCache:
+    """
+    Persistent store of training results, one JSON file per content address.
+
+    Only runs that trained successfully are stored: tracebacks can come from the environment
+    (e.g. CUDA out of memory) rather than from the reward code and are not worth replaying.
+    """
+    def __init__(self, cache_dir, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with open(path, 'r') as f:
+                result = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.info(f"Reward cache: ignoring unreadable entry {path} ({e})")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, tensorboard_logs=None, **metadata):
+        """Store the full curves (`tensorboard_logs`) and/or other results (e.g. `summary`, see `utils.feedback`)"""
+        if not self.enabled:
+            return
+        result = dict(metadata, created=time.time())
+        if tensorboard_logs is not None:
+            result['tensorboard_logs'] = {tag: list(values) for tag, values in tensorboard_logs.items()}
+        # Write then rename so that concurrent readers never see a partial entry
+        tmp_path = self._path(key) + f".{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, self._path(key))
+
+    @property
+    def lookups(self):
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.
@@ -0,0 +1,199 @@
+"""
+SQLite store of Eureka results: runs, iterations, candidates, reward code, metric curves and evaluations.
+
+Written by `eureka.py` as the run progresses (see `results_db` in the config) and queried by the
+analysis scripts. Kept free of imports from the rest of `eureka/utils` so it can be used both from
+the eureka scripts and from `custom_scripts` (as `eureka.utils.results_db`).
+
+Several Eureka runs (e.g. the tasks of a campaign) may write to the same database, writes are
+serialized by SQLite.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    workspace TEXT UNIQUE,
+    task TEXT,
+    suffix TEXT,
+    model TEXT,
+    config TEXT,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS iterations (
+    run_id INTEGER REFERENCES runs(id),
+    iter INTEGER,
+    max_success REAL,
+    execute_rate REAL,
+    correlation REAL,
+    best_response_id INTEGER,
+    best_code_path TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    llm_cost REAL,
+    PRIMARY KEY (run_id, iter)
+);
+CREATE TABLE IF NOT EXISTS reward_code (
+    id TEXT PRIMARY KEY,
+    code TEXT
+);
+CREATE TABLE IF NOT EXISTS candidates (
+    run_id INTEGER REFERENCES runs(id),
+    iter INTEGER,
+    response_id INTEGER,
+    status TEXT,
+    success REAL,
+    correlation REAL,
+    reward_code_id TEXT REFERENCES reward_code(id),
+    log_path TEXT,
+    tensorboard_dir TEXT,
+    stop_reason TEXT,
+    feedback TEXT,
+    PRIMARY KEY (run_id, iter, response_id)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER REFERENCES runs(id),
+    iter INTEGER,
+    response_id INTEGER,
+    tag TEXT,
+    step INTEGER,
+    value REAL,
+    PRIMARY KEY (run_id, iter, response_id, tag, step)
+);
+CREATE TABLE IF NOT EXISTS eval_results (
+    run_id INTEGER REFERENCES runs(id),
+    seed INTEGER,
+    success REAL,
+    correlation REAL,
+    log_path TEXT,
+    PRIMARY KEY (run_id, seed)
+);
+CREATE INDEX IF NOT EXISTS candidates_success ON candidates (success);
+CREATE INDEX IF NOT EXISTS candidates_code ON candidates (reward_code_id);
+CREATE INDEX IF NOT EXISTS runs_task ON runs (task);
+"""
+
+# Metric rows of evaluation runs use this iteration number, with the seed as response_id
+EVAL_ITER = -1
+
+
+class CandidateStatus:
+    TRAINED = 'trained'
+    STOPPED = 'stopped'  # terminated early, see stop_reason
+    CACHED = 'cached'  # results reused from the reward cache
+    SCREENED = 'screened'  # only trained for the screening budget
+    ERROR = 'error'
+    DUPLICATE = 'duplicate'  # not trained, see utils.dedup
+    UNPARSABLE = 'unparsable'  # no reward function signature found in the response
+
+
+def _nan_to_none(value):
+    return None if value is None or value != value else float(value)
+
+
+class ResultsDB:
+    """
+    Args:
+        path (str): Database file, created if it does not exist
+        timeout (float): Seconds to wait for other writers
+    """
+    def __init__(self, path, timeout=60.0):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def start_run(self, workspace, task, suffix='', model='', config=None):
+        """Register the run of a workspace (again, when resuming it), returns its id"""
+        workspace = os.path.abspath(workspace)
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO runs (workspace, task, suffix, model, config, created) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(workspace) DO UPDATE SET config = excluded.config',
+                (workspace, task, suffix, model, json.dumps(config or {}, default=str), time.time()))
+        return self.conn.execute('SELECT id FROM runs WHERE workspace = ?', (workspace,)).fetchone()[0]
+
+    def _code_id(self, code):
+        code_id = hashlib.sha256(code.encode('utf-8')).hexdigest()
+        self.conn.execute('INSERT OR IGNORE INTO reward_code (id, code) VALUES (?, ?)', (code_id, code))
+        return code_id
+
+    def add_candidate(self, run_id, iter, response_id, status, code=None, success=None, correlation=None,
+                      log_path=None, tensorboard_dir=None, stop_reason=None, feedback=None, metrics=None):
+        """
+        Args:
+            metrics (dict): tag -> list of (step, value), e.g. the downsampled points of a `MetricsSummary`
+        """
+        with self.conn:
+            code_id = self._code_id(code) if code is not None else None
+            self.conn.execute(
+                'INSERT OR REPLACE INTO candidates VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (run_id, iter, response_id, status, _nan_to_none(success), _nan_to_none(correlation), code_id,
+                 log_path, tensorboard_dir, json.dumps(stop_reason) if stop_reason else None, feedback))
+            self._add_metrics(run_id, iter, response_id, metrics)
+
+    def _add_metrics(self, run_id, iter, response_id, metrics):
+        if not metrics:
+            return
+        self.conn.execute('DELETE FROM metrics WHERE run_id = ? AND iter = ? AND response_id = ?',
+                          (run_id, iter, response_id))
+        self.conn.executemany(
+            'INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)',
+            ((run_id, iter, response_id, tag, int(step), _nan_to_none(value))
+             for tag, points in metrics.items() for step, value in points))
+
+    def add_iteration(self, run_id, iter, max_success=None, execute_rate=None, correlation=None, best_response_id=None,
+                      best_code_path=None, prompt_tokens=None, completion_tokens=None, llm_cost=None):
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO iterations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (run_id, iter, _nan_to_none(max_success), _nan_to_none(execute_rate), _nan_to_none(correlation),
+                 best_response_id, best_code_path, prompt_tokens, completion_tokens, _nan_to_none(llm_cost)))
+
+    def add_eval(self, run_id, seed, success=None, correlation=None, log_path=None, metrics=None):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO eval_results VALUES (?, ?, ?, ?, ?)',
+                              (run_id, seed, _nan_to_none(success), _nan_to_none(correlation), log_path))
+            self._add_metrics(run_id, EVAL_ITER, seed, metrics)
+
+    def query(self, sql, params=()):
+        """Rows of a query as dicts"""
+        cursor = self.conn.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def run_summaries(self, task=None):
+        """
+        Per-run summary: best training success over the iterations and final evaluation mean/std.
+
+        Returns:
+            list: dicts with run, task, workspace, max_training_success, final_success_mean/std, num_eval
+                (seeds that produced a success, failed seeds are stored without one)
+        """
+        sql = """
+            SELECT runs.id AS run, runs.task, runs.suffix, runs.workspace,
+                   (SELECT MAX(max_success) FROM iterations WHERE iterations.run_id = runs.id) AS max_training_success,
+                   AVG(eval_results.success) AS final_success_mean,
+                   AVG(eval_results.success * eval_results.success) - AVG(eval_results.success) * AVG(eval_results.success)
+                       AS final_success_var,
+                   AVG(eval_results.correlation) AS final_correlation_mean,
+                   COUNT(eval_results.success) AS num_eval
+            FROM runs LEFT JOIN eval_results ON eval_results.run_id = runs.id
+            {where}
+            GROUP BY runs.id ORDER BY runs.task, runs.created
+        """.format(where='WHERE runs.task = ?' if task is not None else '')
+        rows = self.query(sql, (task,) if task is not None else ())
+        for row in rows:
+            variance = row.pop('final_success_var')
+            # Population std, as np.std
+            row['final_success_std'] = max(variance, 0.) ** 0.5 if variance is not None else None
+        return rows
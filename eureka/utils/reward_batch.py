@@ -0,0 +1,94 @@
+import os
+
+from utils.log_tailer import LogTailer
+from utils.scheduler import TrainingJob
+
+
+class BatchMember:
+    """
+    One reward function of a multi-reward training job (see `isaacgymenvs/utils/multi_reward.py`).
+
+    Has the attributes of a `TrainingJob` that result gathering reads (`log_path`, `tailer`,
+    `stop_reason`), the run itself is the `job` of the whole batch.
+    """
+    def __init__(self, name, log_path):
+        self.name = name
+        self.log_path = log_path
+        self.job = None
+        self.tailer = LogTailer(log_path, name)
+        self.stop_reason = None
+
+    @property
+    def done(self):
+        return self.job is not None and self.job.done
+
+    @property
+    def returncode(self):
+        return self.job.returncode if self.job is not None else None
+
+    def wait(self, scheduler):
+        scheduler.wait(self.job)
+        if not os.path.exists(self.log_path) or os.path.getsize(self.log_path) == 0:
+            # The process failed before the agents started (e.g. while creating the simulation)
+            with open(self.job.log_path, 'r', errors='replace') as src, open(self.log_path, 'a') as dst:
+                dst.write(src.read())
+        self.tailer.poll(self.job.returncode)
+        return self.job.returncode
+
+
+class RewardBatcher:
+    """
+    Collects reward functions into batches of `batch_size` and submits each batch as a single
+    train.py run that trains one agent per reward function in a shared simulation.
+
+    Args:
+        scheduler (TrainingScheduler): Receives the batch jobs
+        batch_size (int): Number of reward functions per train.py process
+        name (str): Prefix of the batch job names, e.g. "Iteration 0"
+        log_prefix (str): Prefix of the batch process logs, e.g. "env_iter0"
+        prepare (callable): `prepare(env_filepath)`, called with the first task file of a batch
+            before launching (the process imports the task module on startup)
+        stage_key (str): See `TrainingJob`
+    """
+    def __init__(self, scheduler, batch_size, name, log_prefix, prepare=None, stage_key=None):
+        self.scheduler = scheduler
+        self.batch_size = batch_size
+        self.name = name
+        self.log_prefix = log_prefix
+        self.prepare = prepare
+        self.stage_key = stage_key
+        self.pending = []
+        self.num_batches = 0
+
+    def add(self, name, cmd, env_filepath, log_path):
+        """
+        Queue a reward function, the batch is submitted once it is full.
+
+        Args:
+            cmd (list): train.py command line the reward function would be trained with on its own
+        Returns:
+            BatchMember: stands in for the training job of this reward function
+        """
+        member = BatchMember(name, log_path)
+        self.pending.append((member, cmd, env_filepath))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return member
+
+    def flush(self):
+        """Submit the pending reward functions, e.g. once sampling is over"""
+        if not self.pending:
+            return None
+        members, cmds, env_filepaths = zip(*self.pending)
+        self.pending = []
+        env_files = ','.join(f"'{os.path.abspath(path)}'" for path in env_filepaths)
+        log_files = ','.join(f"'{os.path.abspath(member.log_path)}'" for member in members)
+        cmd = list(cmds[0]) + [f'multi_reward_files=[{env_files}]', f'multi_reward_logs=[{log_files}]']
+        prepare = (lambda src=env_filepaths[0]: self.prepare(src)) if self.prepare is not None else None
+        # No group: monitors such as early stopping compare single runs, not batches of candidates
+        job = TrainingJob(f"{self.name}: Batch {self.num_batches} ({len(members)} reward functions)", cmd,
+                          f"{self.log_prefix}_batch{self.num_batches}.txt", prepare=prepare, stage_key=self.stage_key)
+        self.num_batches += 1
+        for member in members:
+            member.job = job
+        return self.scheduler.submit(job)
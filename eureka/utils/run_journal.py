@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import signal
+import time
+
+from utils.log_tailer import LogTailer, LAUNCHED, FINISHED
+from utils.scheduler import TrainingJob
+
+JOURNAL_NAME = 'journal.jsonl'
+
+
+class RunJournal:
+    """
+    Append-only record of an Eureka run, written to `journal.jsonl` in the workspace.
+
+    Every record is flushed and fsynced before the orchestrator moves on, so after a crash or a
+    preemption the journal holds every LLM sample received, every training launch (with its pid) and
+    finish, and the state at the end of every completed iteration. `replay()` turns it back into the
+    state needed to continue the run (see `resume` in the config).
+
+    Records:
+        sample: {iter, response_id, choice}
+        launch: {log_path, pid, gpu}
+        finished: {log_path, returncode, stop_reason}
+        iteration: {iter, state}, state being the loop variables carried over to the next iteration
+    """
+    def __init__(self, path=JOURNAL_NAME):
+        self.path = path
+        torn = os.path.exists(path) and os.path.getsize(path) > 0 and not open(path, 'rb').read().endswith(b'\n')
+        self._file = open(path, 'a')
+        if torn:
+            # Keep the records of this run off the partial line a crash left behind
+            self._file.write('\n')
+
+    def record(self, kind, **fields):
+        self._file.write(json.dumps(dict(fields, type=kind, time=time.time()), default=float) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def on_event(self, job, event):
+        """Journal launches and finishes, meant to be chained into `TrainingScheduler.on_event`"""
+        # The launch is journaled as soon as the process exists, before it has written any output
+        if event.kind == LAUNCHED:
+            pid = getattr(job.process, 'pid', None)
+            self.record('launch', log_path=job.log_path, pid=pid, gpu=job.gpu)
+        elif event.kind == FINISHED:
+            self.record('finished', log_path=job.log_path, returncode=job.returncode, stop_reason=job.stop_reason)
+
+    def close(self):
+        self._file.close()
+
+    @staticmethod
+    def replay(path=JOURNAL_NAME):
+        """
+        Read a journal back.
+
+        Returns:
+            dict: `state` (loop state after the last completed iteration, None if there is none),
+                `next_iter`, `samples` (response_id -> choice of the interrupted iteration),
+                `launches` and `finished` (log_path -> latest record)
+        """
+        replayed = {'state': None, 'next_iter': 0, 'samples': {}, 'launches': {}, 'finished': {}}
+        if not os.path.exists(path):
+            return replayed
+        samples = {}  # iter -> {response_id: choice}
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line of a crashed write
+                    continue
+                kind = record['type']
+                if kind == 'sample':
+                    samples.setdefault(record['iter'], {})[record['response_id']] = record['choice']
+                elif kind == 'launch':
+                    replayed['launches'][record['log_path']] = record
+                elif kind == 'finished':
+                    replayed['finished'][record['log_path']] = record
+                elif kind == 'iteration':
+                    replayed['state'] = record['state']
+                    replayed['next_iter'] = record['iter'] + 1
+        replayed['samples'] = samples.get(replayed['next_iter'], {})
+        return replayed
+
+
+def log_is_complete(log_path):
+    """Whether a training log ends like a finished run: max epochs reached or a traceback"""
+    if not os.path.exists(log_path):
+        return False
+    with open(log_path, 'r', errors='replace') as f:
+        content = f.read()
+    return 'MAX EPOCHS NUM!' in content or 'MAX FRAMES NUM!' in content or 'Traceback' in content
+
+
+def process_alive(pid, marker='train.py'):
+    """Whether `pid` is still a training process (pids are reused after a reboot)"""
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            cmdline = f.read().decode(errors='replace')
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            zombie = f.read().rsplit(')', 1)[-1].split()[0] == 'Z'
+    except OSError:
+        return False
+    return marker in cmdline and not zombie
+
+
+class AdoptedProcess:
+    """
+    Popen-like handle of a training process started by a previous orchestrator.
+
+    The exit code of a process that is not our child cannot be read, it is derived from the log.
+    """
+    def __init__(self, pid, log_path):
+        self.pid = pid
+        self.log_path = log_path
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None and not process_alive(self.pid):
+            with open(self.log_path, 'r', errors='replace') as f:
+                self.returncode = 1 if 'Traceback' in f.read() else 0
+        return self.returncode
+
+    def wait(self, timeout=None):
+        start = time.time()
+        while self.poll() is None:
+            if timeout is not None and time.time() - start > timeout:
+                raise TimeoutError(f"Process {self.pid} still running")
+            time.sleep(1.0)
+        return self.returncode
+
+    def terminate(self):
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def recover_job(name, log_path, replayed, scheduler, group=None):
+    """
+    The state of a candidate's training from before the restart.
+
+    Returns:
+        TrainingJob: already finished (read from the journal or the log) or reattached to the
+            still running process, None if the candidate has to be trained (again)
+    """
+    finished = replayed['finished'].get(log_path)
+    launch = replayed['launches'].get(log_path)
+    if finished is None and launch is not None and launch.get('pid') and process_alive(launch['pid']):
+        job = TrainingJob(name, None, log_path, group=group)
+        scheduler.adopt(job, AdoptedProcess(launch['pid'], log_path), launch.get('gpu'))
+        logging.info(f"Resume: reattached to {name} (pid {launch['pid']})")
+        return job
+    if finished is None and not log_is_complete(log_path):
+        return None
+
+    job = TrainingJob(name, None, log_path, group=group)
+    job.tailer = LogTailer(log_path, name)
+    if finished is not None:
+        job.returncode = finished['returncode']
+        job.stop_reason = finished.get('stop_reason')
+    else:
+        with open(log_path, 'r', errors='replace') as f:
+            job.returncode = 1 if 'Traceback' in f.read() else 0
+    job.tailer.poll(job.returncode)
+    job.state = 'done'
+    logging.info(f"Resume: {name} already finished")
+    return job
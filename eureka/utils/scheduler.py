@@ -0,0 +1,199 @@
+import logging
+import subprocess
+import time
+
+from utils.log_tailer import LogTailer, LogWatcher, RunEvent, LAUNCHED, TRAINING, ERROR, FINISHED
+from utils.gpu_monitor import default_monitor, device_env
+
+
+class TrainingJob:
+    """
+    A single train.py run waiting for (or holding) a GPU slot.
+
+    Args:
+        name (str): Human readable identifier used in the logs
+        cmd (list): Command line of the training subprocess
+        log_path (str): File that receives stdout/stderr of the run
+        prepare (callable): Called right before launching, e.g. to write the task file the run imports
+        stage_key (str): Jobs sharing a stage key are started one at a time, the next one is only
+            launched after the previous one has passed startup (started training or crashed)
+        group: Jobs of the same group compete with each other (e.g. the candidates of one iteration),
+            monitors such as early stopping only compare jobs within a group
+        launcher (callable): `launcher(job, gpu, env)` returning a Popen-like handle, used instead of
+            starting `cmd` as a subprocess (e.g. `TrainServerPool.launch` of `utils.train_pool`)
+    """
+    def __init__(self, name, cmd, log_path, prepare=None, stage_key=None, group=None, launcher=None):
+        self.name = name
+        self.cmd = cmd
+        self.log_path = log_path
+        self.prepare = prepare
+        self.stage_key = stage_key
+        self.group = group
+        self.launcher = launcher
+
+        self.state = 'queued'  # queued -> starting -> running -> done
+        self.gpu = None
+        self.process = None
+        self.tailer = None
+        self.returncode = None
+        self.stop_reason = None  # set when a monitor terminated the run early
+        self.submit_time = time.time()
+        self.launch_time = None
+
+    @property
+    def done(self):
+        return self.state == 'done'
+
+
+class TrainingScheduler:
+    """
+    Launches a batch of training jobs concurrently over the available GPUs.
+
+    Every GPU holds at most `runs_per_gpu` concurrent runs and only receives a new run when
+    it has at least `min_vram` GB free. Queued jobs are backfilled as soon as a slot frees up.
+    The scheduler is pumped from the caller's thread through `step()`, `wait()` and `wait_all()`.
+
+    Run logs are tailed incrementally and every lifecycle event (see `utils.log_tailer`) is passed
+    to `on_event(job, event)` if given. Each of the `monitors` is polled with the active jobs on
+    every step and may terminate runs (see `utils.early_stopping`).
+
+    `warm_slots(gpu)` returns the number of idle warm workers holding memory on a GPU (see
+    `utils.train_pool`), jobs with a `launcher` may use them even when the GPU is below `min_vram`.
+
+    Free VRAM is read through `gpu_monitor` (see `utils.gpu_monitor`), every launch reserves `min_vram`
+    GB on its GPU until the run has allocated it.
+
+    With `slots` (a `utils.campaign.SlotClient`) the GPUs are shared with the Eureka runs of other
+    tasks: every job waits for a GPU granted by the campaign's broker instead of picking one itself.
+    """
+    def __init__(self, gpus=None, runs_per_gpu=1, min_vram=8, poll_interval=1.0, vram_interval=10.0,
+                 on_event=None, monitors=None, warm_slots=None, gpu_monitor=None, slots=None):
+        self.gpus = list(gpus) if gpus else None
+        self.runs_per_gpu = runs_per_gpu
+        self.min_vram = min_vram
+        self.poll_interval = poll_interval
+        self.vram_interval = vram_interval
+        self.on_event = on_event
+        self.monitors = list(monitors) if monitors else []
+        self.warm_slots = warm_slots
+        self.gpu_monitor = gpu_monitor if gpu_monitor is not None else default_monitor()
+        self.slots = slots
+
+        self.queue = []
+        self.active = []
+        self.watcher = LogWatcher()
+        self._reservations = {}  # job -> utils.gpu_monitor.Reservation
+
+    def submit(self, job):
+        self.queue.append(job)
+        return job
+
+    def _query_vram(self, force=False):
+        free_vram = self.gpu_monitor.free_vram(max_age=0. if force else self.vram_interval)
+        if self.gpus is not None:
+            free_vram = {gpu: free_vram[gpu] for gpu in self.gpus if gpu in free_vram}
+        return free_vram
+
+    def _runs_on(self, gpu):
+        return sum(1 for job in self.active if job.gpu == gpu)
+
+    def _pick_gpu(self, job):
+        candidates = []
+        for gpu, free_gb in self._query_vram().items():
+            warm = job.launcher is not None and self.warm_slots is not None and self.warm_slots(gpu) > 0
+            if (free_gb >= self.min_vram or warm) and self._runs_on(gpu) < self.runs_per_gpu:
+                candidates.append((warm, free_gb, gpu))
+        if not candidates:
+            return None
+        # Warm workers first, then the freest GPU, ties broken by the lowest number of runs already placed on it
+        return max(candidates, key=lambda x: (x[0], x[1], -self._runs_on(x[2])))[2]
+
+    def _stage_busy(self, stage_key):
+        return stage_key is not None and any(
+            job.state == 'starting' and job.stage_key == stage_key for job in self.active
+        )
+
+    def _launch(self, job, gpu):
+        if job.prepare is not None:
+            job.prepare()
+        env = device_env(gpu)
+        if job.launcher is not None:
+            job.process = job.launcher(job, gpu, env)
+        else:
+            with open(job.log_path, 'w') as f:
+                job.process = subprocess.Popen(job.cmd, stdout=f, stderr=f, env=env)
+        job.tailer = LogTailer(job.log_path, job.name)
+        self.watcher.add(job.log_path)
+        job.gpu = gpu
+        job.state = 'starting'
+        job.launch_time = time.time()
+        self.active.append(job)
+        logging.info(f"Scheduler: launched {job.name} on GPU {gpu} "
+                     f"(queued {job.launch_time - job.submit_time:.1f}s, {len(self.queue)} still queued)")
+        if self.slots is not None:
+            # The broker reserves the VRAM of the job until its process has allocated it
+            self.slots.started(job)
+        else:
+            # Readings taken before this launch do not account for its allocation yet
+            self._reservations[job] = self.gpu_monitor.reserve(gpu, self.min_vram, getattr(job.process, 'pid', None))
+        if self.on_event is not None:
+            self.on_event(job, RunEvent(LAUNCHED, job.name))
+
+    def adopt(self, job, process, gpu=None):
+        """Track a run that is already running, e.g. one launched before the orchestrator restarted"""
+        job.process = process
+        job.tailer = LogTailer(job.log_path, job.name)
+        self.watcher.add(job.log_path)
+        job.gpu = gpu
+        job.state = 'running'
+        job.launch_time = time.time()
+        self.active.append(job)
+
+    def _update(self, job):
+        returncode = job.process.poll()
+        for event in job.tailer.poll(returncode):
+            if event.kind in (TRAINING, ERROR) and job.state == 'starting':
+                # The run is past startup either way, its feedback is collected from the log
+                job.state = 'running'
+            if event.kind == FINISHED:
+                job.returncode = returncode
+                job.state = 'done'
+                self.watcher.remove(job.log_path)
+                if job in self._reservations:
+                    self.gpu_monitor.release(self._reservations.pop(job))
+                if self.slots is not None:
+                    self.slots.release(job)
+            if self.on_event is not None:
+                self.on_event(job, event)
+
+    def step(self):
+        """Refresh the state of active runs and launch queued jobs into free slots"""
+        for job in list(self.active):
+            self._update(job)
+            if job.done:
+                self.active.remove(job)
+        for monitor in self.monitors:
+            monitor.poll(self.active)
+
+        for job in list(self.queue):
+            if self._stage_busy(job.stage_key):
+                continue
+            gpu = self.slots.acquire(job) if self.slots is not None else self._pick_gpu(job)
+            if gpu is None:
+                break
+            self.queue.remove(job)
+            self._launch(job, gpu)
+
+    def wait(self, job):
+        """Block until `job` has finished, launching queued jobs in the meantime"""
+        while True:
+            self.step()
+            if job.done:
+                return job.returncode
+            self.watcher.wait(self.poll_interval)
+
+    def wait_all(self):
+        while self.queue or self.active:
+            self.step()
+            if self.queue or self.active:
+                self.watcher.wait(self.poll_interval)
@@ -0,0 +1,74 @@
+import logging
+
+import numpy as np
+
+from utils.file_utils import load_tensorboard_logs
+from utils.misc import filter_traceback
+
+
+def learning_slope(values):
+    """Least-squares slope of a curve per epoch, 0 for curves too short to fit"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return 0.
+    return float(np.polyfit(np.arange(len(values)), values, 1)[0])
+
+
+class ScreeningStage:
+    """
+    Multi-fidelity selection of the reward candidates of an iteration.
+
+    Every candidate is first trained with a small budget (a screening job with fewer epochs and
+    envs), then the candidates are ranked on how fast their task score rises during screening:
+    the slope of `consecutive_successes` (`gt_reward` for tasks without it), ties broken by the best
+    value reached. Only the `top_k` best are promoted to a full training run, the others keep the
+    results of their screening run.
+
+    Args:
+        name (str): Prefix of the log lines, e.g. "Iteration 0"
+        top_k (int): Number of candidates promoted to full training
+    """
+    def __init__(self, name, top_k):
+        self.name = name
+        self.top_k = top_k
+        self.candidates = {}  # response_id -> (screening job, callable launching the full run)
+        self.results = {}  # response_id -> (traceback_msg, tensorboard_logs) of the screening run
+        self.scores = {}  # response_id -> (slope, best)
+
+    def add(self, response_id, job, launch_full):
+        self.candidates[response_id] = (job, launch_full)
+
+    def _score(self, response_id, job):
+        with open(job.log_path, 'r', errors='replace') as f:
+            traceback_msg = filter_traceback(f.read())
+        tensorboard_logs = None
+        if traceback_msg == '':
+            tensorboard_logs = load_tensorboard_logs(job.tailer.tensorboard_dir) if job.tailer.tensorboard_dir else {}
+            metric = 'consecutive_successes' if 'consecutive_successes' in tensorboard_logs else 'gt_reward'
+            if tensorboard_logs.get(metric):
+                self.scores[response_id] = (learning_slope(tensorboard_logs[metric]), max(tensorboard_logs[metric]))
+            else:
+                traceback_msg = f"Screening run wrote no {metric} scalars"
+        self.results[response_id] = (traceback_msg, tensorboard_logs)
+
+    def run(self, scheduler):
+        """
+        Wait for the screening jobs, rank the candidates and launch the full runs of the promoted ones.
+
+        Returns:
+            dict: response_id -> full training run of the promoted candidates
+        """
+        for response_id, (job, _) in self.candidates.items():
+            scheduler.wait(job)
+            self._score(response_id, job)
+        ranking = sorted(self.scores, key=lambda response_id: self.scores[response_id], reverse=True)
+        promoted = ranking[:self.top_k]
+        for rank, response_id in enumerate(ranking):
+            slope, best = self.scores[response_id]
+            decision = 'promoted' if response_id in promoted else 'not promoted'
+            logging.info(f"{self.name}: Screening rank {rank + 1}: Code Run {response_id} slope {slope:.4g}, "
+                         f"best {best:.2f}, {decision}")
+        for response_id in self.candidates:
+            if response_id not in self.scores:
+                logging.info(f"{self.name}: Screening: Code Run {response_id} failed, not promoted")
+        return {response_id: self.candidates[response_id][1]() for response_id in promoted}
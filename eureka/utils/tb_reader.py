@@ -0,0 +1,164 @@
+"""
+Incremental reader for the scalar summaries of tensorboard event files.
+
+Kept free of imports from the rest of `eureka/utils` so it can be used both from the eureka
+scripts and from `custom_utils` (as `eureka.utils.tb_reader`).
+"""
+
+import os
+import struct
+
+import numpy as np
+from tensorboard.compat.proto import event_pb2
+
+INDEX_NAME = 'scalars_index.npz'
+_HEADER = struct.Struct('<QI')  # record length, masked crc32 of the length
+_FOOTER_SIZE = 4  # masked crc32 of the data
+
+
+def _scalar_value(value):
+    if value.HasField('simple_value'):
+        return value.simple_value
+    if value.HasField('tensor'):
+        tensor = value.tensor
+        if tensor.float_val:
+            return tensor.float_val[0]
+        if tensor.double_val:
+            return tensor.double_val[0]
+        if tensor.tensor_content:
+            return float(np.frombuffer(tensor.tensor_content, dtype=np.float32)[0])
+    return None
+
+
+class ScalarIndex:
+    """
+    Columnar index of the scalar tags written to a tensorboard log directory.
+
+    `update()` only parses the records appended to each event file since the previous update
+    (a partially written trailing record is left for the next call). With `persist=True` the
+    index and the per-file byte offsets are stored in `scalars_index.npz` next to the event files,
+    so later analyses of the same run only parse what was written after the index was saved.
+
+    Unlike `EventAccumulator`, all points are kept (no reservoir sampling).
+    """
+    def __init__(self, logdir, persist=True):
+        self.logdir = logdir
+        self.persist = persist
+        self.offsets = {}
+        self._steps = {}
+        self._values = {}
+        self._pending = {}
+        if persist:
+            self._load()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.logdir, INDEX_NAME)
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with np.load(self.index_path, allow_pickle=False) as index:
+                files, offsets, tags = index['files'], index['offsets'], index['tags']
+                self.offsets = {str(f): int(o) for f, o in zip(files, offsets)}
+                for i, tag in enumerate(tags):
+                    self._steps[str(tag)] = index[f'steps_{i}']
+                    self._values[str(tag)] = index[f'values_{i}']
+        except (OSError, ValueError, KeyError):
+            # Corrupt or outdated index, rebuild from scratch
+            self.offsets, self._steps, self._values = {}, {}, {}
+
+    def save(self):
+        self._flush()
+        tags = sorted(self._values)
+        arrays = {
+            'files': np.array(list(self.offsets), dtype=str),
+            'offsets': np.array(list(self.offsets.values()), dtype=np.int64),
+            'tags': np.array(tags, dtype=str),
+        }
+        for i, tag in enumerate(tags):
+            arrays[f'steps_{i}'] = self._steps[tag]
+            arrays[f'values_{i}'] = self._values[tag]
+        tmp_path = self.index_path + f'.{os.getpid()}.tmp.npz'
+        try:
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            # Read-only artifact folders are still readable, just not cached
+            pass
+
+    def _event_files(self):
+        if not os.path.isdir(self.logdir):
+            return []
+        return sorted(f for f in os.listdir(self.logdir) if 'tfevents' in f)
+
+    def _read_file(self, name):
+        path = os.path.join(self.logdir, name)
+        offset = self.offsets.get(name, 0)
+        if os.path.getsize(path) <= offset:
+            return False
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        pos = 0
+        while pos + _HEADER.size <= len(data):
+            length, _ = _HEADER.unpack_from(data, pos)
+            end = pos + _HEADER.size + length + _FOOTER_SIZE
+            if end > len(data):
+                break
+            event = event_pb2.Event.FromString(data[pos + _HEADER.size:pos + _HEADER.size + length])
+            if event.HasField('summary'):
+                for value in event.summary.value:
+                    scalar = _scalar_value(value)
+                    if scalar is not None:
+                        self._pending.setdefault(value.tag, []).append((event.step, scalar))
+            pos = end
+        self.offsets[name] = offset + pos
+        return pos > 0
+
+    def _flush(self):
+        for tag, points in self._pending.items():
+            steps, values = zip(*points)
+            self._steps[tag] = np.concatenate([self._steps.get(tag, np.zeros(0, np.int64)), np.array(steps, np.int64)])
+            self._values[tag] = np.concatenate([self._values.get(tag, np.zeros(0, np.float32)),
+                                                np.array(values, np.float32)])
+        self._pending = {}
+
+    def update(self):
+        """Parse newly written records, returns whether anything new was read"""
+        changed = False
+        for name in self._event_files():
+            changed = self._read_file(name) or changed
+        self._flush()
+        if changed and self.persist:
+            self.save()
+        return changed
+
+    def read_new(self):
+        """
+        Points written since the previous call, tag -> list of (step, value), without adding them to
+        the index. Lets live readers keep constant memory, not to be mixed with `update()`.
+        """
+        for name in self._event_files():
+            self._read_file(name)
+        points, self._pending = self._pending, {}
+        return {tag: points[tag] for tag in sorted(points)}
+
+    @property
+    def tags(self):
+        return sorted(set(self._values) | set(self._pending))
+
+    def scalars(self, tag):
+        """(steps, values) arrays of a tag"""
+        self._flush()
+        return self._steps.get(tag, np.zeros(0, np.int64)), self._values.get(tag, np.zeros(0, np.float32))
+
+    def values_dict(self):
+        """Tag -> list of values, the format of `load_tensorboard_logs`, in tag order like every read of the index"""
+        self._flush()
+        return {tag: self._values[tag].tolist() for tag in sorted(self._values)}
+
+    def steps_dict(self):
+        self._flush()
+        return {tag: self._steps[tag].tolist() for tag in sorted(self._steps)}
@@ -0,0 +1,205 @@
+import atexit
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+from multiprocessing.connection import Client
+
+# Must match isaacgymenvs/train_server.py
+ADDRESS_ENV = 'EUREKA_TRAIN_SERVER_ADDRESS'
+AUTHKEY_ENV = 'EUREKA_TRAIN_SERVER_AUTHKEY'
+
+
+class TrainServer:
+    """A train_server.py daemon pinned to one GPU, serving one run at a time"""
+    def __init__(self, cmd, gpu, address, authkey, log_path, env):
+        self.gpu = gpu
+        self.address = address
+        self.authkey = authkey
+        self.log_path = log_path
+        self.run = None
+        self.num_runs = 0
+        env = dict(env, **{ADDRESS_ENV: address, AUTHKEY_ENV: authkey.hex()})
+        with open(log_path, 'w') as f:
+            self.process = subprocess.Popen(cmd, stdout=f, stderr=f, env=env)
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    @property
+    def idle(self):
+        return self.alive and (self.run is None or self.run.returncode is not None)
+
+    def connect(self):
+        """Connection to the server, None while it is still starting up"""
+        if not os.path.exists(self.address):
+            return None
+        try:
+            return Client(self.address, authkey=self.authkey)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return None
+
+    def close(self, timeout=30):
+        if self.alive:
+            conn = self.connect()
+            if conn is not None:
+                try:
+                    conn.send({'shutdown': True})
+                    conn.close()
+                    self.process.wait(timeout)
+                except (OSError, subprocess.TimeoutExpired):
+                    pass
+        if self.alive:
+            self.process.terminate()
+            self.process.wait()
+
+
+class RemoteRun:
+    """
+    A run executed by a `TrainServer`, with the subset of the `subprocess.Popen` interface that
+    `utils.scheduler` and `utils.early_stopping` use (`poll`, `wait`, `terminate`, `kill`, `returncode`).
+    """
+    def __init__(self, server, request):
+        self.server = server
+        self.request = request
+        self.returncode = None
+        self.conn = None
+        self._stop_requested = False
+        # The scheduler tails the log from launch on, the server truncates it again when the run starts
+        open(request['log_path'], 'w').close()
+
+    def _fail(self, returncode):
+        # The server died, its log holds the explanation (e.g. a crash during simulator creation)
+        self.returncode = returncode if returncode else 1
+        try:
+            with open(self.server.log_path, 'r', errors='replace') as src, open(self.request['log_path'], 'a') as dst:
+                dst.write(f"\nTrain server on GPU {self.server.gpu} exited with {self.server.process.poll()}:\n")
+                dst.write(src.read()[-20000:])
+        except OSError:
+            pass
+
+    @property
+    def pid(self):
+        # The daemon allocates the run's memory, see `utils.gpu_monitor`
+        return self.server.process.pid
+
+    def poll(self):
+        if self.returncode is not None:
+            return self.returncode
+        if self.conn is None:
+            if self._stop_requested:
+                self.returncode = -signal.SIGTERM
+                return self.returncode
+            if not self.server.alive:
+                self._fail(self.server.process.poll())
+                return self.returncode
+            self.conn = self.server.connect()
+            if self.conn is None:
+                return None
+            self.conn.send(self.request)
+        try:
+            if self.conn.poll():
+                self.returncode = self.conn.recv()['returncode']
+                self.conn.close()
+        except (EOFError, OSError):
+            self.server.process.wait()
+            self._fail(self.server.process.poll())
+        return self.returncode
+
+    def wait(self, timeout=None):
+        start = time.time()
+        while self.poll() is None:
+            if timeout is not None and time.time() - start > timeout:
+                raise subprocess.TimeoutExpired(self.request['log_path'], timeout)
+            time.sleep(0.5)
+        return self.returncode
+
+    def terminate(self):
+        if self.conn is None:
+            self._stop_requested = True
+            return
+        try:
+            self.conn.send({'stop': True})
+        except OSError:
+            pass
+
+    def kill(self):
+        self.server.process.kill()
+
+
+class TrainServerPool:
+    """
+    Keeps warm train_server.py daemons and hands training jobs to them.
+
+    Used as the `launcher` of `TrainingJob`s: a job placed on a GPU goes to an idle daemon on
+    that GPU, a new daemon is only started when all daemons there are busy. Daemons are started
+    with the command line of the first job they serve, with train.py swapped for train_server.py,
+    and stay alive across iterations until `close()`.
+
+    Args:
+        script (str): Path of train_server.py
+        workspace (str): Directory receiving the policy-* run folders and the daemon logs
+        max_runs (int): Restart a daemon after this many runs, 0 keeps it forever
+    """
+    def __init__(self, script, workspace=None, max_runs=0):
+        self.script = script
+        self.workspace = os.path.abspath(workspace or os.getcwd())
+        self.max_runs = max_runs
+        self.servers = []
+        # Short path, unix socket addresses are limited to ~100 characters
+        self.socket_dir = tempfile.mkdtemp(prefix='eureka_train_server_')
+        self.authkey = os.urandom(16)
+        self._num_started = 0
+        # Daemons would otherwise outlive a crashed Eureka run
+        atexit.register(self.close)
+
+    def _start_server(self, cmd, gpu, env):
+        index = self._num_started
+        self._num_started += 1
+        address = os.path.join(self.socket_dir, f"server{index}.sock")
+        server_cmd = [self.script if os.path.basename(arg) == 'train.py' else arg for arg in cmd]
+        # Keep the daemon's own hydra folder out of the workspace, runs create their policy-* folders there
+        server_cmd.append(f"hydra.run.dir={os.path.join(self.socket_dir, f'server{index}')}")
+        log_path = os.path.join(self.workspace, f"train_server_gpu{gpu}_{index}.txt")
+        server = TrainServer(server_cmd, gpu, address, self.authkey, log_path, env)
+        logging.info(f"Train server {index}: started on GPU {gpu}")
+        self.servers.append(server)
+        return server
+
+    def _retire(self):
+        for server in list(self.servers):
+            if not server.alive:
+                logging.info(f"Train server on GPU {server.gpu} exited with {server.process.poll()}, replacing it")
+                self.servers.remove(server)
+            elif self.max_runs and server.idle and server.num_runs >= self.max_runs:
+                server.close()
+                self.servers.remove(server)
+
+    def idle_servers(self, gpu):
+        return sum(1 for server in self.servers if server.gpu == gpu and server.idle)
+
+    def launch(self, job, gpu, env, env_file, max_iterations=None):
+        self._retire()
+        server = next((s for s in self.servers if s.gpu == gpu and s.idle), None)
+        if server is None:
+            server = self._start_server(job.cmd, gpu, env)
+        request = {
+            'env_file': os.path.abspath(env_file),
+            'log_path': os.path.abspath(job.log_path),
+            'run_dir': self.workspace,
+        }
+        if max_iterations:
+            request['max_iterations'] = max_iterations
+        server.run = RemoteRun(server, request)
+        server.num_runs += 1
+        return server.run
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+        self.servers = []
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
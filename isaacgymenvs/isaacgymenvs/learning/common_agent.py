@@ -311,8 +311,9 @@ class CommonAgent(a2c_continuous.A2CAgent):
         mb_advs = self.discount_values(mb_fdones, mb_values, mb_rewards, mb_next_values)
         mb_returns = mb_advs + mb_values
 
-        batch_dict = self.experience_buffer.get_transformed_list(a2c_common.swap_and_flatten01, self.tensor_list)
-        batch_dict['returns'] = a2c_common.swap_and_flatten01(mb_returns)
+        flatten_op = a2c_common.flatten01 if self.time_major_batch else a2c_common.swap_and_flatten01
+        batch_dict = self.experience_buffer.get_transformed_list(flatten_op, self.tensor_list)
+        batch_dict['returns'] = flatten_op(mb_returns)
         batch_dict['played_frames'] = self.batch_size
 
         return batch_dict
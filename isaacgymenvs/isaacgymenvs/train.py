@@ -73,18 +73,30 @@ def preprocess_train_config(cfg, config_dict):
     return config_dict
 
 
-@hydra.main(config_name="config", config_path="./cfg")
-def launch_rlg_hydra(cfg: DictConfig):
-
-    from isaacgymenvs.utils.rlgames_utils import RLGPUEnv, RLGPUAlgoObserver, MultiObserver, ComplexObsRLGPUEnv
-    from isaacgymenvs.utils.wandb_utils import WandbAlgoObserver
-    from rl_games.common import env_configurations, vecenv
+def build_runner(algo_observer):
+    """rl_games Runner with the AMP network builder and agent registered, shared with train_server.py"""
     from rl_games.torch_runner import Runner
     from rl_games.algos_torch import model_builder
     from isaacgymenvs.learning import amp_continuous
     from isaacgymenvs.learning import amp_players
     from isaacgymenvs.learning import amp_models
     from isaacgymenvs.learning import amp_network_builder
+
+    runner = Runner(algo_observer)
+    runner.algo_factory.register_builder('amp_continuous', lambda **kwargs : amp_continuous.AMPAgent(**kwargs))
+    runner.player_factory.register_builder('amp_continuous', lambda **kwargs : amp_players.AMPPlayerContinuous(**kwargs))
+    model_builder.register_model('continuous_amp', lambda network, **kwargs : amp_models.ModelAMPContinuous(network))
+    model_builder.register_network('amp', lambda **kwargs : amp_network_builder.AMPBuilder())
+
+    return runner
+
+
+@hydra.main(config_name="config", config_path="./cfg")
+def launch_rlg_hydra(cfg: DictConfig):
+
+    from isaacgymenvs.utils.rlgames_utils import RLGPUEnv, RLGPUAlgoObserver, MultiObserver, ComplexObsRLGPUEnv
+    from isaacgymenvs.utils.wandb_utils import WandbAlgoObserver
+    from rl_games.common import env_configurations, vecenv
     import isaacgymenvs
 
 
@@ -107,6 +119,12 @@ def launch_rlg_hydra(cfg: DictConfig):
     cfg.seed = set_seed(cfg.seed, torch_deterministic=cfg.torch_deterministic)
     cfg.train.params.config.multi_gpu = cfg.multi_gpu
 
+    # Several reward functions trained side by side in one simulation, each agent on numEnvs envs
+    num_reward_groups = len(cfg.multi_reward_files)
+    if num_reward_groups:
+        group_num_envs = cfg.task.env.numEnvs
+        cfg.task.env.numEnvs = group_num_envs * num_reward_groups
+
 
     def create_isaacgym_env(**kwargs):
         envs = isaacgymenvs.make(
@@ -164,16 +182,6 @@ def launch_rlg_hydra(cfg: DictConfig):
     rlg_config_dict = omegaconf_to_dict(cfg.train)
     rlg_config_dict = preprocess_train_config(cfg, rlg_config_dict)
 
-    # register new AMP network builder and agent
-    def build_runner(algo_observer):
-        runner = Runner(algo_observer)
-        runner.algo_factory.register_builder('amp_continuous', lambda **kwargs : amp_continuous.AMPAgent(**kwargs))
-        runner.player_factory.register_builder('amp_continuous', lambda **kwargs : amp_players.AMPPlayerContinuous(**kwargs))
-        model_builder.register_model('continuous_amp', lambda network, **kwargs : amp_models.ModelAMPContinuous(network))
-        model_builder.register_network('amp', lambda **kwargs : amp_network_builder.AMPBuilder())
-
-        return runner
-
     observers = [RLGPUAlgoObserver()]
 
     if cfg.wandb_activate and rank ==0 :
@@ -184,6 +192,35 @@ def launch_rlg_hydra(cfg: DictConfig):
         wandb_observer = WandbAlgoObserver(cfg)
         observers.append(wandb_observer)
 
+    if num_reward_groups:
+        from copy import deepcopy
+        from isaacgymenvs.utils.multi_reward import train_multi_reward
+
+        assert len(cfg.multi_reward_logs) == num_reward_groups, "multi_reward_logs needs one log file per reward file"
+        assert not cfg.capture_video, "capture_video is not supported with multi_reward_files"
+        date = '{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.datetime.now())
+
+        def build_agent_config(index):
+            # Called in the agent's thread, so these lines end up in the agent's own log
+            config = deepcopy(rlg_config_dict)
+            exp_name = f"{cfg.train.params.config.name}-{date}-reward{index}"
+            experiment_dir = os.path.join('runs', exp_name)
+            print("Network Directory:", Path.cwd() / experiment_dir / "nn")
+            print("Tensorboard Directory:", Path.cwd() / experiment_dir / "summaries")
+            os.makedirs(experiment_dir, exist_ok=True)
+            shutil.copy(cfg.multi_reward_files[index], os.path.join(experiment_dir, 'env.py'))
+            config['params']['config']['log_dir'] = exp_name
+            config['params']['config']['num_actors'] = group_num_envs
+            config['params']['config']['env_name'] = f'rlgpu_group{index}'
+            return config
+
+        returncodes = train_multi_reward(
+            create_isaacgym_env(), list(cfg.multi_reward_files), list(cfg.multi_reward_logs),
+            build_agent_config, lambda: build_runner(MultiObserver([RLGPUAlgoObserver()])),
+        )
+        print(f"Reward function exit codes: {returncodes}")
+        return
+
     # dump config dict
     exp_date = cfg.train.params.config.name + '-{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.datetime.now())
     experiment_dir = os.path.join('runs', exp_date)
@@ -0,0 +1,200 @@
+# train_server.py
+# Training daemon that keeps Isaac Gym and rl_games warm across reward functions
+#
+# The server is started with the same overrides as train.py, creates the task once and then serves
+# training requests over a local socket (see eureka/utils/train_pool.py for the client side). Each
+# request names a task file generated by Eureka, its `compute_reward` method is hot-swapped into the
+# live task and a fresh rl_games agent is trained on it. Python import, Hydra composition, simulator
+# creation and TorchScript compilation of the task are paid once per server instead of once per run.
+#
+# Protocol (multiprocessing.connection, one connection per run):
+#   client -> server: {'env_file', 'log_path', 'run_dir'[, 'max_iterations']} or {'shutdown': True}
+#   client -> server, during the run: {'stop': True}
+#   server -> client: {'returncode': int}, 0 on success, 1 on error, -15 when stopped
+import logging
+import os
+import datetime
+import itertools
+import shutil
+import signal
+import traceback
+import types
+from contextlib import redirect_stdout, redirect_stderr
+from copy import deepcopy
+from multiprocessing.connection import Listener
+from pathlib import Path
+
+import isaacgym
+
+import hydra
+from hydra.utils import get_original_cwd
+from omegaconf import DictConfig, OmegaConf
+import torch
+
+from isaacgymenvs.train import build_runner, preprocess_train_config
+from isaacgymenvs.utils.reformat import omegaconf_to_dict
+from isaacgymenvs.utils.multi_reward import load_task_class
+from isaacgymenvs.utils.utils import set_np_formatting, set_seed
+
+ADDRESS_ENV = 'EUREKA_TRAIN_SERVER_ADDRESS'
+AUTHKEY_ENV = 'EUREKA_TRAIN_SERVER_AUTHKEY'
+
+
+class RunStopped(Exception):
+    pass
+
+
+def snapshot_task(task):
+    """Copy of the task's tensor state right after creation, restored before every run"""
+    return {name: value.clone() for name, value in vars(task).items() if isinstance(value, torch.Tensor)}
+
+
+def restore_task(task, snapshot):
+    for name, value in snapshot.items():
+        current = getattr(task, name, None)
+        if isinstance(current, torch.Tensor) and current.shape == value.shape:
+            # In place, some buffers are views of the simulator state
+            current.copy_(value)
+        else:
+            setattr(task, name, value.clone())
+    # reset_buf is all ones again, so the first step resets every env like in a fresh process
+    task.extras = {}
+
+
+def make_run_dir(root):
+    name = 'policy-{date:%Y-%m-%d}_{date:%H-%M-%S}'.format(date=datetime.datetime.now())
+    run_dir = os.path.join(root, name)
+    for i in itertools.count(1):
+        try:
+            os.makedirs(run_dir)
+            return run_dir
+        except FileExistsError:
+            run_dir = os.path.join(root, f"{name}-{i}")
+
+
+def is_fatal(error):
+    # CUDA errors leave the context unusable, the client replaces the server
+    return isinstance(error, RuntimeError) and 'CUDA' in str(error)
+
+
+@hydra.main(config_name="config", config_path="./cfg")
+def launch_train_server(cfg: DictConfig):
+
+    from isaacgymenvs.utils.rlgames_utils import RLGPUEnv, RLGPUAlgoObserver, MultiObserver
+    from rl_games.common import env_configurations, vecenv
+    from rl_games.common.algo_observer import AlgoObserver
+    import isaacgymenvs
+
+    class StopRequestObserver(AlgoObserver):
+        """Ends the run when the client asks for it (or went away), checked once per epoch"""
+        def __init__(self, conn):
+            super().__init__()
+            self.conn = conn
+
+        def after_steps(self):
+            if not self.conn.poll():
+                return
+            try:
+                message = self.conn.recv()
+            except EOFError:
+                raise RunStopped()
+            if message.get('stop'):
+                raise RunStopped()
+
+    address = os.environ[ADDRESS_ENV]
+    authkey = bytes.fromhex(os.environ[AUTHKEY_ENV])
+    root_dir = get_original_cwd()
+
+    set_np_formatting()
+    cfg.seed = set_seed(cfg.seed, torch_deterministic=cfg.torch_deterministic)
+    cfg.train.params.config.multi_gpu = cfg.multi_gpu
+    if cfg.capture_video or cfg.wandb_activate or cfg.test:
+        logging.warning("train_server only supports headless training, ignoring capture_video/wandb_activate/test")
+
+    env = isaacgymenvs.make(
+        cfg.seed,
+        cfg.task_name,
+        cfg.task.env.numEnvs,
+        cfg.sim_device,
+        cfg.rl_device,
+        cfg.graphics_device_id,
+        cfg.headless,
+        cfg.multi_gpu,
+        False,
+        cfg.force_render,
+        cfg,
+    )
+    task_class_name = type(env).__name__
+    snapshot = snapshot_task(env)
+
+    # Every agent gets the warm environment instead of creating its own
+    env_configurations.register('rlgpu', {
+        'vecenv_type': 'RLGPU',
+        'env_creator': lambda **kwargs: env,
+    })
+    vecenv.register('RLGPU', lambda config_name, num_actors, **kwargs: RLGPUEnv(config_name, num_actors, **kwargs))
+
+    rlg_config_dict = preprocess_train_config(cfg, omegaconf_to_dict(cfg.train))
+
+    def run(request, conn):
+        run_dir = make_run_dir(request.get('run_dir', root_dir))
+        runner = None
+        with open(request['log_path'], 'w') as log, redirect_stdout(log), redirect_stderr(log):
+            os.chdir(run_dir)
+            try:
+                task_class = load_task_class(request['env_file'], task_class_name)
+                env.compute_reward = types.MethodType(task_class.compute_reward, env)
+                restore_task(env, snapshot)
+                shutil.copy(request['env_file'], "env.py")
+                set_seed(cfg.seed, torch_deterministic=cfg.torch_deterministic)
+
+                config = deepcopy(rlg_config_dict)
+                if request.get('max_iterations'):
+                    config['params']['config']['max_epochs'] = int(request['max_iterations'])
+                exp_date = cfg.train.params.config.name + '-{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.datetime.now())
+                experiment_dir = os.path.join('runs', exp_date)
+                print("Network Directory:", Path.cwd() / experiment_dir / "nn")
+                print("Tensorboard Directory:", Path.cwd() / experiment_dir / "summaries")
+                os.makedirs(experiment_dir, exist_ok=True)
+                with open(os.path.join(experiment_dir, 'config.yaml'), 'w') as f:
+                    f.write(OmegaConf.to_yaml(cfg))
+                config['params']['config']['log_dir'] = exp_date
+
+                runner = build_runner(MultiObserver([RLGPUAlgoObserver(), StopRequestObserver(conn)]))
+                runner.load(config)
+                runner.reset()
+                runner.run({'train': True, 'play': False, 'checkpoint': '', 'sigma': None})
+                return 0, False
+            except RunStopped:
+                print("Run stopped on request")
+                return -signal.SIGTERM, False
+            except Exception as e:
+                traceback.print_exc()
+                return 1, is_fatal(e)
+            finally:
+                if runner is not None and hasattr(runner, 'agent'):
+                    runner.agent.writer.close()
+                del runner
+                torch.cuda.empty_cache()
+                os.chdir(root_dir)
+                log.flush()
+
+    with Listener(address, authkey=authkey) as listener:
+        print(f"Train server listening on {address}", flush=True)
+        while True:
+            with listener.accept() as conn:
+                request = conn.recv()
+                if request.get('shutdown'):
+                    break
+                returncode, fatal = run(request, conn)
+                print(f"Run {request['log_path']} finished with {returncode}", flush=True)
+                try:
+                    conn.send({'returncode': returncode})
+                except OSError:
+                    pass
+                if fatal:
+                    break
+
+
+if __name__ == "__main__":
+    launch_train_server()
@@ -0,0 +1,295 @@
+# Training several reward functions in one simulation
+#
+# The envs of one task are partitioned into K contiguous groups. Group k is driven by the
+# `compute_reward` of its own generated task file and trained by its own rl_games agent (policy,
+# optimizer, experience buffer, tensorboard writer). The agents run in threads and step the shared
+# simulation in lockstep: every agent submits the actions of its slice, the last one to arrive steps
+# the simulation for everybody.
+import importlib.util
+import inspect
+import itertools
+import sys
+import threading
+import traceback
+import types
+
+import torch
+from rl_games.common import vecenv
+
+_module_ids = itertools.count()
+
+
+def load_task_class(env_file, class_name):
+    # A fresh module name per file, TorchScript keys compiled functions by their qualified name
+    spec = importlib.util.spec_from_file_location(f"eureka_task_{next(_module_ids)}", env_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, class_name)
+
+
+class GroupView:
+    """
+    The task as seen by the reward code of one group.
+
+    Per-env tensors (leading dimension `num_envs`) are sliced, so in-place writes such as
+    `self.rew_buf[:] = ...` land in the group's part of the shared buffers. Scalar state the reward
+    code accumulates over all of its envs (e.g. the `consecutive_successes` running average),
+    `extras` and any attribute it assigns are kept per group. Everything else is read from the task.
+    """
+    def __init__(self, task, env_slice):
+        object.__setattr__(self, '_task', task)
+        object.__setattr__(self, '_slice', env_slice)
+        object.__setattr__(self, '_own', {
+            'num_envs': env_slice.stop - env_slice.start,
+            'extras': {},
+        })
+
+    def _is_per_env(self, value):
+        return isinstance(value, torch.Tensor) and value.dim() > 0 and value.shape[0] == self._task.num_envs
+
+    def __getattr__(self, name):
+        own = self._own
+        if name in own:
+            return own[name]
+        value = getattr(self._task, name)
+        if self._is_per_env(value):
+            return value[self._slice]
+        if isinstance(value, torch.Tensor) and value.numel() == 1:
+            own[name] = value.clone()
+            return own[name]
+        if isinstance(value, types.MethodType) and value.__self__ is self._task:
+            # Helper methods called by the reward code see the group as well
+            return types.MethodType(value.__func__, self)
+        return value
+
+    def __setattr__(self, name, value):
+        current = getattr(self._task, name, None)
+        if self._is_per_env(current) and isinstance(value, torch.Tensor) and value.shape == current[self._slice].shape:
+            current[self._slice] = value
+        else:
+            self._own[name] = value
+
+
+class RewardGroup:
+    def __init__(self, index, task, env_slice, compute_reward):
+        self.index = index
+        self.slice = env_slice
+        self.view = GroupView(task, env_slice)
+        self.compute_reward = compute_reward
+        self.takes_actions = len(inspect.signature(compute_reward).parameters) > 1
+        self.error = None
+
+    @property
+    def extras(self):
+        return self.view._own['extras']
+
+
+class MultiRewardTask:
+    """
+    Installs a `compute_reward` on `task` that evaluates the reward of every group on its own slice.
+
+    Args:
+        task: The VecTask created with the total number of envs
+        env_files (list): Generated task files, one per group, the envs are split evenly between them
+    """
+    def __init__(self, task, env_files):
+        self.task = task
+        self.num_groups = len(env_files)
+        assert task.num_envs % self.num_groups == 0, \
+            f"num_envs ({task.num_envs}) must be divisible by the number of reward functions ({self.num_groups})"
+        group_size = task.num_envs // self.num_groups
+        self.groups = []
+        for i, env_file in enumerate(env_files):
+            task_class = load_task_class(env_file, type(task).__name__)
+            env_slice = slice(i * group_size, (i + 1) * group_size)
+            self.groups.append(RewardGroup(i, task, env_slice, task_class.compute_reward))
+        task.compute_reward = self.compute_reward
+
+    def compute_reward(self, *args):
+        actions = args[0] if args else None
+        for group in self.groups:
+            if group.error is not None:
+                continue
+            try:
+                if group.takes_actions:
+                    group.compute_reward(group.view, actions[group.slice])
+                else:
+                    group.compute_reward(group.view)
+            except Exception:
+                # Only this group's agent fails, the others keep training
+                group.error = traceback.format_exc()
+                self.task.rew_buf[group.slice] = 0.
+
+    def group_infos(self, group):
+        infos = {}
+        for key, value in self.task.extras.items():
+            per_env = isinstance(value, torch.Tensor) and value.dim() > 0 and value.shape[0] == self.task.num_envs
+            infos[key] = value[group.slice] if per_env else value
+        infos.update(group.extras)
+        return infos
+
+
+class LockstepStepper:
+    """Steps the shared simulation once every active group has submitted its actions"""
+    def __init__(self, multi_task):
+        self.multi_task = multi_task
+        task = multi_task.task
+        self.actions = torch.zeros((task.num_envs, task.num_actions), device=task.rl_device)
+        self.active = set(range(multi_task.num_groups))
+        self.submitted = set()
+        self.step_count = 0
+        self.results = None
+        self.failure = None
+        self.condition = threading.Condition()
+
+    def _step_if_ready(self):
+        if self.active and self.submitted >= self.active:
+            try:
+                self.results = self.multi_task.task.step(self.actions)
+            except Exception:
+                # Raised in every group, not only in the thread that happened to step
+                self.failure = traceback.format_exc()
+            self.step_count += 1
+            self.submitted = set()
+            self.condition.notify_all()
+
+    def step(self, index, actions):
+        group = self.multi_task.groups[index]
+        with self.condition:
+            self.actions[group.slice] = actions
+            self.submitted.add(index)
+            step_count = self.step_count
+            self._step_if_ready()
+            while self.step_count == step_count:
+                self.condition.wait()
+            if self.failure is not None:
+                raise RuntimeError(f"Simulation step failed:\n{self.failure}")
+            obs_dict, rewards, dones, _ = self.results
+            obs = {key: value[group.slice].clone() for key, value in obs_dict.items()}
+            results = obs, rewards[group.slice].clone(), dones[group.slice].clone(), self.multi_task.group_infos(group)
+        if group.error is not None:
+            raise RuntimeError(f"compute_reward of reward group {index} failed:\n{group.error}")
+        return results
+
+    def leave(self, index):
+        """A finished (or crashed) group no longer holds back the others, its envs keep zero actions"""
+        with self.condition:
+            self.active.discard(index)
+            self.actions[self.multi_task.groups[index].slice] = 0.
+            self.submitted.discard(index)
+            self._step_if_ready()
+
+
+class GroupVecEnv(vecenv.IVecEnv):
+    """rl_games environment of one group, a slice of the shared task"""
+    def __init__(self, stepper, index):
+        self.stepper = stepper
+        self.index = index
+        self.task = stepper.multi_task.task
+        self.group = stepper.multi_task.groups[index]
+
+    def step(self, actions):
+        return self.stepper.step(self.index, actions)
+
+    def reset(self):
+        obs_dict = self.task.reset()
+        return {key: value[self.group.slice].clone() for key, value in obs_dict.items()}
+
+    def get_number_of_agents(self):
+        return 1
+
+    def get_env_info(self):
+        info = {'action_space': self.task.action_space, 'observation_space': self.task.observation_space}
+        if self.task.num_states > 0:
+            info['state_space'] = self.task.state_space
+        return info
+
+    def set_train_info(self, env_frames, *args_, **kwargs_):
+        # Curriculum state lives in the shared task, driven by the first group
+        if self.index == 0 and hasattr(self.task, 'set_train_info'):
+            self.task.set_train_info(env_frames, *args_, **kwargs_)
+
+    def get_env_state(self):
+        return None
+
+    def set_env_state(self, env_state):
+        pass
+
+
+class ThreadOutputRouter:
+    """Sends what a thread prints to that thread's stream, other threads write to `default`"""
+    def __init__(self, default):
+        self.default = default
+        self.streams = {}
+
+    def _stream(self):
+        return self.streams.get(threading.get_ident(), self.default)
+
+    def write(self, text):
+        return self._stream().write(text)
+
+    def flush(self):
+        self._stream().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream(), name)
+
+
+def train_multi_reward(task, env_files, log_paths, build_agent_config, build_runner):
+    """
+    Train one agent per reward function on its slice of `task`, each in its own thread.
+
+    Args:
+        task: VecTask created with `len(env_files)` times the per-agent number of envs
+        env_files (list): Generated task files providing the rewards
+        log_paths (list): Per-agent files receiving what the agent prints (stdout and tracebacks)
+        build_agent_config (callable): index -> rl_games config dict of that agent
+        build_runner (callable): () -> rl_games Runner
+    Returns:
+        list: Per-agent exit code, 0 on success and 1 if the agent failed
+    """
+    from rl_games.common import env_configurations
+
+    multi_task = MultiRewardTask(task, env_files)
+    stepper = LockstepStepper(multi_task)
+    vecenv.register('RLGPU_GROUP', lambda config_name, num_actors, **kwargs:
+                    env_configurations.configurations[config_name]['env_creator']())
+
+    router = ThreadOutputRouter(sys.stdout)
+    returncodes = [1] * len(env_files)
+
+    def run_group(index):
+        with open(log_paths[index], 'w', buffering=1) as log:
+            router.streams[threading.get_ident()] = log
+            try:
+                config = build_agent_config(index)
+                runner = build_runner()
+                runner.load(config)
+                runner.reset()
+                runner.run({'train': True, 'play': False, 'checkpoint': '', 'sigma': None})
+                runner.agent.writer.close()
+                returncodes[index] = 0
+            except Exception:
+                traceback.print_exc(file=log)
+            finally:
+                stepper.leave(index)
+                del router.streams[threading.get_ident()]
+
+    for index in range(len(env_files)):
+        env_configurations.register(f'rlgpu_group{index}', {
+            'vecenv_type': 'RLGPU_GROUP',
+            'env_creator': lambda index=index: GroupVecEnv(stepper, index),
+        })
+
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = router
+    sys.stderr = router
+    try:
+        threads = [threading.Thread(target=run_group, args=(index,), daemon=True) for index in range(len(env_files))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    return returncodes
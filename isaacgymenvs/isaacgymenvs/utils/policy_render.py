@@ -0,0 +1,120 @@
+# Rendering trained policies to video inside the calling process
+#
+# The environment of a task is created once (with a virtual display, so no screen is needed) and
+# every checkpoint of that task is rolled out in it, instead of starting `train.py test=True
+# capture_video=True` per checkpoint. Frames are grabbed with `env.render(mode='rgb_array')` after
+# every step and written straight to the requested file.
+import os
+
+import isaacgym
+
+from hydra import compose, initialize_config_dir
+from hydra.core.global_hydra import GlobalHydra
+import torch
+
+import isaacgymenvs
+from isaacgymenvs.train import preprocess_train_config
+from isaacgymenvs.utils.reformat import omegaconf_to_dict
+from isaacgymenvs.utils.utils import set_np_formatting, set_seed
+
+CFG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "cfg")
+
+
+def compose_config(overrides):
+    """The config train.py would get for these command line overrides"""
+    if GlobalHydra.instance().is_initialized():
+        GlobalHydra.instance().clear()
+    with initialize_config_dir(config_dir=CFG_DIR, version_base="1.1"):
+        return compose(config_name="config", overrides=list(overrides))
+
+
+def write_video(frames, path, fps):
+    from moviepy.video.io.ImageSequenceClip import ImageSequenceClip
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    ImageSequenceClip(frames, fps=fps).write_videofile(path, logger=None)
+
+
+class PolicyRenderer:
+    """
+    Renders checkpoints of one task in a single, reused environment.
+
+    Args:
+        task: Task name as given to train.py, e.g. "AntGPT"
+        overrides: Further train.py overrides, e.g. ["num_envs=4"]
+        graphics_device_id: Vulkan device rendering the frames
+        sim_device / rl_device: Devices of the simulation and the policy
+    """
+    def __init__(self, task, overrides=(), graphics_device_id=0, sim_device="cuda:0", rl_device="cuda:0"):
+        from rl_games.common import env_configurations
+
+        self.cfg = compose_config([f"task={task}", "test=True", "headless=False", "capture_video=True",
+                                   "force_render=True", f"graphics_device_id={graphics_device_id}",
+                                   f"sim_device={sim_device}", f"rl_device={rl_device}", *overrides])
+        set_np_formatting()
+        self.cfg.seed = set_seed(self.cfg.seed, torch_deterministic=self.cfg.torch_deterministic)
+        self.env = isaacgymenvs.make(
+            self.cfg.seed,
+            self.cfg.task_name,
+            self.cfg.task.env.numEnvs,
+            self.cfg.sim_device,
+            self.cfg.rl_device,
+            self.cfg.graphics_device_id,
+            self.cfg.headless,
+            self.cfg.multi_gpu,
+            True,  # virtual_screen_capture
+            self.cfg.force_render,
+            self.cfg,
+        )
+        # Players of every checkpoint get the live environment instead of creating their own
+        env_configurations.register('rlgpu', {
+            'vecenv_type': 'RLGPU',
+            'env_creator': lambda **kwargs: self.env,
+        })
+        self.rlg_config_dict = preprocess_train_config(self.cfg, omegaconf_to_dict(self.cfg.train))
+
+    @property
+    def fps(self):
+        return self.env.metadata.get("video.frames_per_second", 24)
+
+    def capture(self, checkpoint, num_frames):
+        """Frames of a deterministic rollout of the policy in `checkpoint`"""
+        from rl_games.torch_runner import Runner
+
+        runner = Runner()
+        runner.load(self.rlg_config_dict)
+        player = runner.create_player()
+        player.restore(checkpoint)
+
+        frames = []
+        with torch.no_grad():
+            obses = player.env_reset(self.env)
+            player.get_batch_size(obses, 1)
+            if player.is_rnn:
+                player.init_rnn()
+            for _ in range(num_frames):
+                action = player.get_action(obses, is_deterministic=True)
+                obses, _, done, _ = player.env_step(self.env, action)
+                frame = self.env.render(mode="rgb_array")
+                if frame is not None:
+                    frames.append(frame[..., :3])
+                if player.is_rnn and done.any():
+                    for state in player.states:
+                        state[:, done.nonzero(as_tuple=False), :] = 0.
+        return frames
+
+    def render(self, checkpoint, output_path, num_frames=None):
+        """Write the rollout of `checkpoint` to `output_path`, returns whether any frame was captured"""
+        frames = self.capture(checkpoint, num_frames or self.cfg.capture_video_len)
+        if not frames:
+            return False
+        write_video(frames, output_path, self.fps)
+        return True
+
+    def close(self):
+        if self.env.viewer is not None:
+            self.env.gym.destroy_viewer(self.env.viewer)
+        self.env.gym.destroy_sim(self.env.sim)
+        if self.env.virtual_display is not None:
+            self.env.virtual_display.stop()
+        torch.cuda.empty_cache()
@@ -149,6 +149,9 @@ class RLGPUAlgoObserver(AlgoObserver):
         self.episode_cumulative = dict()
         self.episode_cumulative_avg = dict()
         self.new_finished_episodes = False
+        # device_episode_stats: windows of the finished episodes, and how many were pushed at the last print
+        self.episode_cumulative_window = dict()
+        self.episode_cumulative_logged = dict()
 
     def after_init(self, algo):
         self.algo = algo
@@ -179,6 +182,28 @@ class RLGPUAlgoObserver(AlgoObserver):
                     self.episode_cumulative_avg[key].append(self.episode_cumulative[key][done_idx].item())
                     self.episode_cumulative[key][done_idx] = 0
 
+        self.update_direct_info(infos)
+
+    def process_infos_masked(self, infos, done_mask):
+        """process_infos without reading the finished envs back to the host"""
+        assert isinstance(infos, dict), 'RLGPUAlgoObserver expects dict info'
+
+        if 'episode' in infos:
+            self.ep_infos.append(infos['episode'])
+
+        if 'episode_cumulative' in infos:
+            for key, value in infos['episode_cumulative'].items():
+                if key not in self.episode_cumulative:
+                    self.episode_cumulative[key] = torch.zeros_like(value)
+                if key not in self.episode_cumulative_window:
+                    self.episode_cumulative_window[key] = torch_ext.DeviceWindow(self.algo.games_to_track).to(value.device)
+                self.episode_cumulative[key] += value
+                self.episode_cumulative_window[key].push_masked(self.episode_cumulative[key], done_mask)
+                self.episode_cumulative[key].masked_fill_(done_mask, 0)
+
+        self.update_direct_info(infos)
+
+    def update_direct_info(self, infos):
         # turn nested infos into summary keys (i.e. infos['scalars']['lr'] -> infos['scalars/lr']
         if len(infos) > 0 and isinstance(infos, dict):  # allow direct logging from env
             infos_flat = flatten_dict(infos, prefix='', separator='/')
@@ -211,6 +236,16 @@ class RLGPUAlgoObserver(AlgoObserver):
                 self.writer.add_scalar(f'episode_cumulative_max/{key}_max', np.max(self.episode_cumulative_avg[key]), frame)
             self.new_finished_episodes = False
 
+        for key, window in self.episode_cumulative_window.items():
+            pushed = int(window.pushed.item())
+            if pushed == self.episode_cumulative_logged.get(key, 0):
+                continue
+            self.episode_cumulative_logged[key] = pushed
+            values = window.get_values()
+            self.writer.add_scalar(f'episode_cumulative/{key}', np.mean(values), frame)
+            self.writer.add_scalar(f'episode_cumulative_min/{key}_min', np.min(values), frame)
+            self.writer.add_scalar(f'episode_cumulative_max/{key}_max', np.max(values), frame)
+
         for k, v in self.direct_info.items():
             self.writer.add_scalar(f'{k}', v, epoch_num)
             # self.writer.add_scalar(f'{k}/frame', v, frame)
@@ -238,6 +273,9 @@ class MultiObserver(AlgoObserver):
     def process_infos(self, infos, done_indices):
         self._call_multi('process_infos', infos, done_indices)
 
+    def process_infos_masked(self, infos, done_mask):
+        self._call_multi('process_infos_masked', infos, done_mask)
+
     def after_steps(self):
         self._call_multi('after_steps')
 
@@ -0,0 +1,134 @@
+"""
+Eager vs CUDA graph (rl_games/algos_torch/cuda_graphs.py) policy inference and PPO minibatch updates
+of the Isaac Gym sized MLPs.
+
+    python benchmarks/cuda_graph_benchmark.py --envs 4096 16384 --minibatch 8192 32768 --units 256 128 64
+
+Prints the time per call of both modes and the speedup. The smaller the network and batch, the more
+the eager step is bound by kernel launches and the more the graph saves.
+"""
+
+import argparse
+import time
+
+import torch
+
+from rl_games.algos_torch import cuda_graphs
+from rl_games.algos_torch import model_builder
+from rl_games.common import common_losses
+
+
+def build_model(units, obs_size, actions_num, device):
+    params = {
+        'model': {'name': 'continuous_a2c_logstd'},
+        'network': {
+            'name': 'actor_critic',
+            'separate': False,
+            'space': {'continuous': {
+                'mu_activation': 'None', 'sigma_activation': 'None',
+                'mu_init': {'name': 'default'},
+                'sigma_init': {'name': 'const_initializer', 'val': 0},
+                'fixed_sigma': True,
+            }},
+            'mlp': {'units': units, 'activation': 'elu', 'd2rl': False,
+                    'initializer': {'name': 'default'}, 'regularizer': {'name': 'None'}},
+        },
+    }
+    model = model_builder.ModelBuilder().load(params).build({
+        'actions_num': actions_num,
+        'input_shape': (obs_size,),
+        'num_seqs': 1,
+        'value_size': 1,
+        'normalize_value': True,
+        'normalize_input': True,
+    })
+    return model.to(device)
+
+
+def inference(model, input_dict):
+    with torch.no_grad():
+        return model({'is_train': False, 'prev_actions': None, 'obs': input_dict['obs'], 'rnn_states': None})
+
+
+def ppo_step(model, optimizer, input_dict, e_clip=0.2, grad_norm=1.0):
+    """The minibatch update of a2c_continuous without bounds loss and diagnostics"""
+    res_dict = model({'is_train': True, 'prev_actions': input_dict['actions'], 'obs': input_dict['obs']})
+    a_loss = common_losses.actor_loss(input_dict['old_logp_actions'], res_dict['prev_neglogp'],
+                                      input_dict['advantages'], True, e_clip)
+    c_loss = common_losses.critic_loss(model, input_dict['old_values'], res_dict['values'], e_clip,
+                                       input_dict['returns'], True)
+    loss = a_loss.mean() + 0.5 * c_loss.mean() * 4.0 - res_dict['entropy'].mean() * 0.0
+    for param in model.parameters():
+        param.grad = None
+    loss.backward()
+    torch.nn.utils.clip_grad_norm_(model.parameters(), grad_norm)
+    optimizer.step()
+    return loss.detach()
+
+
+def make_batch(batch_size, obs_size, actions_num, device):
+    return {
+        'obs': torch.randn(batch_size, obs_size, device=device),
+        'actions': torch.randn(batch_size, actions_num, device=device),
+        'old_logp_actions': torch.randn(batch_size, device=device),
+        'advantages': torch.randn(batch_size, device=device),
+        'old_values': torch.randn(batch_size, 1, device=device),
+        'returns': torch.randn(batch_size, 1, device=device),
+    }
+
+
+def time_calls(fn, repeats):
+    for _ in range(3):
+        fn()
+    torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--envs', type=int, nargs='+', default=[1024, 4096, 16384], help='inference batch sizes')
+    parser.add_argument('--minibatch', type=int, nargs='+', default=[4096, 16384, 32768], help='update batch sizes')
+    parser.add_argument('--units', type=int, nargs='+', default=[256, 128, 64])
+    parser.add_argument('--obs-size', type=int, default=60)
+    parser.add_argument('--actions', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--device', default='cuda:0')
+    args = parser.parse_args()
+
+    reason = cuda_graphs.unsupported_reason(args.device)
+    if reason is not None:
+        print(f'cuda_graphs {reason}, nothing to compare')
+        return
+    device = torch.device(args.device)
+
+    model = build_model(args.units, args.obs_size, args.actions, device)
+    model.eval()
+    graph = cuda_graphs.CapturedStep(lambda input_dict: inference(model, input_dict), modules=[model])
+    print(f"{'inference':>10} {'batch':>8} {'eager ms':>10} {'graph ms':>10} {'speedup':>8}")
+    for num_envs in args.envs:
+        batch = {'obs': torch.randn(num_envs, args.obs_size, device=device)}
+        eager = time_calls(lambda: inference(model, batch), args.repeats)
+        graphed = time_calls(lambda: graph(batch), args.repeats)
+        print(f"{'':>10} {num_envs:>8} {eager * 1e3:>10.3f} {graphed * 1e3:>10.3f} {eager / graphed:>7.2f}x")
+
+    model.train()
+    # Separate optimizers, the eager one keeps the default non capturable Adam
+    eager_optimizer = torch.optim.Adam(model.parameters(), 3e-4)
+    graph_optimizer = torch.optim.Adam(model.parameters(), 3e-4)
+    cuda_graphs.make_capturable(graph_optimizer)
+    graph = cuda_graphs.CapturedStep(lambda input_dict: ppo_step(model, graph_optimizer, input_dict),
+                                     modules=[model], optimizers=[graph_optimizer])
+    print(f"{'update':>10} {'batch':>8} {'eager ms':>10} {'graph ms':>10} {'speedup':>8}")
+    for minibatch_size in args.minibatch:
+        batch = make_batch(minibatch_size, args.obs_size, args.actions, device)
+        eager = time_calls(lambda: ppo_step(model, eager_optimizer, batch), args.repeats)
+        graphed = time_calls(lambda: graph(batch), args.repeats)
+        print(f"{'':>10} {minibatch_size:>8} {eager * 1e3:>10.3f} {graphed * 1e3:>10.3f} {eager / graphed:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Microbenchmark of the GAE backends (rl_games/common/gae.py) across horizon lengths and env counts.
+
+    python benchmarks/gae_benchmark.py --horizons 16 32 64 --envs 1024 4096 16384 --device cuda:0
+
+Prints the time per call of every backend and its max abs difference to the 'loop' reference.
+"""
+
+import argparse
+import time
+
+import torch
+
+from rl_games.common import gae
+
+
+def make_rollout(horizon_length, num_envs, value_size, device, done_prob=0.02, masks=False):
+    rollout = {
+        'fdones': (torch.rand(num_envs, device=device) < done_prob).float(),
+        'last_values': torch.randn(num_envs, value_size, device=device),
+        'mb_fdones': (torch.rand(horizon_length, num_envs, device=device) < done_prob).float(),
+        'mb_values': torch.randn(horizon_length, num_envs, value_size, device=device),
+        'mb_rewards': torch.randn(horizon_length, num_envs, value_size, device=device),
+    }
+    if masks:
+        rollout['mb_masks'] = (torch.rand(horizon_length, num_envs, device=device) < 0.9).float()
+    return rollout
+
+
+def time_backend(backend, rollout, gamma, tau, repeats, device):
+    run = lambda: gae.compute_gae(gamma, tau, backend=backend, **rollout)
+    # Warm up: TorchScript profiling runs, torch.compile and triton compilation
+    for _ in range(3):
+        advs = run()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        run()
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / repeats, advs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--horizons', type=int, nargs='+', default=[16, 32, 64, 128])
+    parser.add_argument('--envs', type=int, nargs='+', default=[1024, 4096, 16384])
+    parser.add_argument('--value-size', type=int, default=1)
+    parser.add_argument('--backends', nargs='+', default=list(gae.BACKENDS))
+    parser.add_argument('--masks', action='store_true', help='benchmark the masked variant (discount_values_masks)')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    backends = []
+    for backend in args.backends:
+        resolved = gae.resolve_backend(backend, device)
+        if resolved == backend:
+            backends.append(backend)
+    gamma, tau = 0.99, 0.95
+
+    header = f"{'horizon':>8} {'envs':>8} " + ' '.join(f'{backend + " ms":>12} {"err":>8}' for backend in backends)
+    print(header)
+    for horizon_length in args.horizons:
+        for num_envs in args.envs:
+            rollout = make_rollout(horizon_length, num_envs, args.value_size, device, masks=args.masks)
+            reference = gae.compute_gae(gamma, tau, backend='loop', **rollout)
+            row = f'{horizon_length:>8} {num_envs:>8} '
+            for backend in backends:
+                seconds, advs = time_backend(backend, rollout, gamma, tau, args.repeats, device)
+                error = (advs - reference).abs().max().item()
+                row += f'{seconds * 1e3:>12.3f} {error:>8.1e} '
+            print(row)
+
+
+if __name__ == '__main__':
+    main()
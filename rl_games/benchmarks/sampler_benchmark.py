@@ -0,0 +1,92 @@
+"""
+Minibatch throughput of PPODataset with the minibatch samplers (rl_games/common/samplers.py).
+
+    python benchmarks/sampler_benchmark.py --horizon 32 --envs 8192 --minibatch 32768 --time-major
+
+Every minibatch is followed by a small MLP forward/backward pass standing in for the PPO update,
+which is what prefetching overlaps with. Prints the samples per second of every mode.
+"""
+
+import argparse
+import time
+
+import torch
+from torch import nn
+
+from rl_games.common.datasets import PPODataset
+
+MODES = {
+    'contiguous': dict(shuffle=False, prefetch=False),
+    'shuffle': dict(shuffle=True, prefetch=False),
+    'shuffle+prefetch': dict(shuffle=True, prefetch=True),
+}
+
+
+def make_values(horizon, num_envs, obs_size, actions_num, device, time_major):
+    storage = {
+        'obs': torch.randn(horizon, num_envs, obs_size, device=device),
+        'actions': torch.randn(horizon, num_envs, actions_num, device=device),
+        'mu': torch.randn(horizon, num_envs, actions_num, device=device),
+        'sigma': torch.rand(horizon, num_envs, actions_num, device=device),
+        'old_logp_actions': torch.randn(horizon, num_envs, device=device),
+        'old_values': torch.randn(horizon, num_envs, 1, device=device),
+        'returns': torch.randn(horizon, num_envs, 1, device=device),
+        'advantages': torch.randn(horizon, num_envs, device=device),
+        'dones': torch.zeros(horizon, num_envs, dtype=torch.uint8, device=device),
+    }
+    if time_major:
+        return {k: v.reshape(horizon * num_envs, *v.shape[2:]) for k, v in storage.items()}
+    return {k: v.transpose(0, 1).reshape(horizon * num_envs, *v.shape[2:]) for k, v in storage.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--horizon', type=int, default=32)
+    parser.add_argument('--envs', type=int, default=4096)
+    parser.add_argument('--minibatch', type=int, default=32768)
+    parser.add_argument('--obs-size', type=int, default=60)
+    parser.add_argument('--actions', type=int, default=8)
+    parser.add_argument('--mini-epochs', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--time-major', action='store_true', help='gather from the [horizon, envs] storage')
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    batch_size = args.horizon * args.envs
+    values = make_values(args.horizon, args.envs, args.obs_size, args.actions, device, args.time_major)
+    model = nn.Sequential(nn.Linear(args.obs_size, 256), nn.ELU(), nn.Linear(256, 128), nn.ELU(),
+                          nn.Linear(128, 64), nn.ELU(), nn.Linear(64, args.actions)).to(device)
+
+    def synchronize():
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+
+    print(f"{'mode':>18} {'samples/s':>12}")
+    for mode, sampling in MODES.items():
+        dataset = PPODataset(batch_size, args.minibatch, False, False, device, 1)
+        if args.time_major:
+            dataset.set_time_major(args.horizon, args.envs)
+        dataset.set_sampler(**sampling)
+        dataset.update_values_dict(values)
+
+        def run():
+            for _ in range(args.mini_epochs):
+                for i in range(len(dataset)):
+                    batch = dataset[i]
+                    loss = (model(batch['obs']) - batch['actions']).pow(2).mean()
+                    loss.backward()
+                    dataset.update_mu_sigma(batch['mu'], batch['sigma'])
+
+        run()
+        synchronize()
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            run()
+        synchronize()
+        seconds = (time.perf_counter() - start) / args.repeats
+        print(f'{mode:>18} {batch_size * args.mini_epochs / seconds:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ from rl_games.common import a2c_common
 from rl_games.algos_torch import torch_ext
 
 from rl_games.algos_torch import central_value
+from rl_games.algos_torch import cuda_graphs
 from rl_games.common import common_losses
 from rl_games.common import datasets
 
@@ -58,8 +59,25 @@ class A2CAgent(a2c_common.ContinuousA2CBase):
             self.value_mean_std = self.central_value_net.model.value_mean_std if self.has_central_value else self.model.value_mean_std
 
         self.has_value_loss = self.use_experimental_cv or not self.has_central_value
+        self.init_cuda_graphs()
         self.algo_observer.after_init(self)
 
+    def init_cuda_graphs(self):
+        # Replays policy inference and the minibatch update as CUDA graphs, see algos_torch/cuda_graphs.py
+        self.inference_graph = None
+        self.train_graph = None
+        if not self.config.get('cuda_graphs', False):
+            return
+        reason = cuda_graphs.unsupported_reason(self.ppo_device, self.is_rnn, self.mixed_precision, self.multi_gpu)
+        if reason is not None:
+            print(f'cuda_graphs {reason}, running eagerly')
+            return
+        # the entropy coefficient can be scheduled, the captured loss reads it from this tensor
+        self.entropy_coef_tensor = torch.tensor(float(self.entropy_coef), device=self.ppo_device)
+        self.inference_graph = cuda_graphs.CapturedStep(self.policy_inference, modules=[self.model])
+        self.train_graph = cuda_graphs.CapturedStep(lambda input_dict: self.minibatch_step(input_dict, self.entropy_coef_tensor),
+                                                    modules=[self.model], optimizers=[self.optimizer])
+
     def update_epoch(self):
         self.epoch_num += 1
         return self.epoch_num
@@ -75,7 +93,57 @@ class A2CAgent(a2c_common.ContinuousA2CBase):
     def get_masked_action_values(self, obs, action_masks):
         assert False
 
+    def policy_inference(self, input_dict):
+        with torch.no_grad():
+            return self.model({
+                'is_train': False,
+                'prev_actions': None,
+                'obs': input_dict['obs'],
+                'rnn_states': None,
+            })
+
+    def get_action_values(self, obs):
+        if self.inference_graph is None:
+            return super().get_action_values(obs)
+
+        self.model.eval()
+        res_dict = cuda_graphs.clone_outputs(self.inference_graph({'obs': self._preproc_obs(obs['obs'])}))
+        if self.has_central_value:
+            with torch.no_grad():
+                res_dict['values'] = self.get_central_value({
+                    'is_train': False,
+                    'states': obs['states'],
+                })
+        return res_dict
+
     def calc_gradients(self, input_dict):
+        lr_mul = 1.0
+        if self.train_graph is None:
+            outputs = self.minibatch_step(input_dict, self.entropy_coef)
+        else:
+            if not self.train_graph.graphs:
+                # a restored checkpoint may have replaced the learning rate tensor
+                cuda_graphs.make_capturable(self.optimizer)
+            self.entropy_coef_tensor.fill_(self.entropy_coef)
+            # the input normalization only updates its statistics in the first mini epoch
+            key = self.normalize_input and self.model.running_mean_std.training
+            outputs = cuda_graphs.clone_outputs(self.train_graph(input_dict, key=key))
+        a_loss, c_loss, entropy, kl_dist, action_log_probs, mu, sigma, b_loss = outputs
+
+        self.diagnostics.mini_batch(self,
+        {
+            'values' : input_dict['old_values'],
+            'returns' : input_dict['returns'],
+            'new_neglogp' : action_log_probs,
+            'old_neglogp' : input_dict['old_logp_actions'],
+            'masks' : input_dict.get('rnn_masks')
+        }, self.e_clip, 0)
+
+        self.train_result = (a_loss, c_loss, entropy, \
+            kl_dist, self.last_lr, lr_mul, \
+            mu, sigma, b_loss)
+
+    def minibatch_step(self, input_dict, entropy_coef):
         value_preds_batch = input_dict['old_values']
         old_action_log_probs_batch = input_dict['old_logp_actions']
         advantage = input_dict['advantages']
@@ -86,7 +154,6 @@ class A2CAgent(a2c_common.ContinuousA2CBase):
         obs_batch = input_dict['obs']
         obs_batch = self._preproc_obs(obs_batch)
 
-        lr_mul = 1.0
         curr_e_clip = self.e_clip
 
         batch_dict = {
@@ -127,7 +194,7 @@ class A2CAgent(a2c_common.ContinuousA2CBase):
             losses, sum_mask = torch_ext.apply_masks([a_loss.unsqueeze(1), c_loss , entropy.unsqueeze(1), b_loss.unsqueeze(1)], rnn_masks)
             a_loss, c_loss, entropy, b_loss = losses[0], losses[1], losses[2], losses[3]
 
-            loss = a_loss + 0.5 * c_loss * self.critic_coef - entropy * self.entropy_coef + b_loss * self.bounds_loss_coef
+            loss = a_loss + 0.5 * c_loss * self.critic_coef - entropy * entropy_coef + b_loss * self.bounds_loss_coef
             
             if self.multi_gpu:
                 self.optimizer.zero_grad()
@@ -145,18 +212,8 @@ class A2CAgent(a2c_common.ContinuousA2CBase):
             if rnn_masks is not None:
                 kl_dist = (kl_dist * rnn_masks).sum() / rnn_masks.numel()  #/ sum_mask
 
-        self.diagnostics.mini_batch(self,
-        {
-            'values' : value_preds_batch,
-            'returns' : return_batch,
-            'new_neglogp' : action_log_probs,
-            'old_neglogp' : old_action_log_probs_batch,
-            'masks' : rnn_masks
-        }, curr_e_clip, 0)      
-
-        self.train_result = (a_loss, c_loss, entropy, \
-            kl_dist, self.last_lr, lr_mul, \
-            mu.detach(), sigma.detach(), b_loss)
+        return a_loss.detach(), c_loss.detach(), entropy.detach(), kl_dist, \
+            action_log_probs.detach(), mu.detach(), sigma.detach(), b_loss.detach()
 
     def train_actor_critic(self, input_dict):
         self.calc_gradients(input_dict)
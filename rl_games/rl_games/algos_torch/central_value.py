@@ -173,6 +173,15 @@ class CentralValueTrain(nn.Module):
         for s in self.rnn_states:
             s[:,all_done_indices,:] = s[:,all_done_indices,:] * 0.0
 
+    def post_step_rnn_masked(self, all_done_mask):
+        if not self.is_rnn:
+            return
+        if not self.zero_rnn_on_done:
+            return
+        not_dones = 1.0 - all_done_mask.view(-1, self.num_agents)[:, 0].float()
+        for s in self.rnn_states:
+            s.mul_(not_dones.view(1, -1, 1))
+
     def forward(self, input_dict):
         return self.model(input_dict)
 
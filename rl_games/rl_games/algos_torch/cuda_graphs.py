@@ -0,0 +1,158 @@
+'''
+CUDA graph capture of the launch bound steps of PPO.
+
+With the small MLPs of the Isaac Gym tasks, policy inference and the minibatch update are a few
+hundred tiny kernels each, and the time goes into launching them rather than running them. A
+captured step replays all of its kernels with a single launch.
+
+A graph reads its inputs from and writes its outputs to fixed addresses, so CapturedStep copies the
+inputs of every call into static buffers and hands out the static outputs. Anything the step must
+change between calls (parameters, optimizer and normalization state, learning rate, loss
+coefficients) has to live in tensors that are updated in place.
+'''
+
+import torch
+
+
+def _leaves(tree):
+    if isinstance(tree, torch.Tensor):
+        yield tree
+    elif isinstance(tree, dict):
+        for k in sorted(tree):
+            yield from _leaves(tree[k])
+    elif isinstance(tree, (list, tuple)):
+        for v in tree:
+            yield from _leaves(v)
+
+
+def _map_tensors(fn, tree):
+    if isinstance(tree, torch.Tensor):
+        return fn(tree)
+    if isinstance(tree, dict):
+        return {k: _map_tensors(fn, v) for k, v in tree.items()}
+    if isinstance(tree, (list, tuple)):
+        return type(tree)(_map_tensors(fn, v) for v in tree)
+    return tree
+
+
+def _signature(tree):
+    '''Structure, shapes, dtypes and non tensor values of the inputs, a graph is only valid for one'''
+    if isinstance(tree, torch.Tensor):
+        return ('tensor', tuple(tree.shape), tree.dtype, tree.device)
+    if isinstance(tree, dict):
+        return ('dict',) + tuple((k, _signature(tree[k])) for k in sorted(tree))
+    if isinstance(tree, (list, tuple)):
+        return (type(tree).__name__,) + tuple(_signature(v) for v in tree)
+    return tree
+
+
+def clone_outputs(tree):
+    '''Copies of the static outputs of a replay, which the next replay overwrites'''
+    return _map_tensors(lambda t: t.clone(), tree)
+
+
+class CapturedStep:
+    '''
+    `fn(inputs)` replayed as a CUDA graph, one graph per input signature.
+
+    The first call with a new signature warms `fn` up on a side stream and captures it. The warm up
+    runs really update the parameters, optimizer state and buffers, so the state of `modules` and
+    `optimizers` is restored afterwards: state that existed before is copied back and state the
+    warm up created (e.g. the Adam moments) is zeroed, which is how it starts out.
+
+    Args:
+        fn: Function of a tree (dicts, lists) of tensors, returning a tree of tensors
+        modules: Modules whose parameters and buffers fn changes
+        optimizers: Optimizers fn steps, they need capturable=True
+        warmup_iters: Eager runs before the capture
+    '''
+    def __init__(self, fn, modules=(), optimizers=(), warmup_iters=3):
+        self.fn = fn
+        self.modules = list(modules)
+        self.optimizers = list(optimizers)
+        self.warmup_iters = warmup_iters
+        self.graphs = {}
+
+    def __call__(self, inputs, key=None):
+        '''
+        Replays the graph of `inputs` (captured on first use). Returns the static outputs, valid until
+        the next call. `key` separates graphs of the same inputs, e.g. train and eval mode
+        '''
+        signature = (key, _signature(inputs))
+        if signature not in self.graphs:
+            self.graphs[signature] = self._capture(inputs)
+        graph, static_inputs, static_outputs = self.graphs[signature]
+        for static, value in zip(_leaves(static_inputs), _leaves(inputs)):
+            static.copy_(value)
+        graph.replay()
+        return static_outputs
+
+    def _optimizer_state(self):
+        return [t for optimizer in self.optimizers for state in optimizer.state.values()
+                for t in state.values() if isinstance(t, torch.Tensor)]
+
+    def _capture(self, inputs):
+        static_inputs = _map_tensors(lambda t: t.clone(), inputs)
+        module_states = [{k: v.clone() for k, v in module.state_dict().items()} for module in self.modules]
+        optimizer_state = {id(t): (t, t.clone()) for t in self._optimizer_state()}
+
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(self.warmup_iters):
+                self.fn(static_inputs)
+        torch.cuda.current_stream().wait_stream(stream)
+
+        with torch.no_grad():
+            for module, state in zip(self.modules, module_states):
+                module.load_state_dict(state)
+            for t in self._optimizer_state():
+                if id(t) in optimizer_state:
+                    t.copy_(optimizer_state[id(t)][1])
+                else:
+                    t.zero_()
+
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            static_outputs = self.fn(static_inputs)
+        return graph, static_inputs, static_outputs
+
+
+def make_capturable(optimizer):
+    '''
+    Prepares an Adam-like optimizer for capture: the step counts live on the device and the learning
+    rate becomes a tensor, update it with set_lr so that the captured step sees the new value.
+
+    The single tensor implementation is forced, the foreach one of older torch releases (such as the
+    pinned torch<=2.0.0) takes the learning rate as a Python scalar and would read a tensor back to the
+    host during capture
+    '''
+    for group in optimizer.param_groups:
+        group['capturable'] = True
+        group['foreach'] = False
+        if not isinstance(group['lr'], torch.Tensor):
+            group['lr'] = torch.tensor(float(group['lr']), device=group['params'][0].device)
+    for param, state in optimizer.state.items():
+        if 'step' in state and isinstance(state['step'], torch.Tensor):
+            state['step'] = state['step'].to(device=param.device, dtype=torch.float32)
+
+
+def set_lr(optimizer, lr):
+    for group in optimizer.param_groups:
+        if isinstance(group['lr'], torch.Tensor):
+            group['lr'].fill_(lr)
+        else:
+            group['lr'] = lr
+
+
+def unsupported_reason(device, is_rnn=False, mixed_precision=False, multi_gpu=False):
+    '''Why the PPO steps of this run cannot be captured, None if they can'''
+    if torch.device(device).type != 'cuda' or not torch.cuda.is_available():
+        return 'needs a CUDA device'
+    if is_rnn:
+        return 'does not support recurrent networks'
+    if mixed_precision:
+        return 'does not support mixed_precision, the grad scaler checks for infs on the host'
+    if multi_gpu:
+        return 'does not support multi_gpu'
+    return None
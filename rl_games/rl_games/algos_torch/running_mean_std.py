@@ -49,8 +49,12 @@ class RunningMeanStd(nn.Module):
             else:
                 mean = input.mean(self.axis) # along channel axis
                 var = input.var(self.axis)
-            self.running_mean, self.running_var, self.count = self._update_mean_var_count_from_moments(self.running_mean, self.running_var, self.count, 
+            new_mean, new_var, new_count = self._update_mean_var_count_from_moments(self.running_mean, self.running_var, self.count,
                                                     mean, var, input.size()[0] )
+            # in place, so that a captured CUDA graph keeps updating the same buffers
+            self.running_mean.copy_(new_mean)
+            self.running_var.copy_(new_var)
+            self.count.copy_(new_count)
 
         # change shape
         if self.per_channel:
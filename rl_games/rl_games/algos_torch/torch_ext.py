@@ -309,6 +309,77 @@ class AverageMeter(nn.Module):
         return self.mean.squeeze(0).cpu().numpy()
 
 
+class DeviceAverageMeter(nn.Module):
+    '''
+    AverageMeter updated with a mask over all the envs instead of the selected values. The size stays
+    on the device as well, so an update never waits for the GPU, only current_size and get_mean do.
+    '''
+    def __init__(self, in_shape, max_size):
+        super(DeviceAverageMeter, self).__init__()
+        self.max_size = max_size
+        self.register_buffer("mean", torch.zeros(in_shape, dtype = torch.float32))
+        self.register_buffer("size", torch.zeros((), dtype = torch.long))
+
+    def update_masked(self, values, mask):
+        '''Same as update(values[mask.nonzero()]), whose values have the extra dimension of the indexing'''
+        self._update(values.unsqueeze(1), mask)
+
+    def _update(self, values, mask):
+        mask = mask.view(-1)
+        count = mask.sum()
+        weights = mask.float().view(-1, *[1] * (values.dim() - 1))
+        new_mean = (values.float() * weights).sum(dim=0) / count.clamp(min=1)
+        size = count.clamp(max=self.max_size)
+        old_size = torch.minimum(self.max_size - size, self.size)
+        size_sum = old_size + size
+        mean = (self.mean * old_size + new_mean * size) / size_sum.clamp(min=1)
+        self.mean = torch.where(count > 0, mean, self.mean)
+        self.size = torch.where(count > 0, size_sum, self.size)
+
+    def update(self, values):
+        self._update(values, torch.ones(values.size()[0], dtype=torch.bool, device=values.device))
+
+    def clear(self):
+        self.size.zero_()
+        self.mean.fill_(0)
+
+    @property
+    def current_size(self):
+        return int(self.size.item())
+
+    def __len__(self):
+        return self.current_size
+
+    def get_mean(self):
+        return self.mean.squeeze(0).cpu().numpy()
+
+
+class DeviceWindow(nn.Module):
+    '''
+    The last max_size values pushed with a mask, like deque(maxlen=max_size) but kept on the device.
+    If more than max_size values are pushed at once, an arbitrary max_size of them are kept.
+    '''
+    def __init__(self, max_size):
+        super(DeviceWindow, self).__init__()
+        self.max_size = max_size
+        # the extra last slot absorbs the writes of masked out values
+        self.register_buffer("values", torch.zeros(max_size + 1, dtype = torch.float32))
+        self.register_buffer("pushed", torch.zeros((), dtype = torch.long))
+
+    def push_masked(self, values, mask):
+        mask = mask.view(-1)
+        positions = (self.pushed + torch.cumsum(mask.long(), dim=0) - 1) % self.max_size
+        positions = positions.masked_fill(~mask, self.max_size)
+        self.values.scatter_(0, positions, values.view(-1).float())
+        self.pushed += mask.sum()
+
+    def clear(self):
+        self.pushed.zero_()
+
+    def get_values(self):
+        return self.values[:min(int(self.pushed.item()), self.max_size)].cpu().numpy()
+
+
 class IdentityRNN(nn.Module):
     def __init__(self, in_shape, out_shape):
         super(IdentityRNN, self).__init__()
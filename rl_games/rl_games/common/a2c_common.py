@@ -1,3 +1,4 @@
+import contextlib
 import copy
 import os
 
@@ -6,10 +7,11 @@ from rl_games.common import vecenv
 from rl_games.algos_torch.moving_mean_std import GeneralizedMovingStats
 from rl_games.algos_torch.self_play_manager import SelfPlayManager
 from rl_games.algos_torch import torch_ext
+from rl_games.algos_torch import cuda_graphs
 from rl_games.common import schedulers
 from rl_games.common.experience import ExperienceBuffer
 from rl_games.common.interval_summary_writer import IntervalSummaryWriter
-from rl_games.common.diagnostics import DefaultDiagnostics, PpoDiagnostics
+from rl_games.common.diagnostics import DefaultDiagnostics, PpoDiagnostics, HostSyncCounter
 from rl_games.algos_torch import  model_builder
 from rl_games.interfaces.base_algorithm import  BaseAlgorithm
 import numpy as np
@@ -25,6 +27,7 @@ import torch.distributed as dist
 from time import sleep
 
 from rl_games.common import common_losses
+from rl_games.common import gae
 
 
 def swap_and_flatten01(arr):
@@ -36,6 +39,15 @@ def swap_and_flatten01(arr):
     s = arr.size()
     return arr.transpose(0, 1).reshape(s[0] * s[1], *s[2:])
 
+def flatten01(arr):
+    """
+    flatten axes 0 and 1 without moving the data, a view of a contiguous arr
+    """
+    if arr is None:
+        return arr
+    s = arr.size()
+    return arr.reshape(s[0] * s[1], *s[2:])
+
 def rescale_actions(low, high, action):
     d = (high - low) / 2.0
     m = (high + low) / 2.0
@@ -213,12 +225,26 @@ class A2CBase(BaseAlgorithm):
         self.grad_norm = config['grad_norm']
         self.gamma = self.config['gamma']
         self.tau = self.config['tau']
+        # 'loop' (reference), 'jit', 'compile', 'scan' or 'triton', see rl_games/common/gae.py
+        self.gae_backend = gae.resolve_backend(self.config.get('gae_backend', 'loop'), self.ppo_device)
 
         self.games_to_track = self.config.get('games_to_track', 100)
         print('current training device:', self.ppo_device)
-        self.game_rewards = torch_ext.AverageMeter(self.value_size, self.games_to_track).to(self.ppo_device)
-        self.game_shaped_rewards = torch_ext.AverageMeter(self.value_size, self.games_to_track).to(self.ppo_device)
-        self.game_lengths = torch_ext.AverageMeter(1, self.games_to_track).to(self.ppo_device)
+        # Episode stats are updated with done masks on the device instead of the done indices,
+        # the rollout then no longer waits for the GPU at every step to find the finished envs
+        self.device_episode_stats = self.config.get('device_episode_stats', False)
+        meter = torch_ext.DeviceAverageMeter if self.device_episode_stats else torch_ext.AverageMeter
+        self.game_rewards = meter(self.value_size, self.games_to_track).to(self.ppo_device)
+        self.game_shaped_rewards = meter(self.value_size, self.games_to_track).to(self.ppo_device)
+        self.game_lengths = meter(1, self.games_to_track).to(self.ppo_device)
+        # Minibatches gather from the [horizon, envs] rollout storage instead of a transposed copy of it
+        self.time_major_batch = self.config.get('time_major_batch', False)
+        # Random minibatches every mini epoch, and gathering the next minibatch on a side stream
+        self.minibatch_shuffle = self.config.get('minibatch_shuffle', False)
+        self.minibatch_prefetch = self.config.get('minibatch_prefetch', False)
+        # Counts the host syncs of every rollout, logged as performance/host_syncs_per_epoch
+        self.count_host_syncs = self.config.get('count_host_syncs', False)
+        self.host_sync_counter = HostSyncCounter(self.ppo_device) if self.count_host_syncs else contextlib.nullcontext()
         self.obs = None
         self.games_num = self.config['minibatch_size'] // self.seq_len # it is used only for current rnn implementation
         self.batch_size = self.horizon_length * self.num_actors * self.num_agents
@@ -346,6 +372,8 @@ class A2CBase(BaseAlgorithm):
         self.writer.add_scalar('performance/rl_update_time', update_time, frame)
         self.writer.add_scalar('performance/step_inference_time', play_time, frame)
         self.writer.add_scalar('performance/step_time', step_time, frame)
+        if self.count_host_syncs:
+            self.writer.add_scalar('performance/host_syncs_per_epoch', self.host_sync_counter.reset(), frame)
         self.writer.add_scalar('losses/a_loss', torch_ext.mean_list(a_losses).item(), frame)
         self.writer.add_scalar('losses/c_loss', torch_ext.mean_list(c_losses).item(), frame)
                 
@@ -373,9 +401,9 @@ class A2CBase(BaseAlgorithm):
             dist.broadcast(lr_tensor, 0)
             lr = lr_tensor.item()
 
-        for param_group in self.optimizer.param_groups:
-            param_group['lr'] = lr
-        
+        # in place if the optimizer was prepared for CUDA graphs
+        cuda_graphs.set_lr(self.optimizer, lr)
+
         #if self.has_central_value:
         #    self.central_value_net.update_lr(lr)
 
@@ -459,6 +487,15 @@ class A2CBase(BaseAlgorithm):
             assert((self.horizon_length * total_agents // self.num_minibatches) % self.seq_len == 0)
             self.mb_rnn_states = [torch.zeros((num_seqs, s.size()[0], total_agents, s.size()[2]), dtype = torch.float32, device=self.ppo_device) for s in self.rnn_states]
 
+        if self.time_major_batch and self.num_agents > 1:
+            print('time_major_batch does not support multiple agents per env, using the env major batch')
+            self.time_major_batch = False
+        ppo_datasets = [self.dataset] + ([self.central_value_net.dataset] if self.has_central_value else [])
+        for dataset in ppo_datasets:
+            if self.time_major_batch:
+                dataset.set_time_major(self.horizon_length, self.num_actors)
+            dataset.set_sampler(self.minibatch_shuffle, self.minibatch_prefetch)
+
     def init_rnn_from_model(self, model):
         self.is_rnn = self.model.is_rnn()
 
@@ -518,37 +555,12 @@ class A2CBase(BaseAlgorithm):
         return obs
 
     def discount_values(self, fdones, last_extrinsic_values, mb_fdones, mb_extrinsic_values, mb_rewards):
-        lastgaelam = 0
-        mb_advs = torch.zeros_like(mb_rewards)
-
-        for t in reversed(range(self.horizon_length)):
-            if t == self.horizon_length - 1:
-                nextnonterminal = 1.0 - fdones
-                nextvalues = last_extrinsic_values
-            else:
-                nextnonterminal = 1.0 - mb_fdones[t+1]
-                nextvalues = mb_extrinsic_values[t+1]
-            nextnonterminal = nextnonterminal.unsqueeze(1)
-
-            delta = mb_rewards[t] + self.gamma * nextvalues * nextnonterminal - mb_extrinsic_values[t]
-            mb_advs[t] = lastgaelam = delta + self.gamma * self.tau * nextnonterminal * lastgaelam
-        return mb_advs
+        return gae.compute_gae(self.gamma, self.tau, fdones, last_extrinsic_values, mb_fdones, mb_extrinsic_values,
+                               mb_rewards, backend=self.gae_backend)
 
     def discount_values_masks(self, fdones, last_extrinsic_values, mb_fdones, mb_extrinsic_values, mb_rewards, mb_masks):
-        lastgaelam = 0
-        mb_advs = torch.zeros_like(mb_rewards)
-        for t in reversed(range(self.horizon_length)):
-            if t == self.horizon_length - 1:
-                nextnonterminal = 1.0 - fdones
-                nextvalues = last_extrinsic_values
-            else:
-                nextnonterminal = 1.0 - mb_fdones[t+1]
-                nextvalues = mb_extrinsic_values[t+1]
-            nextnonterminal = nextnonterminal.unsqueeze(1)
-            masks_t = mb_masks[t].unsqueeze(1)
-            delta = (mb_rewards[t] + self.gamma * nextvalues * nextnonterminal  - mb_extrinsic_values[t])
-            mb_advs[t] = lastgaelam = (delta + self.gamma * self.tau * nextnonterminal * lastgaelam) * masks_t
-        return mb_advs
+        return gae.compute_gae(self.gamma, self.tau, fdones, last_extrinsic_values, mb_fdones, mb_extrinsic_values,
+                               mb_rewards, mb_masks, backend=self.gae_backend)
 
     def clear_stats(self):
         batch_size = self.num_agents * self.num_actors
@@ -663,6 +675,17 @@ class A2CBase(BaseAlgorithm):
                 obs_batch = obs_batch.float() / 255.0
         return obs_batch
 
+    def update_episode_stats_masked(self, infos):
+        # The first agent of every env stands for the env, as all_done_indices[::self.num_agents] does
+        env_done_mask = self.dones.bool().view(-1, self.num_agents).clone()
+        env_done_mask[:, 1:] = False
+        env_done_mask = env_done_mask.view(-1)
+
+        self.game_rewards.update_masked(self.current_rewards, env_done_mask)
+        self.game_shaped_rewards.update_masked(self.current_shaped_rewards, env_done_mask)
+        self.game_lengths.update_masked(self.current_lengths, env_done_mask)
+        self.algo_observer.process_infos_masked(infos, env_done_mask)
+
     def play_steps(self):
         update_list = self.update_list
 
@@ -700,13 +723,16 @@ class A2CBase(BaseAlgorithm):
             self.current_rewards += rewards
             self.current_shaped_rewards += shaped_rewards
             self.current_lengths += 1
-            all_done_indices = self.dones.nonzero(as_tuple=False)
-            env_done_indices = all_done_indices[::self.num_agents]
-     
-            self.game_rewards.update(self.current_rewards[env_done_indices])
-            self.game_shaped_rewards.update(self.current_shaped_rewards[env_done_indices])
-            self.game_lengths.update(self.current_lengths[env_done_indices])
-            self.algo_observer.process_infos(infos, env_done_indices)
+            if self.device_episode_stats:
+                self.update_episode_stats_masked(infos)
+            else:
+                all_done_indices = self.dones.nonzero(as_tuple=False)
+                env_done_indices = all_done_indices[::self.num_agents]
+
+                self.game_rewards.update(self.current_rewards[env_done_indices])
+                self.game_shaped_rewards.update(self.current_shaped_rewards[env_done_indices])
+                self.game_lengths.update(self.current_lengths[env_done_indices])
+                self.algo_observer.process_infos(infos, env_done_indices)
 
             not_dones = 1.0 - self.dones.float()
 
@@ -723,8 +749,9 @@ class A2CBase(BaseAlgorithm):
         mb_advs = self.discount_values(fdones, last_values, mb_fdones, mb_values, mb_rewards)
         mb_returns = mb_advs + mb_values
 
-        batch_dict = self.experience_buffer.get_transformed_list(swap_and_flatten01, self.tensor_list)
-        batch_dict['returns'] = swap_and_flatten01(mb_returns)
+        flatten_op = flatten01 if self.time_major_batch else swap_and_flatten01
+        batch_dict = self.experience_buffer.get_transformed_list(flatten_op, self.tensor_list)
+        batch_dict['returns'] = flatten_op(mb_returns)
         batch_dict['played_frames'] = self.batch_size
         batch_dict['step_time'] = step_time
 
@@ -773,20 +800,31 @@ class A2CBase(BaseAlgorithm):
             self.current_rewards += rewards
             self.current_shaped_rewards += shaped_rewards
             self.current_lengths += 1
-            all_done_indices = self.dones.nonzero(as_tuple=False)
-            env_done_indices = all_done_indices[::self.num_agents]
-
-            if len(all_done_indices) > 0:
+            if self.device_episode_stats:
+                all_done_mask = self.dones.bool()
                 if self.zero_rnn_on_done:
+                    not_dones = (~all_done_mask).float().view(1, -1, 1)
                     for s in self.rnn_states:
-                        s[:, all_done_indices, :] = s[:, all_done_indices, :] * 0.0
+                        s.mul_(not_dones)
                 if self.has_central_value:
-                    self.central_value_net.post_step_rnn(all_done_indices)
+                    self.central_value_net.post_step_rnn_masked(all_done_mask)
 
-            self.game_rewards.update(self.current_rewards[env_done_indices])
-            self.game_shaped_rewards.update(self.current_shaped_rewards[env_done_indices])
-            self.game_lengths.update(self.current_lengths[env_done_indices])
-            self.algo_observer.process_infos(infos, env_done_indices)
+                self.update_episode_stats_masked(infos)
+            else:
+                all_done_indices = self.dones.nonzero(as_tuple=False)
+                env_done_indices = all_done_indices[::self.num_agents]
+
+                if len(all_done_indices) > 0:
+                    if self.zero_rnn_on_done:
+                        for s in self.rnn_states:
+                            s[:, all_done_indices, :] = s[:, all_done_indices, :] * 0.0
+                    if self.has_central_value:
+                        self.central_value_net.post_step_rnn(all_done_indices)
+
+                self.game_rewards.update(self.current_rewards[env_done_indices])
+                self.game_shaped_rewards.update(self.current_shaped_rewards[env_done_indices])
+                self.game_lengths.update(self.current_lengths[env_done_indices])
+                self.algo_observer.process_infos(infos, env_done_indices)
 
             not_dones = 1.0 - self.dones.float()
 
@@ -802,8 +840,9 @@ class A2CBase(BaseAlgorithm):
         mb_rewards = self.experience_buffer.tensor_dict['rewards']
         mb_advs = self.discount_values(fdones, last_values, mb_fdones, mb_values, mb_rewards)
         mb_returns = mb_advs + mb_values
-        batch_dict = self.experience_buffer.get_transformed_list(swap_and_flatten01, self.tensor_list)
-        batch_dict['returns'] = swap_and_flatten01(mb_returns)
+        flatten_op = flatten01 if self.time_major_batch else swap_and_flatten01
+        batch_dict = self.experience_buffer.get_transformed_list(flatten_op, self.tensor_list)
+        batch_dict['returns'] = flatten_op(mb_returns)
         batch_dict['played_frames'] = self.batch_size
         states = []
         for mb_s in mb_rnn_states:
@@ -845,7 +884,7 @@ class DiscreteA2CBase(A2CBase):
         self.set_eval()
         play_time_start = time.time()
 
-        with torch.no_grad():
+        with torch.no_grad(), self.host_sync_counter:
             if self.is_rnn:
                 batch_dict = self.play_steps_rnn()
             else:
@@ -1108,7 +1147,7 @@ class ContinuousA2CBase(A2CBase):
 
         self.set_eval()
         play_time_start = time.time()
-        with torch.no_grad():
+        with torch.no_grad(), self.host_sync_counter:
             if self.is_rnn:
                 batch_dict = self.play_steps_rnn()
             else:
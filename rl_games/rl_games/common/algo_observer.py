@@ -16,6 +16,11 @@ class AlgoObserver:
     def process_infos(self, infos, done_indices):
         pass
 
+    def process_infos_masked(self, infos, done_mask):
+        # Called instead of process_infos with device_episode_stats, done_mask flags the finished envs.
+        # Observers that can work with the mask override this, others get the done indices
+        self.process_infos(infos, done_mask.nonzero(as_tuple=False))
+
     def after_steps(self):
         pass
 
@@ -68,6 +73,12 @@ class DefaultAlgoObserver(AlgoObserver):
                 if game_res is not None and len(game_res) > ind//self.algo.num_agents:
                     self.game_scores.update(torch.from_numpy(np.asarray([game_res[ind//self.algo.num_agents]])).to(self.algo.ppo_device))
 
+    def process_infos_masked(self, infos, done_mask):
+        # The done indices are only needed for the scores
+        if not infos or (isinstance(infos, dict) and not any(k in infos for k in ('battle_won', 'scores', 'lives'))):
+            return
+        self.process_infos(infos, done_mask.nonzero(as_tuple=False))
+
     def after_clear_stats(self):
         self.game_scores.clear()
 
@@ -107,6 +118,10 @@ class IsaacAlgoObserver(AlgoObserver):
                 if isinstance(v, float) or isinstance(v, int) or (isinstance(v, torch.Tensor) and len(v.shape) == 0):
                     self.direct_info[k] = v
 
+    def process_infos_masked(self, infos, done_mask):
+        # the done indices are not used
+        self.process_infos(infos, None)
+
     def after_clear_stats(self):
         # clear stored buffers
         self.mean_scores.clear()
@@ -2,6 +2,8 @@ import torch
 import copy
 from torch.utils.data import Dataset
 
+from rl_games.common.samplers import MinibatchSampler
+
 class PPODataset(Dataset):
     def __init__(self, batch_size, minibatch_size, is_discrete, is_rnn, device, seq_len):
         self.is_rnn = is_rnn
@@ -18,34 +20,56 @@ class PPODataset(Dataset):
         self.flat_indexes = torch.arange(total_games * self.seq_len, dtype=torch.long, device=self.device).reshape(total_games, self.seq_len)
 
         self.special_names = ['rnn_states']
+        # storage index of every sample, None if the values are stored in sample order
+        self.storage_indexes = None
+        self.sampler = None
+
+    def set_time_major(self, horizon_length, num_envs):
+        '''
+        The values are the flattened [horizon_length, num_envs, ...] rollout storage instead of a
+        transposed [num_envs, horizon_length, ...] copy of it. Minibatches gather the samples the env
+        major layout would have sliced, so the training is the same without the copy.
+        '''
+        positions = torch.arange(horizon_length * num_envs, dtype=torch.long, device=self.device)
+        self.storage_indexes = (positions % horizon_length) * num_envs + positions // horizon_length
+
+    def set_sampler(self, shuffle=False, prefetch=False):
+        '''Shuffled and/or prefetched minibatches, see MinibatchSampler. Contiguous slices if neither'''
+        self.sampler = MinibatchSampler(self, shuffle, prefetch) if shuffle or prefetch else None
+
+    def _select(self, start, end):
+        if self.storage_indexes is None:
+            return slice(start, end)
+        return self.storage_indexes[start:end]
 
     def update_values_dict(self, values_dict):
         self.values_dict = values_dict     
 
     def update_mu_sigma(self, mu, sigma):	    
-        start = self.last_range[0]	           
-        end = self.last_range[1]	
-        self.values_dict['mu'][start:end] = mu	
-        self.values_dict['sigma'][start:end] = sigma 
+        self.values_dict['mu'][self.last_selection] = mu
+        self.values_dict['sigma'][self.last_selection] = sigma
 
     def __len__(self):
         return self.length
 
     def _get_item_rnn(self, idx):
+        if self.sampler is not None:
+            return self.sampler.get(idx)
         gstart = idx * self.num_games_batch
         gend = (idx + 1) * self.num_games_batch
         start = gstart * self.seq_len
         end = gend * self.seq_len
         self.last_range = (start, end)   
+        self.last_selection = selection = self._select(start, end)
         input_dict = {}
         for k,v in self.values_dict.items():
             if k not in self.special_names:
                 if isinstance(v, dict):
-                    v_dict = {kd:vd[start:end] for kd, vd in v.items()}
+                    v_dict = {kd:vd[selection] for kd, vd in v.items()}
                     input_dict[k] = v_dict
                 else:
                     if v is not None:
-                        input_dict[k] = v[start:end]
+                        input_dict[k] = v[selection]
                     else:
                         input_dict[k] = None
         
@@ -55,17 +79,20 @@ class PPODataset(Dataset):
         return input_dict
 
     def _get_item(self, idx):
+        if self.sampler is not None:
+            return self.sampler.get(idx)
         start = idx * self.minibatch_size
         end = (idx + 1) * self.minibatch_size
         self.last_range = (start, end)
+        self.last_selection = selection = self._select(start, end)
         input_dict = {}
         for k,v in self.values_dict.items():
             if k not in self.special_names and v is not None:
                 if type(v) is dict:
-                    v_dict = { kd:vd[start:end] for kd, vd in v.items() }
+                    v_dict = { kd:vd[selection] for kd, vd in v.items() }
                     input_dict[k] = v_dict
                 else:
-                    input_dict[k] = v[start:end]
+                    input_dict[k] = v[selection]
                 
         return input_dict
 
@@ -1,3 +1,5 @@
+import warnings
+
 import torch
 import rl_games.algos_torch.torch_ext as torch_ext
 
@@ -58,7 +60,34 @@ class PpoDiagnostics(DefaultDiagnostics):
             clip_frac = torch_ext.policy_clip_fraction(new_neglogp, old_neglogp, e_clip, masks)
             self.exp_vars.append(exp_var)
             self.clip_fracs.append(clip_frac)
-            
 
-            
 
+class HostSyncCounter(object):
+    '''
+    Counts the operations that make the host wait for the GPU (nonzero, item, blocking copies to the
+    cpu, ...) inside `with counter:` blocks, through torch.cuda.set_sync_debug_mode('warn').
+    Counts nothing on other devices.
+    '''
+    def __init__(self, device):
+        self.enabled = torch.device(device).type == 'cuda' and hasattr(torch.cuda, 'set_sync_debug_mode')
+        self.count = 0
+
+    def __enter__(self):
+        if self.enabled:
+            self.catcher = warnings.catch_warnings(record=True)
+            self.records = self.catcher.__enter__()
+            warnings.simplefilter('always')
+            self.prev_mode = torch.cuda.get_sync_debug_mode()
+            torch.cuda.set_sync_debug_mode('warn')
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.enabled:
+            torch.cuda.set_sync_debug_mode(self.prev_mode)
+            self.count += sum('synchronizing CUDA operation' in str(w.message) for w in self.records)
+            self.catcher.__exit__(*exc_info)
+        return False
+
+    def reset(self):
+        count, self.count = self.count, 0
+        return count
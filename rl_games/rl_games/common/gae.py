@@ -0,0 +1,175 @@
+"""
+Generalized advantage estimation over a whole rollout.
+
+All backends compute the same advantages for rollouts laid out as [horizon, num_envs, value_size]:
+
+    delta_t = r_t + gamma * V_{t+1} * (1 - done_{t+1}) - V_t
+    A_t = (delta_t + gamma * tau * (1 - done_{t+1}) * A_{t+1}) * mask_t
+
+'loop'    the reference implementation, one Python iteration (and several kernels) per step
+'jit'     the recurrence as a TorchScript loop, deltas and coefficients computed for all steps at once
+'compile' the same loop compiled with torch.compile, which fuses it into a few kernels per horizon
+'scan'    a log-depth parallel scan of the linear recurrence, about 4 * log2(horizon) kernels
+'triton'  a single fused kernel, one thread per env and value, looping backwards over the horizon
+
+'triton' needs triton and CUDA tensors, 'compile' needs torch >= 2.0, see resolve_backend.
+"""
+
+import torch
+
+try:
+    import triton
+    import triton.language as tl
+except ImportError:
+    triton = None
+
+BACKENDS = ('loop', 'jit', 'compile', 'scan', 'triton')
+
+
+def gae_loop(gamma, tau, fdones, last_values, mb_fdones, mb_values, mb_rewards, mb_masks=None):
+    horizon_length = mb_rewards.shape[0]
+    lastgaelam = 0
+    mb_advs = torch.zeros_like(mb_rewards)
+    for t in reversed(range(horizon_length)):
+        if t == horizon_length - 1:
+            nextnonterminal = 1.0 - fdones
+            nextvalues = last_values
+        else:
+            nextnonterminal = 1.0 - mb_fdones[t+1]
+            nextvalues = mb_values[t+1]
+        nextnonterminal = nextnonterminal.unsqueeze(1)
+
+        delta = mb_rewards[t] + gamma * nextvalues * nextnonterminal - mb_values[t]
+        lastgaelam = delta + gamma * tau * nextnonterminal * lastgaelam
+        if mb_masks is not None:
+            lastgaelam = lastgaelam * mb_masks[t].unsqueeze(1)
+        mb_advs[t] = lastgaelam
+    return mb_advs
+
+
+def gae_terms(gamma, tau, fdones, last_values, mb_fdones, mb_values, mb_rewards, mb_masks=None):
+    """
+    Deltas and decay coefficients of all steps at once, the advantages then follow the linear
+    recurrence A_t = delta_t + coef_t * A_{t+1}
+    """
+    next_nonterminal = 1.0 - torch.cat([mb_fdones[1:], fdones.unsqueeze(0)]).unsqueeze(-1)
+    next_values = torch.cat([mb_values[1:], last_values.unsqueeze(0)])
+    delta = mb_rewards + gamma * next_values * next_nonterminal - mb_values
+    coef = (gamma * tau) * next_nonterminal
+    if mb_masks is not None:
+        masks = mb_masks.unsqueeze(-1).to(delta.dtype)
+        delta = delta * masks
+        coef = coef * masks
+    return delta, coef.expand_as(delta)
+
+
+def _recurrence(delta, coef):
+    advs = torch.empty_like(delta)
+    lastgaelam = torch.zeros_like(delta[0])
+    for t in range(delta.shape[0] - 1, -1, -1):
+        lastgaelam = delta[t] + coef[t] * lastgaelam
+        advs[t] = lastgaelam
+    return advs
+
+
+_recurrence_jit = torch.jit.script(_recurrence)
+_recurrence_compiled = None
+
+
+def _compiled_recurrence():
+    global _recurrence_compiled
+    if _recurrence_compiled is None:
+        _recurrence_compiled = torch.compile(_recurrence, dynamic=False)
+    return _recurrence_compiled
+
+
+def linear_scan(delta, coef):
+    """
+    A_t = delta_t + coef_t * A_{t+1} (A_horizon = 0) by recursive doubling: after the step with
+    stride s, delta_t holds the sum over the next 2s steps and coef_t the product of their coefficients
+    """
+    horizon_length = delta.shape[0]
+    stride = 1
+    while stride < horizon_length:
+        head = horizon_length - stride
+        delta = torch.cat([torch.addcmul(delta[:head], coef[:head], delta[stride:]), delta[head:]])
+        if 2 * stride < horizon_length:
+            coef = torch.cat([coef[:head] * coef[stride:], coef[head:]])
+        stride *= 2
+    return delta
+
+
+if triton is not None:
+    @triton.jit
+    def _gae_kernel(rewards_ptr, values_ptr, dones_ptr, last_values_ptr, last_dones_ptr, masks_ptr, advs_ptr,
+                    horizon_length, num_values, value_size, gamma, gamma_tau,
+                    HAS_MASKS: tl.constexpr, BLOCK: tl.constexpr):
+        offsets = tl.program_id(0) * BLOCK + tl.arange(0, BLOCK)
+        valid = offsets < num_values
+        envs = offsets // value_size
+        num_envs = num_values // value_size
+
+        next_values = tl.load(last_values_ptr + offsets, mask=valid, other=0.).to(tl.float32)
+        next_nonterminal = 1.0 - tl.load(last_dones_ptr + envs, mask=valid, other=0.).to(tl.float32)
+        lastgaelam = tl.zeros([BLOCK], dtype=tl.float32)
+        for i in range(horizon_length):
+            t = horizon_length - 1 - i
+            values = tl.load(values_ptr + t * num_values + offsets, mask=valid, other=0.).to(tl.float32)
+            rewards = tl.load(rewards_ptr + t * num_values + offsets, mask=valid, other=0.).to(tl.float32)
+            delta = rewards + gamma * next_values * next_nonterminal - values
+            lastgaelam = delta + gamma_tau * next_nonterminal * lastgaelam
+            if HAS_MASKS:
+                lastgaelam = lastgaelam * tl.load(masks_ptr + t * num_envs + envs, mask=valid, other=0.).to(tl.float32)
+            tl.store(advs_ptr + t * num_values + offsets, lastgaelam, mask=valid)
+            next_values = values
+            next_nonterminal = 1.0 - tl.load(dones_ptr + t * num_envs + envs, mask=valid, other=0.).to(tl.float32)
+
+
+def gae_triton(gamma, tau, fdones, last_values, mb_fdones, mb_values, mb_rewards, mb_masks=None, block=256):
+    horizon_length, num_envs, value_size = mb_rewards.shape
+    num_values = num_envs * value_size
+    rewards, values = mb_rewards.contiguous(), mb_values.contiguous()
+    dones, last_dones = mb_fdones.float().contiguous(), fdones.float().contiguous()
+    masks = mb_masks.float().contiguous() if mb_masks is not None else dones
+    advs = torch.empty_like(rewards)
+    grid = (triton.cdiv(num_values, block),)
+    _gae_kernel[grid](rewards, values, dones, last_values.contiguous(), last_dones, masks, advs,
+                      horizon_length, num_values, value_size, float(gamma), float(gamma * tau),
+                      HAS_MASKS=mb_masks is not None, BLOCK=block)
+    return advs
+
+
+def compute_gae(gamma, tau, fdones, last_values, mb_fdones, mb_values, mb_rewards, mb_masks=None, backend='loop'):
+    """
+    Args:
+        fdones: [num_envs] dones after the last step, as floats
+        last_values: [num_envs, value_size] values after the last step
+        mb_fdones: [horizon, num_envs] dones before each step, as floats
+        mb_values, mb_rewards: [horizon, num_envs, value_size]
+        mb_masks: optional [horizon, num_envs], zeroes the advantages of masked steps
+    """
+    if backend == 'loop':
+        return gae_loop(gamma, tau, fdones, last_values, mb_fdones, mb_values, mb_rewards, mb_masks)
+    if backend == 'triton':
+        return gae_triton(gamma, tau, fdones, last_values, mb_fdones, mb_values, mb_rewards, mb_masks)
+    delta, coef = gae_terms(gamma, tau, fdones, last_values, mb_fdones, mb_values, mb_rewards, mb_masks)
+    if backend == 'jit':
+        return _recurrence_jit(delta, coef.contiguous())
+    if backend == 'compile':
+        return _compiled_recurrence()(delta, coef.contiguous())
+    if backend == 'scan':
+        return linear_scan(delta, coef)
+    raise ValueError(f'Unknown gae_backend {backend}, expected one of {BACKENDS}')
+
+
+def resolve_backend(backend, device):
+    """The requested backend, or the closest one that can run on `device` with the installed packages"""
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown gae_backend {backend}, expected one of {BACKENDS}')
+    if backend == 'triton' and (triton is None or torch.device(device).type != 'cuda'):
+        print(f'gae_backend triton needs triton and a CUDA device, using scan on {device}')
+        return 'scan'
+    if backend == 'compile' and not hasattr(torch, 'compile'):
+        print('gae_backend compile needs torch >= 2.0, using jit')
+        return 'jit'
+    return backend
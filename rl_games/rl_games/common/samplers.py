@@ -0,0 +1,124 @@
+import torch
+
+
+class MinibatchSampler:
+    '''
+    Draws the minibatches of a PPODataset.
+
+    shuffle: every mini epoch visits the samples in a new random order. Recurrent datasets shuffle
+        whole sequences, the seq_len steps of a sequence stay contiguous and in order.
+    prefetch: while a minibatch trains, the next one of the mini epoch is gathered on a side CUDA
+        stream. The first minibatch of a mini epoch is gathered in place, the previous mini epoch
+        may still be updating the mus and sigmas it reads.
+
+    Minibatches are gathered into two preallocated sets of buffers, used in turns, so a returned
+    minibatch stays valid until the next but one is drawn.
+    '''
+    def __init__(self, dataset, shuffle=False, prefetch=False):
+        self.dataset = dataset
+        self.shuffle = shuffle
+        self.device = torch.device(dataset.device)
+        self.prefetch = prefetch and self.device.type == 'cuda' and torch.cuda.is_available()
+        self.stream = torch.cuda.Stream(self.device) if self.prefetch else None
+
+        # sequences of seq_len steps for recurrent datasets, single samples otherwise
+        self.unit_len = dataset.seq_len if dataset.is_rnn else 1
+        self.num_units = dataset.batch_size // self.unit_len
+        self.units_per_minibatch = dataset.minibatch_size // self.unit_len
+        self.unit_offsets = torch.arange(self.unit_len, dtype=torch.long, device=self.device)
+        self.order = torch.arange(self.num_units, dtype=torch.long, device=self.device)
+
+        self.buffers = [{}, {}]
+        self.pending = None  # (idx, units, positions) of the minibatch gathered on the side stream
+
+    def _indexes(self, idx):
+        units = self.order[idx * self.units_per_minibatch:(idx + 1) * self.units_per_minibatch]
+        positions = (units.unsqueeze(1) * self.unit_len + self.unit_offsets).view(-1)
+        if self.dataset.storage_indexes is not None:
+            positions = self.dataset.storage_indexes[positions]
+        return units, positions
+
+    def _buffer(self, buffers, key, shape, dtype):
+        buf = buffers.get(key)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = buffers[key] = torch.empty(shape, dtype=dtype, device=self.device)
+        return buf
+
+    def _allocate(self, slot):
+        '''Buffers of the current values, allocated on the current stream'''
+        buffers = self.buffers[slot]
+        size = self.dataset.minibatch_size
+        for k in list(buffers):
+            if k != 'rnn_states' and k not in self.dataset.values_dict:
+                del buffers[k]
+        for k, v in self.dataset.values_dict.items():
+            if k in self.dataset.special_names:
+                continue
+            if v is None:
+                # recurrent minibatches keep the missing values (e.g. rnn_masks) as None, like _get_item_rnn
+                if self.dataset.is_rnn:
+                    buffers[k] = None
+                else:
+                    buffers.pop(k, None)
+                continue
+            if isinstance(v, dict):
+                if not isinstance(buffers.get(k), dict):
+                    buffers[k] = {}
+                sub_buffers = buffers[k]
+                for kd, vd in v.items():
+                    self._buffer(sub_buffers, kd, (size,) + vd.shape[1:], vd.dtype)
+            else:
+                self._buffer(buffers, k, (size,) + v.shape[1:], v.dtype)
+        if self.dataset.is_rnn:
+            states = buffers.setdefault('rnn_states', [])
+            rnn_states = self.dataset.values_dict['rnn_states']
+            del states[len(rnn_states):]
+            for i, s in enumerate(rnn_states):
+                shape = (s.shape[0], self.units_per_minibatch, s.shape[2])
+                if i == len(states):
+                    states.append(None)
+                if states[i] is None or states[i].shape != shape or states[i].dtype != s.dtype:
+                    states[i] = torch.empty(shape, dtype=s.dtype, device=self.device)
+        return buffers
+
+    def _gather(self, buffers, units, positions):
+        for k, v in self.dataset.values_dict.items():
+            if k in self.dataset.special_names or v is None:
+                continue
+            if isinstance(v, dict):
+                for kd, vd in v.items():
+                    torch.index_select(vd, 0, positions, out=buffers[k][kd])
+            else:
+                torch.index_select(v, 0, positions, out=buffers[k])
+        if self.dataset.is_rnn:
+            for s, buf in zip(self.dataset.values_dict['rnn_states'], buffers['rnn_states']):
+                torch.index_select(s, 1, units, out=buf)
+
+    def get(self, idx):
+        if self.pending is not None:
+            torch.cuda.current_stream(self.device).wait_stream(self.stream)
+        if idx == 0:
+            self.pending = None
+            if self.shuffle:
+                self.order = torch.randperm(self.num_units, device=self.device)
+        slot = idx % 2
+
+        if self.pending is not None and self.pending[0] == idx:
+            _, units, positions = self.pending
+        else:
+            units, positions = self._indexes(idx)
+            self._gather(self._allocate(slot), units, positions)
+        self.pending = None
+
+        if self.prefetch and idx + 1 < len(self.dataset):
+            next_units, next_positions = self._indexes(idx + 1)
+            next_buffers = self._allocate(1 - slot)
+            # after the work already queued, including the training on the buffers being overwritten
+            self.stream.wait_stream(torch.cuda.current_stream(self.device))
+            with torch.cuda.stream(self.stream):
+                self._gather(next_buffers, next_units, next_positions)
+            self.pending = (idx + 1, next_units, next_positions)
+
+        self.dataset.last_range = (idx * self.dataset.minibatch_size, (idx + 1) * self.dataset.minibatch_size)
+        self.dataset.last_selection = positions
+        return self.buffers[slot]